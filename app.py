@@ -3,14 +3,39 @@ ACNSMS - Automated Campus Notification and Schedule Management System
 Main Flask application file
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+import time
+
+# Measured at the end of this module
+_startup_began = time.perf_counter()
+
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, session, g
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, or_, false, event, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import is_resource_modified
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import json
+import base64
+import codecs
+import heapq
+import csv
+import gzip
+import hashlib
+import hmac
+import queue
+import threading
+from collections import namedtuple
+from itertools import islice
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Load environment variables
 load_dotenv()
@@ -30,10 +55,70 @@ login_manager.login_view = 'login'
 # Import notification services
 from services.notification_service import NotificationService
 from services.calendar_service import CalendarService
+from cache import create_cache
+from broadcast import Broadcaster
+from instrumentation import create_sql_instrumentation
+import metrics
+from scheduling import (
+    Booking, ConflictIndex, OccupancyGrid, find_conflicts, normalize_classroom, suggest_slots,
+    expand_weekly, format_weekdays, parse_weekdays
+)
+
+class LazyService:
+    """
+    Thread-safe proxy that constructs a service on first use
+    
+    Keeps slow or network-bound setup (SMTP/Twilio configuration, Google
+    credential refresh and API client construction) out of application
+    startup. Attribute access is forwarded to the service instance.
+    """
+    
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.init_seconds = None  # time the factory took, once constructed
+    
+    @property
+    def initialized(self):
+        """Whether the service has been constructed"""
+        return self._instance is not None
+    
+    def get(self):
+        """Return the service, constructing it once if needed"""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    self._instance = self._factory()
+                    self.init_seconds = time.perf_counter() - started
+                instance = self._instance
+        return instance
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+# Initialize services lazily on first use
+notification_service = LazyService(NotificationService)
+calendar_service = LazyService(lambda: CalendarService(interactive=False))
+
+# Dashboard and schedule feed cache (in-process unless CACHE_URL points to Redis)
+schedule_cache = create_cache()
 
-# Initialize services
-notification_service = NotificationService()
-calendar_service = CalendarService()
+# Seconds an in-process cache entry is served before its version is checked against the database
+# again; writes handled by this process invalidate entries immediately, so this only bounds how
+# long another worker process's changes can go unnoticed (0: check on every hit)
+CACHE_REVALIDATE_SECONDS = int(os.getenv('CACHE_REVALIDATE_SECONDS', 5))
+
+# Live schedule changes pushed to open dashboards (/api/schedules/stream)
+schedule_broadcaster = Broadcaster()
+SSE_KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', 20))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 5000))
+
+# Per-request query counts, DB time and N+1 detection (/api/debug/queries)
+sql_instrumentation = create_sql_instrumentation()
+sql_instrumentation.init_app(app)
 
 # User loader for Flask-Login
 @login_manager.user_loader
@@ -52,6 +137,10 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        db.Index('ix_user_role', 'role'),
+    )
+
     def set_password(self, password):
         """Hash and set password"""
         self.password_hash = generate_password_hash(password)
@@ -74,6 +163,10 @@ class Module(db.Model):
     lecturer = db.relationship('User', backref='modules_taught')
     schedules = db.relationship('Schedule', backref='module', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_module_lecturer', 'lecturer_id'),
+    )
+
 class Schedule(db.Model):
     """Schedule/Timetable model"""
     id = db.Column(db.Integer, primary_key=True)
@@ -90,19 +183,121 @@ class Schedule(db.Model):
     # Relationships
     notifications = db.relationship('Notification', backref='schedule', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_schedule_module_date', 'module_id', 'date', 'start_time'),
+        db.Index('ix_schedule_date_start', 'date', 'start_time', 'id'),
+        db.Index('ix_schedule_classroom_date', 'classroom', 'date'),
+    )
+
+class ScheduleSeries(db.Model):
+    """
+    Weekly recurring class stored as one row
+    
+    Occurrences are expanded on demand for the requested window. A single
+    occurrence that is moved becomes a regular Schedule row plus an
+    exception on the series.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    module_id = db.Column(db.Integer, db.ForeignKey('module.id'), nullable=False)
+    classroom = db.Column(db.String(50), nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    weekdays = db.Column(db.String(20), nullable=False)  # RRULE BYDAY codes, e.g. "MO,WE"
+    interval_weeks = db.Column(db.Integer, nullable=False, default=1)  # repeat every n weeks
+    start_date = db.Column(db.Date, nullable=False)  # first occurrence
+    end_date = db.Column(db.Date, nullable=False)  # last possible occurrence (inclusive)
+    status = db.Column(db.String(20), default='scheduled')  # scheduled, rescheduled, cancelled
+    google_event_id = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    module = db.relationship('Module', backref='series')
+    exceptions = db.relationship('ScheduleSeriesException', backref='series', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_schedule_series_module_dates', 'module_id', 'start_date', 'end_date'),
+        db.Index('ix_schedule_series_dates', 'start_date', 'end_date'),
+    )
+
+    def occurrences(self, window_start=None, window_end=None, skip=()):
+        """Occurrence dates within [window_start, window_end)"""
+        return expand_weekly(self.start_date, self.end_date, parse_weekdays(self.weekdays), self.interval_weeks,
+                             window_start, window_end, skip)
+
+class ScheduleSeriesException(db.Model):
+    """An occurrence of a series that was removed, or moved to a standalone schedule"""
+    id = db.Column(db.Integer, primary_key=True)
+    series_id = db.Column(db.Integer, db.ForeignKey('schedule_series.id'), nullable=False)
+    occurrence_date = db.Column(db.Date, nullable=False)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=True)  # replacement, if moved
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('series_id', 'occurrence_date', name='uq_schedule_series_exception'),
+    )
+
+class NotificationMessage(db.Model):
+    """Message content shared by every delivery of one broadcast"""
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200))
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Notification(db.Model):
     """Notification tracking model"""
     id = db.Column(db.Integer, primary_key=True)
-    schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=False)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=True)
+    series_id = db.Column(db.Integer, db.ForeignKey('schedule_series.id'), nullable=True)  # set instead of schedule_id for series changes
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     notification_type = db.Column(db.String(20), nullable=False)  # email, sms
-    status = db.Column(db.String(20), default='pending')  # pending, sent, failed
-    message = db.Column(db.Text)
+    status = db.Column(db.String(20), default='pending')  # pending, processing, sent, failed
+    message_id = db.Column(db.Integer, db.ForeignKey('notification_message.id'), nullable=True)
+    message = db.Column(db.Text)  # legacy per-row copy; new rows reference message_id
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime)  # earliest retry after a failed delivery; NULL: deliver now
+    claimed_at = db.Column(db.DateTime)  # set while a worker is delivering the notification
     sent_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
     user = db.relationship('User', backref='notifications')
+    broadcast = db.relationship('NotificationMessage')
+
+    __table_args__ = (
+        db.Index('ix_notification_schedule', 'schedule_id'),
+        db.Index('ix_notification_user_created', 'user_id', 'created_at'),
+        db.Index('ix_notification_status_created', 'status', 'created_at'),
+    )
+
+class CalendarSyncJob(db.Model):
+    """Pending Google Calendar sync for a schedule or a series (one row per schedule or series)"""
+    id = db.Column(db.Integer, primary_key=True)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=True, unique=True)
+    series_id = db.Column(db.Integer, db.ForeignKey('schedule_series.id'), nullable=True)
+    action = db.Column(db.String(20), nullable=False, default='upsert')  # upsert, delete
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, failed
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every coalesced enqueue
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    schedule = db.relationship('Schedule')
+
+    __table_args__ = (
+        db.UniqueConstraint('series_id', name='uq_calendar_sync_job_series'),
+        db.Index('ix_calendar_sync_job_status_next', 'status', 'next_attempt_at'),
+    )
+
+class CalendarSyncState(db.Model):
+    """Incremental sync position (Calendar API nextSyncToken) per calendar"""
+    calendar_id = db.Column(db.String(255), primary_key=True)
+    sync_token = db.Column(db.Text)
+    last_synced_at = db.Column(db.DateTime)
 
 class StudentModule(db.Model):
     """Many-to-many relationship between students and modules"""
@@ -115,6 +310,228 @@ class StudentModule(db.Model):
     student = db.relationship('User', backref='enrolled_modules')
     module = db.relationship('Module', backref='enrolled_students')
 
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'module_id', name='uq_student_module'),
+        db.Index('ix_student_module_module', 'module_id', 'student_id'),
+    )
+
+def scope_schedules_to_user(query, user, model=None):
+    """
+    Restrict a schedule (or series, with model=ScheduleSeries) query to the
+    sessions visible to a user
+    
+    Students see schedules of modules they are enrolled in, lecturers the
+    schedules of modules they teach and admins everything. The query must
+    already be joined to Module.
+    """
+    model = model or Schedule
+    if user.role == 'admin':
+        return query
+    if user.role == 'lecturer':
+        return query.filter(Module.lecturer_id == user.id)
+    if user.role == 'student':
+        return query.join(StudentModule, StudentModule.module_id == model.module_id).filter(
+            StudentModule.student_id == user.id
+        )
+    return query.filter(false())
+
+def schedule_cache_scope(user):
+    """Cache key component shared by users who see the same schedules"""
+    if user.role == 'admin':
+        return 'admin'
+    return f"{user.role}:{user.id}"
+
+def schedule_cache_tags(user):
+    """
+    Invalidation tags for cached schedule data of a user
+    
+    Entries are tagged with every module the user follows, so a change to a
+    module's schedules drops exactly the entries that may contain it. Admin
+    entries see every module and carry the wildcard tag instead.
+    """
+    tags = [f"user:{user.id}"]
+    if user.role == 'admin':
+        return tags + ['module:*']
+    if user.role == 'lecturer':
+        module_ids = db.session.query(Module.id).filter(Module.lecturer_id == user.id)
+    else:
+        module_ids = db.session.query(StudentModule.module_id).filter(StudentModule.student_id == user.id)
+    return tags + [f"module:{module_id}" for (module_id,) in module_ids]
+
+def cache_entry_due_for_check(entry):
+    """Whether a cached dashboard or feed entry must be checked against the database before use"""
+    if schedule_cache.shared:
+        # Every process invalidates the shared cache itself
+        return False
+    return time.monotonic() - entry.get('checked_at', 0) >= CACHE_REVALIDATE_SECONDS
+
+def invalidate_module_schedules(module_id):
+    """Drop cached dashboards and feeds that may include a module's schedules"""
+    schedule_cache.invalidate_tags([f"module:{module_id}", 'module:*'])
+
+def publish_schedule_change(schedule, change):
+    """
+    Push a committed schedule change to the open dashboards following its module
+    
+    Args:
+        schedule (Schedule): The changed schedule
+        change (str): 'created' or 'rescheduled'; a cancelled schedule is always sent as 'cancelled'
+    """
+    row = schedule_feed_query().filter(Schedule.id == schedule.id).one()
+    schedule_broadcaster.publish(
+        [f"module:{row.module_id}", 'module:*'],
+        {'type': 'cancelled' if row.status == 'cancelled' else change, 'schedule': schedule_row_to_event(row)}
+    )
+
+# A series occurrence with the attributes of a schedule_feed_query row
+SeriesOccurrence = namedtuple('SeriesOccurrence', (
+    'id series_id module_id classroom date start_time end_time status module_code module_name lecturer'
+))
+
+def series_feed_query():
+    """Series rows joined with their module and lecturer in a single query"""
+    return db.session.query(
+        ScheduleSeries.id,
+        ScheduleSeries.module_id,
+        ScheduleSeries.classroom,
+        ScheduleSeries.start_time,
+        ScheduleSeries.end_time,
+        ScheduleSeries.weekdays,
+        ScheduleSeries.interval_weeks,
+        ScheduleSeries.start_date,
+        ScheduleSeries.end_date,
+        ScheduleSeries.status,
+        Module.module_code,
+        Module.module_name,
+        Module.lecturer_id,
+        User.username.label('lecturer')
+    ).join(Module, ScheduleSeries.module_id == Module.id).join(User, Module.lecturer_id == User.id)
+
+def filter_series_feed(query, start_date=None, end_date=None, module_id=None, classroom=None, status=None):
+    """Restrict a series query to series with occurrences possible in [start_date, end_date) and to the feed filters"""
+    query = query.filter(ScheduleSeries.status != 'cancelled')
+    if start_date:
+        query = query.filter(ScheduleSeries.end_date >= start_date)
+    if end_date:
+        query = query.filter(ScheduleSeries.start_date < end_date)
+    if module_id:
+        query = query.filter(ScheduleSeries.module_id == module_id)
+    if classroom:
+        query = query.filter(ScheduleSeries.classroom == classroom)
+    if status:
+        query = query.filter(ScheduleSeries.status == status)
+    return query
+
+def series_exception_dates(series_ids, window_start=None, window_end=None):
+    """Dates removed from each series (cancelled or moved occurrences), by series id"""
+    if not series_ids:
+        return {}
+    query = db.session.query(ScheduleSeriesException.series_id, ScheduleSeriesException.occurrence_date).filter(
+        ScheduleSeriesException.series_id.in_(series_ids)
+    )
+    if window_start:
+        query = query.filter(ScheduleSeriesException.occurrence_date >= window_start)
+    if window_end:
+        query = query.filter(ScheduleSeriesException.occurrence_date < window_end)
+    
+    skip = {}
+    for series_id, occurrence_date in query:
+        skip.setdefault(series_id, set()).add(occurrence_date)
+    return skip
+
+def expand_series_rows(rows, window_start=None, window_end=None):
+    """
+    Occurrences of series_feed_query rows within [window_start, window_end)
+    
+    Returns:
+        list: SeriesOccurrence tuples ordered by date, start time and series
+    """
+    rows = list(rows)
+    skip = series_exception_dates([row.id for row in rows], window_start, window_end)
+    
+    occurrences = []
+    for row in rows:
+        for day in expand_weekly(row.start_date, row.end_date, parse_weekdays(row.weekdays), row.interval_weeks,
+                                 window_start, window_end, skip.get(row.id, ())):
+            occurrences.append(SeriesOccurrence(
+                f"series-{row.id}-{day.strftime('%Y%m%d')}", row.id, row.module_id, row.classroom, day,
+                row.start_time, row.end_time, row.status, row.module_code, row.module_name, row.lecturer
+            ))
+    
+    occurrences.sort(key=occurrence_sort_key)
+    return occurrences
+
+def occurrence_sort_key(occurrence):
+    """Feed sort key of an occurrence; the negated series id orders it before schedules at the same time"""
+    return (occurrence.date, occurrence.start_time, -occurrence.series_id)
+
+def occurrence_to_event(occurrence):
+    """Serialize a series occurrence as a FullCalendar event"""
+    event = schedule_row_to_event(occurrence)
+    event['series_id'] = occurrence.series_id
+    event['occurrence_date'] = occurrence.date.isoformat()
+    return event
+
+def occurrence_to_dict(occurrence):
+    """Plain, cacheable form of a series occurrence (see schedule_row_to_dict)"""
+    schedule = schedule_row_to_dict(occurrence)
+    schedule['series_id'] = occurrence.series_id
+    schedule['occurrence_date'] = occurrence.date
+    return schedule
+
+def schedule_row_to_dict(row):
+    """Plain, cacheable form of a schedule_feed_query row with the attributes the dashboards use"""
+    return {
+        'id': row.id,
+        'module_id': row.module_id,
+        'classroom': row.classroom,
+        'date': row.date,
+        'start_time': row.start_time,
+        'end_time': row.end_time,
+        'status': row.status,
+        'lecturer': row.lecturer,
+        'series_id': None,
+        'module': {'id': row.module_id, 'module_code': row.module_code, 'module_name': row.module_name}
+    }
+
+# Series occurrences listed on the dashboards, counted from today
+DASHBOARD_OCCURRENCE_DAYS = 28
+
+def get_user_schedules(user):
+    """
+    Schedules visible to a user as plain dicts, served from the cache when possible
+    
+    Includes the occurrences of recurring series over the next
+    DASHBOARD_OCCURRENCE_DAYS days, in date and time order.
+    """
+    today = datetime.now().date()
+    key = f"dashboard-v2:{schedule_cache_scope(user)}:{today}"
+    entry = schedule_cache.get(key)
+    version = None
+    if entry is not None and cache_entry_due_for_check(entry):
+        # Another worker process may have changed the schedules without reaching this process's cache
+        version = schedule_feed_version(user, None, None, None, None, None)
+        if version != entry['version']:
+            entry = None
+        else:
+            entry['checked_at'] = time.monotonic()
+    
+    if entry is None:
+        version = version or schedule_feed_version(user, None, None, None, None, None)
+        rows = scope_schedules_to_user(schedule_feed_query(), user).order_by(
+            Schedule.date, Schedule.start_time, Schedule.id
+        ).all()
+        window_end = today + timedelta(days=DASHBOARD_OCCURRENCE_DAYS)
+        series_rows = filter_series_feed(
+            scope_schedules_to_user(series_feed_query(), user, ScheduleSeries), today, window_end
+        )
+        schedules = [schedule_row_to_dict(row) for row in rows]
+        schedules += [occurrence_to_dict(occurrence) for occurrence in expand_series_rows(series_rows, today, window_end)]
+        schedules.sort(key=lambda schedule: (schedule['date'], schedule['start_time']))
+        entry = {'version': version, 'schedules': schedules, 'checked_at': time.monotonic()}
+        schedule_cache.set(key, entry, tags=schedule_cache_tags(user))
+    return entry['schedules']
+
 # Routes
 @app.route('/')
 def index():
@@ -190,27 +607,21 @@ def dashboard():
             StudentModule.student_id == current_user.id
         ).all()
         
-        schedules = []
-        for module in enrolled_modules:
-            module_schedules = Schedule.query.filter_by(module_id=module.id).all()
-            schedules.extend(module_schedules)
+        schedules = get_user_schedules(current_user)
         
         return render_template('dashboard_student.html', schedules=schedules, modules=enrolled_modules)
     
     elif current_user.role == 'lecturer':
         # Get lecturer's modules and schedules
         modules = Module.query.filter_by(lecturer_id=current_user.id).all()
-        schedules = []
-        for module in modules:
-            module_schedules = Schedule.query.filter_by(module_id=module.id).all()
-            schedules.extend(module_schedules)
+        schedules = get_user_schedules(current_user)
         
         return render_template('dashboard_lecturer.html', schedules=schedules, modules=modules)
     
     elif current_user.role == 'admin':
         # Get all modules and schedules for admin
         modules = Module.query.all()
-        schedules = Schedule.query.all()
+        schedules = get_user_schedules(current_user)
         users = User.query.all()
         
         return render_template('dashboard_admin.html', schedules=schedules, modules=modules, users=users)
@@ -230,6 +641,22 @@ def create_schedule():
         start_time = datetime.strptime(request.form['start_time'], '%H:%M').time()
         end_time = datetime.strptime(request.form['end_time'], '%H:%M').time()
         
+        if end_time <= start_time:
+            flash('End time must be after start time', 'error')
+            return redirect(url_for('create_schedule'))
+        
+        module = Module.query.get_or_404(module_id)
+        
+        if request.form.get('repeat_until'):
+            return create_schedule_series(module, classroom, date, start_time, end_time)
+        
+        conflicts = load_conflict_index([date]).conflicts(
+            Booking(None, date, start_time, end_time, classroom, module.lecturer_id)
+        )
+        if conflicts['classroom'] or conflicts['lecturer']:
+            flash(describe_conflicts(conflicts), 'error')
+            return redirect(url_for('create_schedule'))
+        
         # Create schedule
         schedule = Schedule(
             module_id=module_id,
@@ -240,25 +667,15 @@ def create_schedule():
         )
         
         db.session.add(schedule)
+        db.session.flush()
+        
+        # Queue the Google Calendar sync in the same transaction
+        enqueue_calendar_sync([schedule.id])
         db.session.commit()
+        invalidate_module_schedules(schedule.module_id)
+        publish_schedule_change(schedule, 'created')
         
-        # Add to Google Calendar
-        try:
-            module = Module.query.get(module_id)
-            event_id = calendar_service.create_event(
-                title=f"{module.module_code} - {module.module_name}",
-                location=classroom,
-                start_datetime=datetime.combine(date, start_time),
-                end_datetime=datetime.combine(date, end_time),
-                description=f"Lecturer: {module.lecturer.username}"
-            )
-            
-            schedule.google_event_id = event_id
-            db.session.commit()
-            
-            flash('Schedule created successfully and added to calendar!', 'success')
-        except Exception as e:
-            flash(f'Schedule created but calendar sync failed: {str(e)}', 'warning')
+        flash('Schedule created successfully! It will appear in the calendar shortly.', 'success')
         
         return redirect(url_for('dashboard'))
     
@@ -270,6 +687,108 @@ def create_schedule():
     
     return render_template('create_schedule.html', modules=modules)
 
+# Longest recurring series that can be created in one go
+SERIES_MAX_DAYS = int(os.getenv('SERIES_MAX_DAYS', 366))
+
+def create_schedule_series(module, classroom, first_date, start_time, end_time):
+    """
+    Create a weekly series from the create schedule form
+    
+    The series repeats on the weekdays ticked on the form (default: the
+    weekday of the first date) every repeat_interval weeks until
+    repeat_until. Every occurrence is checked for conflicts.
+    """
+    try:
+        end_date = datetime.strptime(request.form['repeat_until'], '%Y-%m-%d').date()
+        interval_weeks = int(request.form.get('repeat_interval') or 1)
+        weekdays = parse_weekdays(','.join(request.form.getlist('weekdays'))) or [first_date.weekday()]
+    except ValueError:
+        flash('Invalid repeat settings', 'error')
+        return redirect(url_for('create_schedule'))
+    
+    if end_date < first_date or (end_date - first_date).days > SERIES_MAX_DAYS or interval_weeks < 1:
+        flash(f'A repeating class must end after its first date and within {SERIES_MAX_DAYS} days', 'error')
+        return redirect(url_for('create_schedule'))
+    
+    dates = expand_weekly(first_date, end_date, weekdays, interval_weeks)
+    if not dates:
+        flash('The repeat settings produce no classes', 'error')
+        return redirect(url_for('create_schedule'))
+    
+    conflicts = find_conflicts(
+        (Booking(('new', day), day, start_time, end_time, classroom, module.lecturer_id) for day in dates),
+        load_bookings(dates=dates)
+    )
+    if conflicts:
+        clashes = sorted(label[1] for label in conflicts if isinstance(label, tuple) and label[0] == 'new')
+        flash(f"Schedule conflict on {', '.join(day.isoformat() for day in clashes[:5])}"
+              + (f" and {len(clashes) - 5} more dates" if len(clashes) > 5 else "")
+              + ': the classroom or lecturer is already booked at that time.', 'error')
+        return redirect(url_for('create_schedule'))
+    
+    series = ScheduleSeries(
+        module_id=module.id,
+        classroom=classroom,
+        start_time=start_time,
+        end_time=end_time,
+        weekdays=format_weekdays(weekdays),
+        interval_weeks=interval_weeks,
+        start_date=dates[0],
+        end_date=end_date
+    )
+    db.session.add(series)
+    db.session.flush()
+    
+    # One recurring Google Calendar event for the whole series
+    enqueue_calendar_sync([series.id], key='series_id')
+    db.session.commit()
+    publish_series_change(series)
+    
+    flash(f'Weekly schedule created with {len(dates)} classes! It will appear in the calendar shortly.', 'success')
+    return redirect(url_for('dashboard'))
+
+def publish_series_change(series):
+    """Drop cached schedules of a series' module and ask its open dashboards to reload"""
+    invalidate_module_schedules(series.module_id)
+    schedule_broadcaster.publish([f"module:{series.module_id}", 'module:*'], {'type': 'resync', 'schedule': {}})
+
+@app.route('/schedule/import', methods=['GET', 'POST'])
+@login_required
+def import_schedules():
+    """Bulk import a timetable from a CSV or JSON file"""
+    if current_user.role != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or JSON file', 'error')
+            return redirect(url_for('import_schedules'))
+        
+        fmt = 'json' if upload.filename.lower().endswith('.json') else 'csv'
+        try:
+            rows = read_timetable_rows(codecs.getreader('utf-8-sig')(upload.stream), fmt)
+            report = import_timetable(
+                rows,
+                skip_invalid='skip_invalid' in request.form,
+                allow_conflicts='allow_conflicts' in request.form,
+                dry_run='dry_run' in request.form
+            )
+        except (ValueError, csv.Error) as e:
+            flash(f'Could not read {upload.filename}: {str(e)}', 'error')
+            return redirect(url_for('import_schedules'))
+        
+        if report['imported']:
+            flash(f"Imported {report['imported']} schedules. They will appear in the calendar shortly.", 'success')
+        elif report['errors']:
+            flash(f"Nothing was imported: {len(report['errors'])} rows were rejected", 'error')
+        else:
+            flash(f"{report['valid']} rows are valid", 'info')
+    
+    return render_template('import_schedule.html', report=report)
+
 @app.route('/schedule/reschedule/<int:schedule_id>', methods=['GET', 'POST'])
 @login_required
 def reschedule(schedule_id):
@@ -290,6 +809,17 @@ def reschedule(schedule_id):
         new_start_time = datetime.strptime(request.form['start_time'], '%H:%M').time()
         new_end_time = datetime.strptime(request.form['end_time'], '%H:%M').time()
         
+        if new_end_time <= new_start_time:
+            flash('End time must be after start time', 'error')
+            return render_template('reschedule.html', schedule=schedule)
+        
+        conflicts = load_conflict_index([new_date]).conflicts(
+            Booking(schedule.id, new_date, new_start_time, new_end_time, new_classroom, schedule.module.lecturer_id)
+        )
+        if conflicts['classroom'] or conflicts['lecturer']:
+            flash(describe_conflicts(conflicts), 'error')
+            return render_template('reschedule.html', schedule=schedule)
+        
         # Store old values for notification
         old_date = schedule.date
         old_classroom = schedule.classroom
@@ -303,34 +833,539 @@ def reschedule(schedule_id):
         schedule.status = 'rescheduled'
         schedule.updated_at = datetime.utcnow()
         
+        # Queue notifications to students and admin in the same transaction
+        # as the schedule change; notification_worker.py delivers them
+        queue_reschedule_notifications(schedule, old_date, old_classroom, old_start_time)
+        enqueue_calendar_sync([schedule.id])
+        
         db.session.commit()
+        invalidate_module_schedules(schedule.module_id)
+        publish_schedule_change(schedule, 'rescheduled')
         
-        # Update Google Calendar event
-        try:
-            if schedule.google_event_id:
-                calendar_service.update_event(
-                    event_id=schedule.google_event_id,
-                    title=f"{schedule.module.module_code} - {schedule.module.module_name}",
-                    location=new_classroom,
-                    start_datetime=datetime.combine(new_date, new_start_time),
-                    end_datetime=datetime.combine(new_date, new_end_time)
-                )
-        except Exception as e:
-            flash(f'Calendar update failed: {str(e)}', 'warning')
-        
-        # Send notifications to students and admin
-        try:
-            send_reschedule_notifications(schedule, old_date, old_classroom, old_start_time)
-            flash('Schedule rescheduled successfully and notifications sent!', 'success')
-        except Exception as e:
-            flash(f'Schedule rescheduled but notifications failed: {str(e)}', 'warning')
+        flash('Schedule rescheduled successfully! Notifications are being sent.', 'success')
         
         return redirect(url_for('dashboard'))
     
     return render_template('reschedule.html', schedule=schedule)
 
-def send_reschedule_notifications(schedule, old_date, old_classroom, old_start_time):
-    """Send email and SMS notifications for rescheduled lectures"""
+@app.route('/series/<int:series_id>/reschedule', methods=['GET', 'POST'])
+@login_required
+def reschedule_series(series_id):
+    """
+    Reschedule one occurrence of a weekly series, or the occurrence and all
+    following ones
+    
+    Moving a single occurrence turns it into a regular schedule and records
+    an exception on the series. Moving the following occurrences splits the
+    series in two (or updates it in place from its first occurrence), so the
+    change touches one row however many weeks are left.
+    """
+    series = ScheduleSeries.query.get_or_404(series_id)
+    
+    # Check permissions
+    if current_user.role == 'lecturer' and series.module.lecturer_id != current_user.id:
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    elif current_user.role not in ['lecturer', 'admin']:
+        flash('Access denied', 'error')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        occurrence_date = parse_date_param(request.args.get('date'))
+    except ValueError:
+        occurrence_date = None
+    skip = series_exception_dates([series.id]).get(series.id, set())
+    if not occurrence_date or not series.occurrences(occurrence_date, occurrence_date + timedelta(days=1), skip):
+        flash('That class is not part of the series', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        new_classroom = request.form['classroom']
+        new_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+        new_start_time = datetime.strptime(request.form['start_time'], '%H:%M').time()
+        new_end_time = datetime.strptime(request.form['end_time'], '%H:%M').time()
+        
+        if new_end_time <= new_start_time:
+            flash('End time must be after start time', 'error')
+            return render_template('reschedule_series.html', series=series, occurrence_date=occurrence_date)
+        
+        if request.form.get('scope') == 'following':
+            error = reschedule_following_occurrences(series, occurrence_date, skip, new_classroom, new_date,
+                                                     new_start_time, new_end_time)
+        else:
+            error = reschedule_single_occurrence(series, occurrence_date, new_classroom, new_date,
+                                                 new_start_time, new_end_time)
+        if error:
+            flash(error, 'error')
+            return render_template('reschedule_series.html', series=series, occurrence_date=occurrence_date)
+        
+        flash('Schedule rescheduled successfully! Notifications are being sent.', 'success')
+        return redirect(url_for('dashboard'))
+    
+    return render_template('reschedule_series.html', series=series, occurrence_date=occurrence_date)
+
+def reschedule_single_occurrence(series, occurrence_date, classroom, new_date, start_time, end_time):
+    """
+    Move one occurrence of a series to a standalone schedule
+    
+    Returns:
+        str: Error message, or None on success
+    """
+    own = ('series', series.id, occurrence_date)
+    conflicts = load_conflict_index([new_date]).conflicts(
+        Booking(None, new_date, start_time, end_time, classroom, series.module.lecturer_id)
+    )
+    conflicts = {kind: [label for label in labels if label != own] for kind, labels in conflicts.items()}
+    if conflicts['classroom'] or conflicts['lecturer']:
+        return describe_conflicts(conflicts)
+    
+    schedule = Schedule(
+        module=series.module,
+        classroom=classroom,
+        date=new_date,
+        start_time=start_time,
+        end_time=end_time,
+        status='rescheduled'
+    )
+    db.session.add(schedule)
+    db.session.flush()
+    db.session.add(ScheduleSeriesException(series_id=series.id, occurrence_date=occurrence_date, schedule_id=schedule.id))
+    series.updated_at = datetime.utcnow()
+    
+    queue_reschedule_notifications(schedule, occurrence_date, series.classroom, series.start_time)
+    enqueue_calendar_sync([schedule.id])
+    # The series event gets an EXDATE for the moved occurrence
+    enqueue_calendar_sync([series.id], key='series_id')
+    
+    db.session.commit()
+    publish_series_change(series)
+    return None
+
+def reschedule_following_occurrences(series, from_date, skip, classroom, new_date, start_time, end_time):
+    """
+    Move an occurrence and all following occurrences of a series
+    
+    Every moved occurrence shifts by the same number of days as from_date,
+    so the weekdays of the series shift with it. Occurrences that were
+    already moved to standalone schedules stay where they are.
+    
+    Returns:
+        str: Error message, or None on success
+    """
+    shift = new_date - from_date
+    old_weekdays = parse_weekdays(series.weekdays)
+    weekdays = [(day + shift.days) % 7 for day in old_weekdays]
+    
+    # Occurrences that cross into another week would change which weeks an
+    # every-n-weeks series falls on
+    if series.interval_weeks > 1 and len({(day + shift.days) // 7 for day in old_weekdays}) > 1:
+        return 'These classes cannot all move by that many days; reschedule them one at a time'
+    
+    moved_skip = {day + shift for day in skip if day >= from_date}
+    end_date = series.end_date + shift
+    dates = expand_weekly(new_date, end_date, weekdays, series.interval_weeks, skip=moved_skip)
+    
+    # The earlier occurrences stay, so they can still clash with the moved ones
+    kept = series.occurrences(window_end=from_date, skip=skip)
+    existing = load_bookings(dates=dates, exclude_series_id=series.id) + [
+        Booking(('series', series.id, day), day, series.start_time, series.end_time, series.classroom,
+                series.module.lecturer_id, series.module_id) for day in kept
+    ]
+    conflicts = find_conflicts(
+        (Booking(('new', day), day, start_time, end_time, classroom, series.module.lecturer_id) for day in dates),
+        existing
+    )
+    if conflicts:
+        clashes = sorted(label[1] for label in conflicts if isinstance(label, tuple) and label[0] == 'new')
+        return (f"Schedule conflict on {', '.join(day.isoformat() for day in clashes[:5])}"
+                + (f" and {len(clashes) - 5} more dates" if len(clashes) > 5 else "")
+                + ': the classroom or lecturer is already booked at that time.')
+    
+    old_weekdays = series.weekdays
+    old_classroom = series.classroom
+    old_start_time = series.start_time
+    
+    exceptions = ScheduleSeriesException.query.filter(
+        ScheduleSeriesException.series_id == series.id,
+        ScheduleSeriesException.occurrence_date >= from_date
+    ).all()
+    
+    if kept:
+        # Split: the old series ends the day before, a new one takes over
+        target = ScheduleSeries(module=series.module, interval_weeks=series.interval_weeks)
+        db.session.add(target)
+        series.end_date = from_date - timedelta(days=1)
+        series.updated_at = datetime.utcnow()
+    else:
+        # Nothing is left before from_date, so the series moves in place. Exceptions of
+        # earlier (cancelled or moved) occurrences must not skip the moved dates.
+        ScheduleSeriesException.query.filter(
+            ScheduleSeriesException.series_id == series.id,
+            ScheduleSeriesException.occurrence_date < from_date
+        ).delete(synchronize_session=False)
+        target = series
+    
+    target.classroom = classroom
+    target.start_time = start_time
+    target.end_time = end_time
+    target.weekdays = format_weekdays(weekdays)
+    target.start_date = new_date
+    target.end_date = end_date
+    target.status = 'rescheduled'
+    target.updated_at = datetime.utcnow()
+    db.session.flush()
+    
+    for exception in exceptions:
+        exception.series_id = target.id
+        exception.occurrence_date += shift
+    
+    queue_series_notifications(target, new_date, old_weekdays, old_classroom, old_start_time)
+    enqueue_calendar_sync({series.id, target.id}, key='series_id')
+    
+    db.session.commit()
+    publish_series_change(series)
+    return None
+
+def schedule_bookings_query():
+    """Classroom and lecturer bookings of all single classes that are not cancelled"""
+    return db.session.query(
+        Schedule.id,
+        Schedule.date,
+        Schedule.start_time,
+        Schedule.end_time,
+        Schedule.classroom,
+        Module.lecturer_id,
+        Schedule.module_id
+    ).join(Module, Schedule.module_id == Module.id).filter(Schedule.status != 'cancelled')
+
+def load_bookings(start_date=None, end_date=None, dates=None, exclude_schedule_id=None, exclude_series_id=None):
+    """
+    Bookings of every class that is not cancelled, including series occurrences
+    
+    Args:
+        start_date, end_date: Date range [start_date, end_date)
+        dates (iterable): Only these dates (replaces the range)
+        exclude_schedule_id, exclude_series_id: Leave out the class being moved
+    
+    Returns:
+        list: scheduling.Booking tuples; series occurrences are labelled
+        ('series', series id, date)
+    """
+    wanted = None
+    if dates is not None:
+        wanted = set(dates)
+        if not wanted:
+            return []
+        start_date, end_date = min(wanted), max(wanted) + timedelta(days=1)
+    
+    query = schedule_bookings_query()
+    if wanted is not None:
+        query = query.filter(Schedule.date.in_(sorted(wanted)))
+    else:
+        if start_date:
+            query = query.filter(Schedule.date >= start_date)
+        if end_date:
+            query = query.filter(Schedule.date < end_date)
+    if exclude_schedule_id:
+        query = query.filter(Schedule.id != exclude_schedule_id)
+    bookings = [Booking(*row) for row in query]
+    
+    series_query = filter_series_feed(series_feed_query(), start_date, end_date)
+    if exclude_series_id:
+        series_query = series_query.filter(ScheduleSeries.id != exclude_series_id)
+    series_rows = series_query.all()
+    skip = series_exception_dates([row.id for row in series_rows], start_date, end_date)
+    
+    for row in series_rows:
+        for day in expand_weekly(row.start_date, row.end_date, parse_weekdays(row.weekdays), row.interval_weeks,
+                                 start_date, end_date, skip.get(row.id, ())):
+            if wanted is None or day in wanted:
+                bookings.append(Booking(('series', row.id, day), day, row.start_time, row.end_time,
+                                        row.classroom, row.lecturer_id, row.module_id))
+    
+    return bookings
+
+def load_conflict_index(dates, exclude_schedule_id=None, exclude_series_id=None):
+    """Conflict index over the existing bookings on the given dates"""
+    return ConflictIndex(load_bookings(
+        dates=dates, exclude_schedule_id=exclude_schedule_id, exclude_series_id=exclude_series_id
+    ))
+
+def format_booking_label(label):
+    """Readable name of a booking in conflict messages"""
+    if isinstance(label, tuple) and label[0] == 'series':
+        return f"series #{label[1]} on {label[2].isoformat()}"
+    if isinstance(label, tuple):
+        return f"row {label[1]}"
+    return f"#{label}"
+
+def describe_conflicts(conflicts):
+    """Flash message for the result of ConflictIndex.conflicts()"""
+    reasons = []
+    if conflicts['classroom']:
+        reasons.append('the classroom is already booked (' + ', '.join(map(format_booking_label, conflicts['classroom'])) + ')')
+    if conflicts['lecturer']:
+        reasons.append('the lecturer is already teaching (' + ', '.join(map(format_booking_label, conflicts['lecturer'])) + ')')
+    return 'Schedule conflict: ' + ' and '.join(reasons) + ' at that time.'
+
+def detect_schedule_conflicts(start_date=None, end_date=None):
+    """
+    Find every classroom or lecturer double booking in a date range
+    
+    Returns:
+        dict: booking label -> sorted list of conflicting booking labels
+        (schedule ids, or ('series', series id, date) for series occurrences)
+    """
+    return find_conflicts(load_bookings(start_date, end_date))
+
+# Bulk timetable import
+IMPORT_CHUNK_SIZE = 1000
+
+def read_timetable_rows(stream, fmt='csv'):
+    """
+    Rows of a timetable file as dicts
+    
+    Args:
+        stream: Text file object
+        fmt (str): 'csv' (with a header row) or 'json' (a list of objects, or
+            an object with a "schedules" list)
+    """
+    if fmt == 'json':
+        data = json.load(stream)
+        return data.get('schedules', []) if isinstance(data, dict) else data
+    return csv.DictReader(stream)
+
+def parse_time_value(value, field):
+    """Parse HH:MM or HH:MM:SS, raising ValueError with the field name"""
+    value = str(value or '').strip()
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            pass
+    raise ValueError(f"{field} must be HH:MM")
+
+def parse_timetable_row(row, modules_by_code, modules_by_id):
+    """
+    Validate one imported row
+    
+    Returns:
+        dict: module_id, lecturer_id, classroom, date, start_time and end_time
+    
+    Raises:
+        ValueError: with a message suitable for the import report
+    """
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+    
+    module_code = str(row.get('module_code') or '').strip()
+    if module_code:
+        module = modules_by_code.get(module_code)
+        if module is None:
+            raise ValueError(f"unknown module code '{module_code}'")
+    elif row.get('module_id'):
+        try:
+            module = modules_by_id.get(int(row['module_id']))
+        except (TypeError, ValueError):
+            module = None
+        if module is None:
+            raise ValueError(f"unknown module id '{row['module_id']}'")
+    else:
+        raise ValueError('module_code is required')
+    
+    classroom = str(row.get('classroom') or '').strip()
+    if not classroom:
+        raise ValueError('classroom is required')
+    if len(classroom) > 50:
+        raise ValueError('classroom is longer than 50 characters')
+    
+    try:
+        date = datetime.strptime(str(row.get('date') or '').strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('date must be YYYY-MM-DD')
+    
+    start_time = parse_time_value(row.get('start_time'), 'start_time')
+    end_time = parse_time_value(row.get('end_time'), 'end_time')
+    if end_time <= start_time:
+        raise ValueError('end_time must be after start_time')
+    
+    return {
+        'module_id': module[0],
+        'lecturer_id': module[1],
+        'classroom': classroom,
+        'date': date,
+        'start_time': start_time,
+        'end_time': end_time
+    }
+
+def import_timetable(rows, chunk_size=IMPORT_CHUNK_SIZE, skip_invalid=False, allow_conflicts=False, dry_run=False):
+    """
+    Validate and insert a timetable in bulk
+    
+    Each row needs module_code (or module_id), classroom, date (YYYY-MM-DD),
+    start_time and end_time (HH:MM). Rows are checked against each other and
+    against the existing timetable for classroom and lecturer clashes, then
+    inserted with executemany in chunks and queued for calendar sync in the
+    same transaction.
+    
+    Args:
+        rows (iterable): Row dicts, e.g. from read_timetable_rows()
+        chunk_size (int): Rows per INSERT statement
+        skip_invalid (bool): Import the valid rows even if some rows are rejected
+        allow_conflicts (bool): Import clashing rows instead of rejecting them
+        dry_run (bool): Validate only
+    
+    Returns:
+        dict: total, valid and imported row counts, and errors as a list of
+        {'row': number, 'error': message}
+    """
+    modules = db.session.query(Module.id, Module.module_code, Module.lecturer_id).all()
+    modules_by_code = {code: (module_id, lecturer_id) for module_id, code, lecturer_id in modules}
+    modules_by_id = {module_id: (module_id, lecturer_id) for module_id, _, lecturer_id in modules}
+    
+    errors = []
+    valid = []
+    total = 0
+    for number, row in enumerate(rows, start=1):
+        total = number
+        try:
+            valid.append((number, parse_timetable_row(row, modules_by_code, modules_by_id)))
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+    
+    if valid and not allow_conflicts:
+        dates = [values['date'] for _, values in valid]
+        conflicts = find_conflicts(
+            (Booking(('row', number), values['date'], values['start_time'], values['end_time'],
+                     values['classroom'], values['lecturer_id']) for number, values in valid),
+            load_bookings(min(dates), max(dates) + timedelta(days=1))
+        )
+        
+        for number, _ in valid:
+            if ('row', number) in conflicts:
+                others = ', '.join(format_booking_label(label) for label in conflicts[('row', number)])
+                errors.append({'row': number, 'error': f"conflicts with {others}"})
+        valid = [(number, values) for number, values in valid if ('row', number) not in conflicts]
+    
+    errors.sort(key=lambda error: error['row'])
+    report = {'total': total, 'valid': len(valid), 'imported': 0, 'errors': errors}
+    if dry_run or not valid or (errors and not skip_invalid):
+        return report
+    
+    imported_at = datetime.utcnow()
+    new_rows = [{
+        'module_id': values['module_id'],
+        'classroom': values['classroom'],
+        'date': values['date'],
+        'start_time': values['start_time'],
+        'end_time': values['end_time'],
+        'status': 'scheduled',
+        'created_at': imported_at,
+        'updated_at': imported_at
+    } for _, values in valid]
+    
+    # Keep the ids of exactly these rows for the calendar sync below: multi-row
+    # INSERT ... RETURNING where the database supports it, else ORM flushes
+    schedule_ids = []
+    table = Schedule.__table__
+    returning = getattr(db.engine.dialect, 'insert_executemany_returning', False)
+    for start in range(0, len(new_rows), chunk_size):
+        chunk = new_rows[start:start + chunk_size]
+        if returning:
+            schedule_ids.extend(db.session.execute(table.insert().returning(table.c.id), chunk).scalars())
+        else:
+            schedules = [Schedule(**row) for row in chunk]
+            db.session.add_all(schedules)
+            db.session.flush()
+            schedule_ids.extend(schedule.id for schedule in schedules)
+    
+    module_ids = {values['module_id'] for _, values in valid}
+    for start in range(0, len(schedule_ids), chunk_size):
+        enqueue_calendar_sync(schedule_ids[start:start + chunk_size])
+    
+    db.session.commit()
+    
+    # One cache invalidation and one live update for the whole import
+    topics = [f"module:{module_id}" for module_id in module_ids] + ['module:*']
+    schedule_cache.invalidate_tags(topics)
+    schedule_broadcaster.publish(topics, {'type': 'resync', 'schedule': {}})
+    
+    report['imported'] = len(valid)
+    return report
+
+# Teaching day used for slot suggestions
+SCHEDULE_DAY_START = datetime.strptime(os.getenv('SCHEDULE_DAY_START', '08:00'), '%H:%M').time()
+SCHEDULE_DAY_END = datetime.strptime(os.getenv('SCHEDULE_DAY_END', '20:00'), '%H:%M').time()
+
+def suggest_reschedule_slots(schedule, start_date, days=7, limit=5, weekdays_only=True):
+    """
+    Free slots for moving a class, avoiding room, lecturer and student clashes
+    
+    A student clash is any other class of a module that shares at least one
+    enrolled student with this schedule's module.
+    
+    Args:
+        schedule (Schedule): The class to move
+        start_date (date): First candidate date
+        days (int): Number of days to search
+        limit (int): Number of suggestions
+        weekdays_only (bool): Skip Saturdays and Sundays
+    
+    Returns:
+        list: dicts with date, start_time, end_time and classroom, best first
+    """
+    dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    if weekdays_only:
+        dates = [day for day in dates if day.weekday() < 5]
+    if not dates:
+        return []
+    
+    grid = OccupancyGrid(SCHEDULE_DAY_START, SCHEDULE_DAY_END)
+    lecturer_id = schedule.module.lecturer_id
+    
+    # Candidate rooms are every classroom used in the timetable
+    rooms = {}
+    classrooms = db.session.query(Schedule.classroom).union(db.session.query(ScheduleSeries.classroom))
+    for (classroom,) in classrooms:
+        rooms.setdefault(normalize_classroom(classroom), classroom)
+    
+    enrolled = db.session.query(StudentModule.student_id).filter(StudentModule.module_id == schedule.module_id)
+    shared_modules = {module_id for (module_id,) in db.session.query(StudentModule.module_id).filter(
+        StudentModule.student_id.in_(enrolled)
+    ).distinct()}
+    shared_modules.add(schedule.module_id)
+    
+    for booking in load_bookings(dates=dates, exclude_schedule_id=schedule.id):
+        grid.mark(booking.date, ('room', normalize_classroom(booking.classroom)), booking.start_time, booking.end_time)
+        if booking.lecturer_id == lecturer_id:
+            grid.mark(booking.date, 'lecturer', booking.start_time, booking.end_time)
+        if booking.module_id in shared_modules:
+            grid.mark(booking.date, 'students', booking.start_time, booking.end_time)
+    
+    duration = datetime.combine(schedule.date, schedule.end_time) - datetime.combine(schedule.date, schedule.start_time)
+    slots = suggest_slots(
+        grid, dates, rooms, ['lecturer', 'students'],
+        duration_minutes=int(duration.total_seconds() // 60),
+        preferred_date=max(schedule.date, start_date),
+        preferred_start=schedule.start_time,
+        preferred_room=normalize_classroom(schedule.classroom),
+        limit=limit
+    )
+    
+    return [{
+        'date': slot_date.isoformat(),
+        'start_time': start_time.strftime('%H:%M'),
+        'end_time': (datetime.combine(slot_date, start_time) + duration).strftime('%H:%M'),
+        'classroom': rooms[room]
+    } for slot_date, start_time, room in slots]
+
+def queue_reschedule_notifications(schedule, old_date, old_classroom, old_start_time):
+    """
+    Queue email and SMS notifications for a rescheduled lecture
+    
+    Rows are added to the current session as pending and are committed by the
+    caller together with the schedule change (transactional outbox).
+    """
     module = schedule.module
     
     # Prepare notification message
@@ -356,102 +1391,711 @@ def send_reschedule_notifications(schedule, old_date, old_classroom, old_start_t
     # SMS message (shorter version)
     sms_message = f"ACNSMS: {module.module_code} rescheduled to {schedule.date.strftime('%Y-%m-%d')} {schedule.start_time.strftime('%H:%M')} in {schedule.classroom}. Lecturer: {module.lecturer.username}"
     
-    # Get all students enrolled in this module
-    students = db.session.query(User).join(StudentModule).filter(
-        StudentModule.module_id == module.id
-    ).all()
+    queue_module_broadcast(module, f"Lecture Rescheduled: {module.module_code}", message, sms_message,
+                           schedule_id=schedule.id)
+
+def queue_series_notifications(series, first_date, old_weekdays, old_classroom, old_start_time):
+    """
+    Queue email and SMS notifications for a recurring class that moved from
+    first_date onwards (see queue_reschedule_notifications)
+    """
+    module = series.module
     
-    # Get admin users
-    admins = User.query.filter_by(role='admin').all()
-    
-    # Combine all recipients
-    recipients = students + admins
-    
-    # Send notifications
-    for user in recipients:
-        # Send email
-        if user.email:
-            try:
-                notification_service.send_email(
-                    to_email=user.email,
-                    subject=f"Lecture Rescheduled: {module.module_code}",
-                    message=message
-                )
+    message = f"""
+    WEEKLY LECTURE RESCHEDULED
+    
+    Module: {module.module_code} - {module.module_name}
+    Lecturer: {module.lecturer.username}
+    
+    OLD SCHEDULE:
+    Every {old_weekdays} at {old_start_time.strftime('%H:%M')}
+    Room: {old_classroom}
+    
+    NEW SCHEDULE (from {first_date.strftime('%Y-%m-%d')} to {series.end_date.strftime('%Y-%m-%d')}):
+    Every {series.weekdays} at {series.start_time.strftime('%H:%M')}
+    Room: {series.classroom}
+    
+    Please update your schedule accordingly.
+    """
+    
+    sms_message = f"ACNSMS: {module.module_code} weekly class moved to {series.weekdays} {series.start_time.strftime('%H:%M')} in {series.classroom} from {first_date.strftime('%Y-%m-%d')}. Lecturer: {module.lecturer.username}"
+    
+    queue_module_broadcast(module, f"Weekly Lecture Rescheduled: {module.module_code}", message, sms_message,
+                           series_id=series.id)
+
+def queue_module_broadcast(module, subject, email_body, sms_body, schedule_id=None, series_id=None):
+    """
+    Queue one email and one SMS per enrolled student and admin of a module
+    
+    Rows are added to the current session as pending and are committed by the
+    caller together with the change they announce (transactional outbox).
+    """
+    # Store each message body once for the whole broadcast
+    email_content = NotificationMessage(subject=subject, body=email_body)
+    sms_content = NotificationMessage(body=sms_body)
+    db.session.add_all([email_content, sms_content])
+    db.session.flush()
+    
+    # Queue one pending notification per recipient and channel, one
+    # executemany round-trip per chunk of enrolled students and admins
+    now = datetime.utcnow()
+    for contacts in iter_module_recipients(module.id):
+        rows = []
+        for contact in contacts:
+            if contact.email:
+                rows.append({
+                    'schedule_id': schedule_id,
+                    'series_id': series_id,
+                    'user_id': contact.id,
+                    'notification_type': 'email',
+                    'status': 'pending',
+                    'message_id': email_content.id,
+                    'created_at': now
+                })
+            
+            if contact.phone:
+                rows.append({
+                    'schedule_id': schedule_id,
+                    'series_id': series_id,
+                    'user_id': contact.id,
+                    'notification_type': 'sms',
+                    'status': 'pending',
+                    'message_id': sms_content.id,
+                    'created_at': now
+                })
+        
+        if rows:
+            db.session.execute(Notification.__table__.insert(), rows)
+
+def enqueue_calendar_sync(ids, action='upsert', key='schedule_id'):
+    """
+    Queue schedules (or series, with key='series_id') for Google Calendar
+    sync (delivered by calendar_sync_worker.py)
+    
+    There is at most one job per schedule or series: enqueueing one that
+    already has a job resets it to pending and bumps its version, so several
+    edits collapse into a single API call. Rows are added to the current
+    transaction and committed by the caller.
+    """
+    now = datetime.utcnow()
+    rows = [{
+        key: target_id,
+        'action': action,
+        'status': 'pending',
+        'version': 1,
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'updated_at': now
+    } for target_id in ids]
+    
+    if not rows:
+        return
+    
+    table = CalendarSyncJob.__table__
+    dialect = db.engine.dialect.name
+    
+    if dialect in ('mysql', 'mariadb'):
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            action=stmt.inserted.action,
+            status='pending',
+            version=table.c.version + 1,
+            attempts=0,
+            next_attempt_at=stmt.inserted.next_attempt_at,
+            claimed_at=None,
+            last_error=None,
+            updated_at=stmt.inserted.updated_at
+        )
+        db.session.execute(stmt, rows)
+    elif dialect == 'sqlite':
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={
+                'action': stmt.excluded.action,
+                'status': 'pending',
+                'version': table.c.version + 1,
+                'attempts': 0,
+                'next_attempt_at': stmt.excluded.next_attempt_at,
+                'claimed_at': None,
+                'last_error': None,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+        db.session.execute(stmt, rows)
+    else:
+        for row in rows:
+            job = CalendarSyncJob.query.filter_by(**{key: row[key]}).with_for_update().first()
+            if job:
+                job.action = action
+                job.status = 'pending'
+                job.version += 1
+                job.attempts = 0
+                job.next_attempt_at = now
+                job.claimed_at = None
+                job.last_error = None
+            else:
+                db.session.add(CalendarSyncJob(**row))
+
+# Admin contacts change rarely; the TTL bounds staleness across worker processes
+ADMIN_CONTACTS_TTL = 300
+_admin_contacts = {'contacts': None, 'loaded_at': 0, 'generation': 0}
+_admin_contacts_lock = threading.Lock()
+
+def get_admin_contacts():
+    """Contact details (id, email, phone) of active admins, cached in-process"""
+    with _admin_contacts_lock:
+        cached = _admin_contacts['contacts']
+        if cached is not None and time.monotonic() - _admin_contacts['loaded_at'] < ADMIN_CONTACTS_TTL:
+            return cached
+        generation = _admin_contacts['generation']
+    
+    contacts = tuple(db.session.query(User.id, User.email, User.phone).filter(
+        User.role == 'admin',
+        User.is_active == True
+    ).all())
+    
+    with _admin_contacts_lock:
+        # Don't store a result that was invalidated while it was loading
+        if _admin_contacts['generation'] == generation:
+            _admin_contacts['contacts'] = contacts
+            _admin_contacts['loaded_at'] = time.monotonic()
+    return contacts
+
+def invalidate_admin_contacts(*args):
+    """Drop the cached admin contacts; registered for every User insert, update and delete"""
+    with _admin_contacts_lock:
+        _admin_contacts['contacts'] = None
+        _admin_contacts['generation'] += 1
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(User, _event_name, invalidate_admin_contacts)
+
+def iter_module_recipients(module_id, chunk_size=1000):
+    """
+    Yield chunks of (id, email, phone) contacts to notify about a change to a module
+    
+    Only the contact columns are selected. Enrolled active students are
+    fetched in keyset-paginated chunks along (module_id, student_id), so very
+    large modules never load in one result set, followed by the cached admin
+    list (admins enrolled in the module are not repeated).
+    """
+    admins = get_admin_contacts()
+    admin_ids = {admin.id for admin in admins}
+    
+    query = db.session.query(User.id, User.email, User.phone).join(
+        StudentModule, StudentModule.student_id == User.id
+    ).filter(
+        StudentModule.module_id == module_id,
+        User.is_active == True
+    ).order_by(StudentModule.student_id)
+    
+    last_id = 0
+    while True:
+        chunk = query.filter(StudentModule.student_id > last_id).limit(chunk_size).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        yield [contact for contact in chunk if contact.id not in admin_ids]
+    
+    if admins:
+        yield list(admins)
+
+# Upper bound for a single page of /api/schedules
+SCHEDULES_API_MAX_LIMIT = 1000
+
+def parse_date_param(value):
+    """Parse a YYYY-MM-DD (or full ISO-8601, as sent by FullCalendar) query parameter"""
+    if not value:
+        return None
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+def encode_schedule_cursor(key):
+    """Encode a (date, start_time, id) feed sort key as an opaque cursor"""
+    day, start_time, sort_id = key
+    raw = f"{day.isoformat()}|{start_time.strftime('%H:%M:%S')}|{sort_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_schedule_cursor(cursor):
+    """Decode a cursor produced by encode_schedule_cursor, raising ValueError if malformed"""
+    raw = base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()).decode()
+    date_part, time_part, id_part = raw.split('|')
+    return (
+        datetime.strptime(date_part, '%Y-%m-%d').date(),
+        datetime.strptime(time_part, '%H:%M:%S').time(),
+        int(id_part)
+    )
+
+def schedule_feed_query():
+    """Schedule rows joined with their module and lecturer in a single query"""
+    return db.session.query(
+        Schedule.id,
+        Schedule.module_id,
+        Schedule.classroom,
+        Schedule.date,
+        Schedule.start_time,
+        Schedule.end_time,
+        Schedule.status,
+        Module.module_code,
+        Module.module_name,
+        User.username.label('lecturer')
+    ).join(Module, Schedule.module_id == Module.id).join(User, Module.lecturer_id == User.id)
+
+def schedule_row_to_event(row):
+    """Serialize a schedule_feed_query row as a FullCalendar event"""
+    return {
+        'id': row.id,
+        'title': f"{row.module_code} - {row.module_name}",
+        'start': f"{row.date}T{row.start_time}",
+        'end': f"{row.date}T{row.end_time}",
+        'classroom': row.classroom,
+        'lecturer': row.lecturer,
+        'status': row.status
+    }
+
+@app.route('/api/schedules')
+@login_required
+def api_schedules():
+    """API endpoint to get the current user's schedules as JSON
+
+    Query parameters:
+        start, end: FullCalendar visible window (end is exclusive)
+        module_id, classroom, status: optional filters
+        limit: page size; when set, the next page is advertised via X-Next-Cursor
+        cursor: opaque cursor returned by a previous page
+    """
+    try:
+        start_date = parse_date_param(request.args.get('start'))
+        end_date = parse_date_param(request.args.get('end'))
+        module_id = request.args.get('module_id', type=int)
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        after = decode_schedule_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    
+    classroom = request.args.get('classroom') or None
+    status = request.args.get('status') or None
+    if limit:
+        limit = max(1, min(limit, SCHEDULES_API_MAX_LIMIT))
+    
+    key = 'feed:' + schedule_cache_scope(current_user) + ':' + json.dumps(
+        [str(start_date), str(end_date), module_id, classroom, status, limit, cursor]
+    )
+    page = schedule_cache.get(key)
+    version = None
+    if page is not None and cache_entry_due_for_check(page):
+        # Another worker process may have changed the schedules without reaching this process's
+        # cache; serving the cached page (or its ETag) would then answer with stale data
+        version = schedule_feed_version(current_user, start_date, end_date, module_id, classroom, status)
+        if version != (page['last_modified'], page['count']):
+            page = None
+        else:
+            page['checked_at'] = time.monotonic()
+    
+    if page is None:
+        # Compare the client's validators with a cheap version query before
+        # loading and serializing the page
+        last_modified, count = version or schedule_feed_version(
+            current_user, start_date, end_date, module_id, classroom, status
+        )
+        etag = hashlib.sha1(f"{key}|{last_modified}|{count}".encode()).hexdigest()
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return schedule_feed_not_modified(etag, last_modified)
+        
+        page = load_schedule_feed_page(current_user, start_date, end_date, module_id, classroom, status, limit, after)
+        page['etag'] = etag
+        page['last_modified'] = last_modified
+        page['count'] = count
+        page['checked_at'] = time.monotonic()
+        schedule_cache.set(key, page, tags=schedule_cache_tags(current_user))
+    elif not is_resource_modified(request.environ, etag=page['etag'], last_modified=page['last_modified']):
+        return schedule_feed_not_modified(page['etag'], page['last_modified'])
+    
+    response = jsonify(page['events'])
+    response.set_etag(page['etag'], weak=True)
+    response.last_modified = page['last_modified']
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    
+    if page['next_cursor']:
+        next_args = request.args.to_dict()
+        next_args['cursor'] = page['next_cursor']
+        response.headers['X-Next-Cursor'] = page['next_cursor']
+        response.headers['Link'] = f'<{url_for("api_schedules", **next_args)}>; rel="next"'
+    
+    return response
+
+def schedule_feed_not_modified(etag, last_modified):
+    """Empty 304 response carrying the feed validators"""
+    response = app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def filter_schedule_feed(query, start_date, end_date, module_id, classroom, status):
+    """Apply the /api/schedules window and filters to a schedule query"""
+    if start_date:
+        query = query.filter(Schedule.date >= start_date)
+    if end_date:
+        query = query.filter(Schedule.date < end_date)
+    if module_id:
+        query = query.filter(Schedule.module_id == module_id)
+    if classroom:
+        query = query.filter(Schedule.classroom == classroom)
+    if status:
+        query = query.filter(Schedule.status == status)
+    return query
+
+def schedule_feed_version(user, start_date, end_date, module_id, classroom, status):
+    """
+    Cheap change marker for a feed window
+    
+    Every create or reschedule bumps updated_at of the schedule or series,
+    and the counts cover rows leaving the window.
+    
+    Returns:
+        tuple: (latest updated_at or None, number of schedules and series)
+    """
+    query = db.session.query(func.max(Schedule.updated_at), func.count(Schedule.id)).join(
+        Module, Schedule.module_id == Module.id
+    )
+    query = scope_schedules_to_user(query, user)
+    last_modified, count = filter_schedule_feed(query, start_date, end_date, module_id, classroom, status).one()
+    
+    series_query = db.session.query(func.max(ScheduleSeries.updated_at), func.count(ScheduleSeries.id)).join(
+        Module, ScheduleSeries.module_id == Module.id
+    )
+    series_query = scope_schedules_to_user(series_query, user, ScheduleSeries)
+    series_modified, series_count = filter_series_feed(
+        series_query, start_date, end_date, module_id, classroom, status
+    ).one()
+    
+    if series_modified and (last_modified is None or series_modified > last_modified):
+        last_modified = series_modified
+    return last_modified, count + series_count
+
+def load_schedule_feed_page(user, start_date, end_date, module_id, classroom, status, limit, after):
+    """
+    Query one page of the schedule feed
+    
+    Returns:
+        dict: 'events' (FullCalendar events) and 'next_cursor' (None on the last page)
+    """
+    query = scope_schedules_to_user(schedule_feed_query(), user)
+    query = filter_schedule_feed(query, start_date, end_date, module_id, classroom, status)
+    
+    # Keyset pagination: continue strictly after the last row of the previous page
+    if after:
+        after_date, after_time, after_id = after
+        query = query.filter(or_(
+            Schedule.date > after_date,
+            and_(Schedule.date == after_date, or_(
+                Schedule.start_time > after_time,
+                and_(Schedule.start_time == after_time, Schedule.id > after_id)
+            ))
+        ))
+    
+    query = query.order_by(Schedule.date, Schedule.start_time, Schedule.id)
+    rows = query.limit(limit + 1).all() if limit else query.all()
+    
+    # Occurrences of recurring series are expanded for the window only and
+    # merged in sort order; their negated series id keeps cursors unambiguous
+    window_start = max(filter(None, [start_date, after[0] if after else None]), default=None)
+    series_rows = filter_series_feed(
+        scope_schedules_to_user(series_feed_query(), user, ScheduleSeries),
+        window_start, end_date, module_id, classroom, status
+    )
+    occurrences = [
+        occurrence for occurrence in expand_series_rows(series_rows, window_start, end_date)
+        if not after or occurrence_sort_key(occurrence) > after
+    ]
+    
+    items = heapq.merge(
+        (((row.date, row.start_time, row.id), schedule_row_to_event(row)) for row in rows),
+        ((occurrence_sort_key(occurrence), occurrence_to_event(occurrence)) for occurrence in occurrences),
+        key=lambda item: item[0]
+    )
+    
+    if limit:
+        items = list(islice(items, limit + 1))
+        has_more = len(items) > limit
+        items = items[:limit]
+    else:
+        items = list(items)
+        has_more = False
+    
+    return {
+        'events': [event for _, event in items],
+        'next_cursor': encode_schedule_cursor(items[-1][0]) if has_more else None
+    }
+
+@app.route('/api/schedules/stream')
+@login_required
+def api_schedules_stream():
+    """
+    Server-Sent Events stream of schedule changes for the current user's modules
+    
+    Sends 'created', 'rescheduled' and 'cancelled' events whose data is the
+    event as returned by /api/schedules. A 'resync' event tells the client
+    that changes were missed (or imported in bulk, or made to a recurring
+    series) and the schedules must be reloaded.
+    """
+    topics = [tag for tag in schedule_cache_tags(current_user) if tag.startswith('module:')]
+    last_event_header = request.headers.get('Last-Event-ID')
+    last_event_id = schedule_broadcaster.parse_event_id(last_event_header)
+    subscription = schedule_broadcaster.subscribe(topics, last_event_id)
+    # Ids issued by another process or a previous run can't be resumed
+    resync = bool(last_event_header) and last_event_id is None
+    
+    def resync_event():
+        # The id moves the client's Last-Event-ID past the missed events; without it
+        # the reconnect would resume from the same stale id and resync again forever
+        event_id = schedule_broadcaster.format_event_id(schedule_broadcaster.current_event_id())
+        return f"id: {event_id}\nevent: resync\ndata: {{}}\n\n"
+    
+    def generate():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            if resync:
+                yield resync_event()
+            
+            while True:
+                try:
+                    item = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
                 
-                # Log notification
-                notification = Notification(
-                    schedule_id=schedule.id,
-                    user_id=user.id,
-                    notification_type='email',
-                    status='sent',
-                    message=message,
-                    sent_at=datetime.utcnow()
-                )
-                db.session.add(notification)
-            except Exception as e:
-                print(f"Failed to send email to {user.email}: {str(e)}")
-        
-        # Send SMS
-        if user.phone:
-            try:
-                notification_service.send_sms(
-                    to_phone=user.phone,
-                    message=sms_message
-                )
+                if item is None:
+                    # The client reloads and reconnects from the id sent with the resync
+                    yield resync_event()
+                    return
                 
-                # Log notification
-                notification = Notification(
-                    schedule_id=schedule.id,
-                    user_id=user.id,
-                    notification_type='sms',
-                    status='sent',
-                    message=sms_message,
-                    sent_at=datetime.utcnow()
+                event_id, event = item
+                yield (
+                    f"id: {schedule_broadcaster.format_event_id(event_id)}\n"
+                    f"event: {event['type']}\n"
+                    f"data: {json.dumps(event['schedule'])}\n\n"
                 )
-                db.session.add(notification)
-            except Exception as e:
-                print(f"Failed to send SMS to {user.phone}: {str(e)}")
+        finally:
+            schedule_broadcaster.unsubscribe(subscription)
     
-    db.session.commit()
+    # The generator runs after the request context is gone, so it must not use the session
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
-@app.route('/api/schedules')
+@app.route('/api/schedules/<int:schedule_id>/suggestions')
 @login_required
-def api_schedules():
-    """API endpoint to get schedules as JSON"""
-    schedules = Schedule.query.all()
-    schedule_list = []
-    
-    for schedule in schedules:
-        schedule_data = {
-            'id': schedule.id,
-            'title': f"{schedule.module.module_code} - {schedule.module.module_name}",
-            'start': f"{schedule.date}T{schedule.start_time}",
-            'end': f"{schedule.date}T{schedule.end_time}",
-            'classroom': schedule.classroom,
-            'lecturer': schedule.module.lecturer.username,
-            'status': schedule.status
-        }
-        schedule_list.append(schedule_data)
-    
-    return jsonify(schedule_list)
+def api_schedule_suggestions(schedule_id):
+    """Free slots for rescheduling a class
+
+    Query parameters:
+        from: first date to search (default: today or the class date, whichever is later)
+        days: number of days to search (default 7, at most 31)
+        limit: number of suggestions (default 5, at most 50)
+    """
+    schedule = Schedule.query.get_or_404(schedule_id)
+    
+    if current_user.role == 'lecturer' and schedule.module.lecturer_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    elif current_user.role not in ['lecturer', 'admin']:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        start_date = parse_date_param(request.args.get('from')) or max(datetime.now().date(), schedule.date)
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    days = max(1, min(request.args.get('days', 7, type=int), 31))
+    limit = max(1, min(request.args.get('limit', 5, type=int), 50))
+    
+    return jsonify(suggest_reschedule_slots(schedule, start_date, days=days, limit=limit))
+
+@app.route('/api/schedules/conflicts')
+@login_required
+def api_schedule_conflicts():
+    """Classroom and lecturer double bookings between start and end (admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        start_date = parse_date_param(request.args.get('start'))
+        end_date = parse_date_param(request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+    
+    def label_key(label):
+        # Series occurrences use the event ids of /api/schedules
+        if isinstance(label, tuple):
+            return f"series-{label[1]}-{label[2].strftime('%Y%m%d')}"
+        return label
+    
+    conflicts = detect_schedule_conflicts(start_date, end_date)
+    return jsonify({
+        str(label_key(label)): [label_key(other) for other in others] for label, others in conflicts.items()
+    })
+
+@app.route('/api/cache/stats')
+@login_required
+def api_cache_stats():
+    """Hit/miss statistics of the schedule cache (admin only)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(schedule_cache.stats())
+
+@app.route('/api/debug/queries')
+@login_required
+def api_query_stats():
+    """SQL query counts and database time per endpoint (admin only, ?reset=1 clears them)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    stats = sql_instrumentation.endpoint_stats()
+    if request.args.get('reset'):
+        sql_instrumentation.reset()
+    return jsonify(stats)
+
+# Prometheus metrics (/metrics); see metrics.py for sharing them between processes
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the request's latency, status and SQL statements (runs after compression)"""
+    endpoint = request.endpoint or 'unknown'
+    started = g.get('request_started')
+    if started is not None:
+        metrics.http_request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    metrics.http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    
+    stats = sql_instrumentation.current()
+    if stats is not None:
+        metrics.db_queries.inc(stats.count, endpoint=endpoint)
+        metrics.db_query_seconds.inc(stats.db_time, endpoint=endpoint)
+        if stats.repeated(sql_instrumentation.n_plus_one_threshold):
+            metrics.db_n_plus_one_requests.inc(endpoint=endpoint)
+    return response
+
+# Cache operation totals already added to the counter, per operation
+_cache_operations_seen = {}
+_cache_operations_lock = threading.Lock()
+
+def sample_process_metrics():
+    """Set the connection pool and schedule cache metrics of this process"""
+    with app.app_context():
+        pool = db.engine.pool
+    
+    # QueuePool reports all three; other pool classes may lack some
+    for state, method in (('checked_out', 'checkedout'), ('idle', 'checkedin'), ('overflow', 'overflow')):
+        if hasattr(pool, method):
+            metrics.db_pool_connections.set(max(getattr(pool, method)(), 0), state=state)
+    
+    # The cache keeps its own totals; add what happened since the last sample
+    stats = schedule_cache.stats()
+    with _cache_operations_lock:
+        for operation in ('hits', 'misses', 'sets', 'evictions', 'invalidations'):
+            delta = stats[operation] - _cache_operations_seen.get(operation, 0)
+            if delta > 0:
+                metrics.cache_operations.inc(delta, operation=operation)
+            _cache_operations_seen[operation] = stats[operation]
+    if 'entries' in stats:
+        metrics.cache_entries.set(stats['entries'])
+
+def collect_queue_depths():
+    """Background work waiting in the database, read when /metrics is scraped"""
+    notifications = db.session.query(
+        Notification.notification_type, Notification.status, func.count(Notification.id)
+    ).filter(
+        Notification.status.in_(('pending', 'processing'))
+    ).group_by(Notification.notification_type, Notification.status).all()
+    
+    jobs = db.session.query(
+        CalendarSyncJob.status, func.count(CalendarSyncJob.id)
+    ).group_by(CalendarSyncJob.status).all()
+    
+    return [
+        ('acnsms_notification_queue_depth', 'gauge', 'Notifications waiting for or being delivered',
+         [({'channel': channel, 'status': status}, count) for channel, status, count in notifications]),
+        ('acnsms_calendar_sync_queue_depth', 'gauge', 'Calendar sync jobs waiting, being processed or awaiting retry',
+         [({'status': status}, count) for status, count in jobs])
+    ]
+
+metrics.registry.add_sampler(sample_process_metrics)
+metrics.registry.add_collector(collect_queue_depths)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics of all processes in the Prometheus text format (bearer token required if METRICS_TOKEN is set)"""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Response compression
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript'}
+
+@app.after_request
+def compress_response(response):
+    """Compress large text responses with brotli (if installed) or gzip, as accepted by the client"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    
+    return response
 
 # Initialize database
-@app.before_first_request
+_tables_created = False
+_tables_lock = threading.Lock()
+
+@app.before_request
 def create_tables():
-    """Create database tables"""
-    db.create_all()
-    
-    # Create default admin user if not exists
-    admin = User.query.filter_by(username='admin').first()
-    if not admin:
-        admin = User(
-            username='admin',
-            email='admin@acnsms.com',
-            role='admin'
-        )
-        admin.set_password('admin123')
-        db.session.add(admin)
-        db.session.commit()
+    """Create database tables (once, on the first request of each process)"""
+    global _tables_created
+    if _tables_created:
+        return
+    
+    with _tables_lock:
+        if _tables_created:
+            return
+        
+        db.create_all()
+        
+        # Create default admin user if not exists
+        admin = User.query.filter_by(username='admin').first()
+        if not admin:
+            admin = User(
+                username='admin',
+                email='admin@acnsms.com',
+                role='admin'
+            )
+            admin.set_password('admin123')
+            db.session.add(admin)
+            db.session.commit()
+        
+        _tables_created = True
+
+# Time spent importing and configuring the application (services are not initialized yet)
+STARTUP_SECONDS = time.perf_counter() - _startup_began
 
 if __name__ == '__main__':
+    print(f"ACNSMS application loaded in {STARTUP_SECONDS * 1000:.1f} ms")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
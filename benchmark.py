@@ -0,0 +1,375 @@
+"""
+Benchmark harness for ACNSMS
+Seeds a database at a chosen scale and measures the main routes and the
+background workers under concurrent load
+
+    python benchmark.py --students 2000 --modules 100 --save-baseline
+    python benchmark.py --students 2000 --modules 100 --compare
+
+Email, SMS and Google Calendar are replaced by local fakes, so nothing
+leaves the machine. The database is a temporary SQLite file unless
+BENCHMARK_DATABASE_URL points elsewhere (e.g. a scratch MariaDB database);
+it is dropped and recreated on every run.
+"""
+
+import os
+import tempfile
+
+# app.py reads DATABASE_URL on import; never benchmark against the configured database
+os.environ['DATABASE_URL'] = os.getenv(
+    'BENCHMARK_DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'acnsms_benchmark.db')
+)
+
+from app import app, db, Schedule, notification_service, calendar_service, schedule_cache, sql_instrumentation
+from calendar_sync_worker import CalendarSyncWorker
+from database_setup import generate_dataset
+from notification_worker import NotificationWorker
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from jinja2 import TemplateNotFound
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+
+class FakeNotificationService:
+    """Stand-in for NotificationService that simulates SMTP and Twilio round-trips"""
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.emails = 0
+        self.sms = 0
+        self._lock = threading.Lock()
+    
+    def send_email(self, to_email, subject, message):
+        time.sleep(self.latency)
+        with self._lock:
+            self.emails += 1
+        return True
+    
+    def send_batch_email(self, recipients, subject, message, chunk_size=None):
+        time.sleep(self.latency)
+        with self._lock:
+            self.emails += len(recipients)
+        return {
+            'success': len(recipients),
+            'failed': 0,
+            'errors': [],
+            'results': [{'to': email, 'success': True, 'error': None} for email in recipients]
+        }
+    
+    def send_sms(self, to_phone, message):
+        time.sleep(self.latency)
+        with self._lock:
+            self.sms += 1
+        return True
+    
+    def close(self):
+        pass
+
+class FakeCalendarService:
+    """Stand-in for CalendarService that accepts every batch operation"""
+    
+    calendar_id = 'benchmark'
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.operations = 0
+        self._lock = threading.Lock()
+    
+    def batch_execute(self, operations):
+        time.sleep(self.latency)
+        results = {}
+        with self._lock:
+            for operation in operations:
+                self.operations += 1
+                results[operation['key']] = {
+                    'success': True,
+                    'event_id': operation.get('event_id') or f"benchmark{self.operations}",
+                    'error': None,
+                    'status': None
+                }
+        return results
+    
+    def list_event_changes(self, sync_token=None, page_size=2500):
+        return [], 'benchmark'
+
+def install_fakes(latency):
+    """Pre-seed the lazily constructed services with fakes so the real ones are never built"""
+    fake_notifications = FakeNotificationService(latency)
+    fake_calendar = FakeCalendarService(latency)
+    notification_service._instance = fake_notifications
+    calendar_service._instance = fake_calendar
+    return fake_notifications, fake_calendar
+
+def percentile(values, fraction):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+def summarize(latencies, queries, errors, wall_seconds):
+    """Latency, query and throughput figures of one scenario; queries is the statement total"""
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'queries_per_request': round(queries / len(latencies), 2),
+        'throughput_rps': round(len(latencies) / wall_seconds, 1) if wall_seconds else None
+    }
+
+def login(username, password):
+    """Test client with a logged-in session"""
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as {username}")
+    return client
+
+def run_requests(users, build_request, requests, concurrency, cold=False):
+    """
+    Send requests from concurrent logged-in test clients
+    
+    Statements are counted by the app's SQL instrumentation, whose
+    per-endpoint totals are reset for every scenario.
+    
+    Args:
+        users (list): (username, password) per client thread
+        build_request (callable): (client, request number) -> response
+        requests (int): Total requests
+        concurrency (int): Client threads
+        cold (bool): Clear the schedule cache before every request
+    """
+    concurrency = max(1, min(concurrency, requests))
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    
+    def client_loop(thread_index):
+        nonlocal errors
+        client = login(*users[thread_index % len(users)])
+        for number in range(thread_index, requests, concurrency):
+            if cold:
+                schedule_cache.clear()
+            started = time.perf_counter()
+            response = build_request(client, number)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors += 1
+    
+    sql_instrumentation.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client_loop, range(concurrency)))
+    wall_seconds = time.perf_counter() - started
+    
+    # The logins of the client threads are not part of the scenario
+    queries = sum(stats['queries'] for endpoint, stats in sql_instrumentation.endpoint_stats().items()
+                  if endpoint != 'login')
+    return summarize(latencies, queries, errors, wall_seconds)
+
+def run_worker(name, process_batch):
+    """Run a worker's process_batch until its queue is empty, timing each non-empty batch"""
+    latencies = []
+    queries = 0
+    started = time.perf_counter()
+    while True:
+        batch_started = time.perf_counter()
+        with app.app_context(), sql_instrumentation.track(name) as stats:
+            processed = process_batch()
+        elapsed = time.perf_counter() - batch_started
+        if not processed:
+            break
+        latencies.append(elapsed)
+        queries += stats.count
+    return summarize(latencies, queries, 0, time.perf_counter() - started)
+
+def template_available(name):
+    """Whether a page template can be loaded; scenarios of missing pages would only measure 500s"""
+    try:
+        app.jinja_env.get_template(name)
+    except TemplateNotFound:
+        return False
+    return True
+
+def seed_database(args):
+    """Recreate the benchmark database at the requested scale"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        counts = generate_dataset(
+            students=args.students,
+            lecturers=args.lecturers,
+            modules=args.modules,
+            rooms=args.rooms,
+            weeks=args.weeks,
+            seed=args.seed
+        )
+        print(f"Seeded {', '.join(f'{count} {table}' for table, count in counts.items())} "
+              f"in {time.perf_counter() - started:.1f}s")
+        
+        today = date.today()
+        schedule_ids = [schedule_id for (schedule_id,) in db.session.query(Schedule.id).filter(
+            Schedule.date >= today
+        ).order_by(Schedule.id).limit(args.requests)]
+    return schedule_ids
+
+def run_benchmark(args):
+    """Run every scenario and return the results by scenario name"""
+    schedule_ids = seed_database(args)
+    install_fakes(args.service_latency)
+    
+    students = [(f'student{i}', 'student123') for i in range(1, min(args.students, args.concurrency) + 1)]
+    lecturers = [(f'lecturer{i}', 'lecturer123') for i in range(1, min(args.lecturers, args.concurrency) + 1)]
+    admins = [('admin', 'admin123')]
+    
+    monday = date.today() - timedelta(days=date.today().weekday())
+    week = f"start={monday.isoformat()}&end={(monday + timedelta(days=7)).isoformat()}"
+    
+    # Moved classes land on otherwise empty dates so they never conflict
+    far_date = monday + timedelta(weeks=args.weeks + 52)
+    
+    def reschedule(client, number):
+        return client.post(f'/schedule/reschedule/{schedule_ids[number]}', data={
+            'classroom': 'Benchmark Hall',
+            'date': (far_date + timedelta(days=number)).isoformat(),
+            'start_time': '09:00',
+            'end_time': '10:00'
+        })
+    
+    # (name, users, request, template the page renders or None)
+    scenarios = [
+        ('GET /dashboard (student)', students, lambda client, n: client.get('/dashboard'), 'dashboard_student.html'),
+        ('GET /dashboard (lecturer)', lecturers, lambda client, n: client.get('/dashboard'), 'dashboard_lecturer.html'),
+        ('GET /dashboard (admin)', admins, lambda client, n: client.get('/dashboard'), 'dashboard_admin.html'),
+        ('GET /api/schedules (student)', students, lambda client, n: client.get(f'/api/schedules?{week}'), None),
+        ('GET /api/schedules (admin)', admins, lambda client, n: client.get(f'/api/schedules?{week}'), None),
+    ]
+    
+    results = {}
+    for name, users, build_request, template in scenarios:
+        if template and not template_available(template):
+            print(f"{name:<36} skipped: {template} not found")
+            continue
+        results[name] = run_requests(users, build_request, args.requests, args.concurrency, args.cold)
+        print_result(name, results[name])
+    
+    # Writes queue notifications and calendar jobs for the workers below
+    name = 'POST /schedule/reschedule (admin)'
+    results[name] = run_requests(admins, reschedule, len(schedule_ids), args.write_concurrency)
+    print_result(name, results[name])
+    
+    name = 'notification_worker batch'
+    results[name] = run_worker(name, NotificationWorker(batch_size=100, workers=8).process_batch)
+    print_result(name, results[name])
+    
+    name = 'calendar_sync_worker batch'
+    results[name] = run_worker(name, CalendarSyncWorker(batch_size=50).process_batch)
+    print_result(name, results[name])
+    
+    return results
+
+def print_result(name, result):
+    """Print one line of the results table"""
+    if not result.get('requests'):
+        print(f"{name:<36} no requests")
+        return
+    print(f"{name:<36} {result['requests']:>6} {result['errors']:>6} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+          f"{result['queries_per_request']:>9.1f} {result['throughput_rps'] or 0:>9.1f}")
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change against a saved baseline
+    
+    Returns:
+        list: Scenarios whose p99 latency grew by more than the tolerance, or
+        that issue more queries per request
+    """
+    regressions = []
+    print(f"\n{'Scenario':<36} {'p50':>9} {'p99':>9} {'queries':>9}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get('requests') or not result.get('requests'):
+            continue
+        
+        def change(key):
+            return (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        
+        print(f"{name:<36} {change('p50_ms'):>+8.1f}% {change('p99_ms'):>+8.1f}% "
+              f"{result['queries_per_request'] - before['queries_per_request']:>+9.1f}")
+        if (result['p99_ms'] > before['p99_ms'] * (1 + tolerance)
+                or result['queries_per_request'] > before['queries_per_request'] + 0.5):
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ACNSMS routes and workers')
+    parser.add_argument('--students', type=int, default=1000, help='Students to generate')
+    parser.add_argument('--lecturers', type=int, default=50, help='Lecturers to generate')
+    parser.add_argument('--modules', type=int, default=100, help='Modules to generate')
+    parser.add_argument('--rooms', type=int, default=30, help='Classrooms to generate')
+    parser.add_argument('--weeks', type=int, default=4, help='Weeks of classes to generate')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients for read scenarios')
+    parser.add_argument('--write-concurrency', type=int, default=1, help='Concurrent clients for write scenarios')
+    parser.add_argument('--service-latency', type=float, default=0.0, help='Seconds each fake email/SMS/calendar call takes')
+    parser.add_argument('--cold', action='store_true', help='Clear the schedule cache before every request')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='Baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare the results with the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p99 growth over the baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+    
+    scale = {key: getattr(args, key) for key in ('students', 'lecturers', 'modules', 'rooms', 'weeks', 'seed',
+                                                'requests', 'concurrency', 'cold')}
+    with app.app_context():
+        print(f"Benchmarking against {db.engine.url.render_as_string(hide_password=True)}")
+        print(f"{'Scenario':<36} {'reqs':>6} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9} {'queries':>9} {'req/s':>9}")
+        results = run_benchmark(args)
+    ok = True
+    
+    if args.compare:
+        try:
+            with open(args.baseline) as stream:
+                baseline = json.load(stream)
+        except (OSError, ValueError) as e:
+            print(f"✗ Could not read baseline {args.baseline}: {str(e)}")
+            return False
+        
+        if baseline.get('scale') != scale:
+            print("Warning: the baseline was recorded at a different scale")
+        regressions = compare(results, baseline.get('results', {}), args.tolerance)
+        if regressions:
+            print(f"✗ Regressions: {', '.join(regressions)}")
+            ok = False
+        else:
+            print("✓ No regressions against the baseline")
+    
+    if args.save_baseline:
+        # Timings of failing requests would only measure error pages
+        saved = {name: result for name, result in results.items() if not result.get('errors')}
+        for name in results:
+            if name not in saved:
+                print(f"Warning: {name} had errors and is left out of the baseline")
+        with open(args.baseline, 'w') as stream:
+            json.dump({'scale': scale, 'results': saved}, stream, indent=2)
+        print(f"✓ Baseline saved to {args.baseline}")
+    
+    return ok and not any(result.get('errors') for result in results.values())
+
+if __name__ == '__main__':
+    try:
+        if not main():
+            sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n\nBenchmark interrupted by user")
+        sys.exit(1)
@@ -0,0 +1,142 @@
+"""
+In-process publish/subscribe for ACNSMS
+Fans schedule changes out to the open Server-Sent Events streams
+
+Subscribers are indexed by topic (e.g. "module:12"), so publishing a change
+only touches the streams that follow the affected module. Recent events are
+kept in a short history so a reconnecting client can resume from its
+Last-Event-ID.
+"""
+
+import os
+import queue
+import threading
+from collections import deque
+
+class Subscription:
+    """A subscriber's topics and its queue of pending events"""
+    
+    def __init__(self, topics, max_queue):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+    
+    def get(self, timeout=None):
+        """
+        Wait for the next event
+        
+        Returns:
+            tuple: (event id, event dict), or None if the subscriber fell too
+            far behind and must resynchronize
+        
+        Raises:
+            queue.Empty: if nothing arrived within the timeout
+        """
+        if self.overflowed:
+            return None
+        return self.queue.get(timeout=timeout)
+
+class Broadcaster:
+    """Thread-safe fan-out of events to subscriptions by topic"""
+    
+    def __init__(self, max_queue=100, history_size=1000):
+        self.max_queue = max_queue
+        self._subscribers = {}  # topic -> set of Subscription
+        self._history = deque(maxlen=history_size)  # (event id, topics, event)
+        self._last_id = 0
+        self._lock = threading.Lock()
+        # Distinguishes event ids of this process from those of a previous run
+        self.epoch = os.urandom(4).hex()
+    
+    def format_event_id(self, event_id):
+        """Event id as sent to clients"""
+        return f"{self.epoch}-{event_id}"
+    
+    def parse_event_id(self, value):
+        """Event id from a client's Last-Event-ID, or None if it was issued by another process or run"""
+        epoch, _, event_id = (value or '').partition('-')
+        if epoch != self.epoch or not event_id.isdigit():
+            return None
+        return int(event_id)
+    
+    def current_event_id(self):
+        """Id of the latest published event (0 before the first one)"""
+        with self._lock:
+            return self._last_id
+    
+    def subscribe(self, topics, last_event_id=None):
+        """
+        Register a subscriber
+        
+        Args:
+            topics (iterable): Topics to receive
+            last_event_id (int): Id of the last event the client saw; missed
+                events still in the history are queued immediately
+        
+        Returns:
+            Subscription
+        """
+        subscription = Subscription(topics, self.max_queue)
+        
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+            
+            if last_event_id is not None and last_event_id < self._last_id:
+                oldest_id = self._history[0][0] if self._history else self._last_id + 1
+                if last_event_id < oldest_id - 1:
+                    # Missed events are no longer in the history
+                    subscription.overflowed = True
+                else:
+                    for event_id, topics, event in self._history:
+                        if event_id > last_event_id and subscription.topics & topics:
+                            self._offer(subscription, event_id, event)
+        
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        """Remove a subscriber"""
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+    
+    def _offer(self, subscription, event_id, event):
+        """Queue an event without blocking the publisher; caller holds the lock"""
+        try:
+            subscription.queue.put_nowait((event_id, event))
+        except queue.Full:
+            subscription.overflowed = True
+    
+    def publish(self, topics, event):
+        """
+        Deliver an event to every subscriber of any of the topics
+        
+        A subscriber whose queue is full is marked as overflowed instead of
+        slowing down the publisher.
+        
+        Returns:
+            int: Number of subscribers that received the event
+        """
+        topics = frozenset(topics)
+        
+        with self._lock:
+            self._last_id += 1
+            event_id = self._last_id
+            self._history.append((event_id, topics, event))
+            
+            recipients = set()
+            for topic in topics:
+                recipients.update(self._subscribers.get(topic, ()))
+            for subscription in recipients:
+                self._offer(subscription, event_id, event)
+        
+        return len(recipients)
+    
+    def subscriber_count(self):
+        """Number of open subscriptions"""
+        with self._lock:
+            return len(set().union(*self._subscribers.values())) if self._subscribers else 0
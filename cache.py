@@ -0,0 +1,222 @@
+"""
+Cache backends for ACNSMS
+In-process LRU cache with TTL and an optional Redis-compatible backend
+
+Entries can carry tags (e.g. "module:12") so that every entry derived from
+a module can be invalidated at once when that module's schedules change.
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+class CacheStats:
+    """Thread-safe hit/miss counters shared by the cache backends"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+    
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'sets': self.sets,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+class LRUCache:
+    """In-process least-recently-used cache with per-entry TTL and tag invalidation"""
+    
+    backend = 'memory'
+    
+    # Invalidations only reach this process, so other processes' writes go unnoticed
+    shared = False
+    
+    def __init__(self, max_entries=10000, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+    
+    def _remove(self, key):
+        """Drop an entry and its tag references; caller holds the lock"""
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+    
+    def get(self, key, default=None):
+        """Return a cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats.incr('hits')
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+        self._stats.incr('misses')
+        return default
+    
+    def set(self, key, value, tags=(), ttl=None):
+        """Store a value; tags allow invalidating it together with related entries"""
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        tags = frozenset(tags)
+        
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats.incr('evictions')
+        
+        self._stats.incr('sets')
+    
+    def invalidate_tags(self, tags):
+        """Remove every entry carrying any of the given tags"""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+        self._stats.incr('invalidations', removed)
+        return removed
+    
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+    
+    def stats(self):
+        """Hit/miss counters and current size"""
+        stats = self._stats.as_dict()
+        with self._lock:
+            stats['entries'] = len(self._entries)
+        stats['backend'] = self.backend
+        return stats
+
+class RedisCache:
+    """
+    Cache stored in Redis (or any Redis-compatible server), shared by all
+    worker processes. Tags are kept as Redis sets of keys. Connection errors
+    are treated as misses so a cache outage never fails a request.
+    """
+    
+    backend = 'redis'
+    shared = True
+    
+    def __init__(self, url, default_ttl=300, prefix='acnsms:cache:'):
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self._stats = CacheStats()
+    
+    def get(self, key, default=None):
+        try:
+            data = self.client.get(self.prefix + key)
+        except redis.RedisError as e:
+            print(f"Cache read failed: {str(e)}")
+            data = None
+        
+        if data is None:
+            self._stats.incr('misses')
+            return default
+        self._stats.incr('hits')
+        return pickle.loads(data)
+    
+    def set(self, key, value, tags=(), ttl=None):
+        ttl = ttl or self.default_ttl
+        try:
+            pipe = self.client.pipeline()
+            pipe.setex(self.prefix + key, ttl, pickle.dumps(value))
+            for tag in tags:
+                tag_key = f"{self.prefix}tag:{tag}"
+                pipe.sadd(tag_key, self.prefix + key)
+                pipe.expire(tag_key, ttl)
+            pipe.execute()
+            self._stats.incr('sets')
+        except redis.RedisError as e:
+            print(f"Cache write failed: {str(e)}")
+    
+    def invalidate_tags(self, tags):
+        removed = 0
+        try:
+            for tag in tags:
+                tag_key = f"{self.prefix}tag:{tag}"
+                keys = self.client.smembers(tag_key)
+                if keys:
+                    removed += self.client.delete(*keys)
+                self.client.delete(tag_key)
+        except redis.RedisError as e:
+            print(f"Cache invalidation failed: {str(e)}")
+        self._stats.incr('invalidations', removed)
+        return removed
+    
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(match=self.prefix + '*'))
+            if keys:
+                self.client.delete(*keys)
+        except redis.RedisError as e:
+            print(f"Cache clear failed: {str(e)}")
+    
+    def stats(self):
+        stats = self._stats.as_dict()
+        stats['backend'] = self.backend
+        return stats
+
+def create_cache(url=None, max_entries=None, default_ttl=None):
+    """
+    Create the cache backend configured by CACHE_URL
+    
+    Args:
+        url (str): redis:// URL for a shared cache; empty for the in-process LRU cache
+        max_entries (int): Maximum entries of the in-process cache
+        default_ttl (int): Entry lifetime in seconds
+    
+    Returns:
+        LRUCache or RedisCache
+    """
+    url = url if url is not None else os.getenv('CACHE_URL', '')
+    default_ttl = default_ttl or int(os.getenv('CACHE_TTL', 300))
+    max_entries = max_entries or int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+    
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            print("Warning: CACHE_URL points to Redis but the redis package is not installed. Using in-process cache.")
+        else:
+            return RedisCache(url, default_ttl=default_ttl)
+    
+    return LRUCache(max_entries=max_entries, default_ttl=default_ttl)
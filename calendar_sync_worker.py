@@ -0,0 +1,536 @@
+"""
+Calendar sync worker for ACNSMS
+Pushes queued schedule changes to Google Calendar with retries
+
+Run this script alongside the web server:
+    python calendar_sync_worker.py
+Queue every schedule and series that has no Google Calendar event yet:
+    python calendar_sync_worker.py reconcile
+Pull calendar-side changes since the last run and queue drifted schedules:
+    python calendar_sync_worker.py pull
+"""
+
+from app import (
+    app, db, Schedule, ScheduleSeries, ScheduleSeriesException, Module, CalendarSyncJob, CalendarSyncState,
+    calendar_service, enqueue_calendar_sync
+)
+from services.calendar_service import SyncTokenExpired
+from scheduling import parse_weekdays, weekly_recurrence
+from metrics import registry as metrics_registry
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import joinedload
+import argparse
+import sys
+import time
+
+# Google event ids may only use base32hex characters (a-v, 0-9)
+EVENT_ID_PREFIX = 'acnsms'
+SERIES_EVENT_ID_PREFIX = EVENT_ID_PREFIX + 'r'
+
+def calendar_event_id(schedule_id):
+    """Deterministic event id for a schedule, used as the idempotency key for inserts"""
+    return f"{EVENT_ID_PREFIX}{schedule_id:08d}"
+
+def series_event_id(series_id):
+    """Deterministic id of the recurring event of a series"""
+    return f"{SERIES_EVENT_ID_PREFIX}{series_id:08d}"
+
+def schedule_event_fields(schedule):
+    """Calendar event fields for a schedule"""
+    module = schedule.module
+    return {
+        'title': f"{module.module_code} - {module.module_name}",
+        'location': schedule.classroom,
+        'start_datetime': datetime.combine(schedule.date, schedule.start_time),
+        'end_datetime': datetime.combine(schedule.date, schedule.end_time),
+        'description': f"Lecturer: {module.lecturer.username}"
+    }
+
+def series_event_fields(series, exception_dates):
+    """Recurring calendar event fields for a series; the first occurrence carries the times"""
+    module = series.module
+    return {
+        'title': f"{module.module_code} - {module.module_name}",
+        'location': series.classroom,
+        'start_datetime': datetime.combine(series.start_date, series.start_time),
+        'end_datetime': datetime.combine(series.start_date, series.end_time),
+        'description': f"Lecturer: {module.lecturer.username}",
+        'recurrence': weekly_recurrence(series.start_time, series.end_date, parse_weekdays(series.weekdays),
+                                        series.interval_weeks, sorted(exception_dates))
+    }
+
+def load_exception_dates(series_ids):
+    """Removed occurrence dates (EXDATEs) by series id"""
+    exception_dates = {series_id: set() for series_id in series_ids}
+    if series_ids:
+        for series_id, occurrence_date in db.session.query(
+            ScheduleSeriesException.series_id, ScheduleSeriesException.occurrence_date
+        ).filter(ScheduleSeriesException.series_id.in_(list(series_ids))):
+            exception_dates[series_id].add(occurrence_date)
+    return exception_dates
+
+def set_google_event_id(target_id, event_id, model=Schedule):
+    """Record the event id of a schedule (or series) without touching updated_at (a sync is not a schedule change)"""
+    model.query.filter_by(id=target_id).update(
+        {'google_event_id': event_id, 'updated_at': model.updated_at},
+        synchronize_session=False
+    )
+
+class CalendarSyncWorker:
+    """Claims due calendar sync jobs in batches and pushes them with one batch API call"""
+    
+    def __init__(self, batch_size=50, lease_seconds=300, max_attempts=8, retry_base=30):
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+    
+    def recover_stale_claims(self):
+        """
+        Return jobs stuck in 'processing' to the queue
+        
+        Returns:
+            int: Number of jobs released
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        released = CalendarSyncJob.query.filter(
+            CalendarSyncJob.status == 'processing',
+            CalendarSyncJob.claimed_at < cutoff
+        ).update({'status': 'pending', 'claimed_at': None}, synchronize_session=False)
+        db.session.commit()
+        
+        if released:
+            print(f"Released {released} stale calendar sync claims")
+        return released
+    
+    def claim_batch(self):
+        """
+        Mark a batch of due jobs as 'processing'
+        
+        Returns:
+            list: (job_id, version, schedule_id, series_id, action) tuples;
+            one of schedule_id and series_id is None
+        """
+        now = datetime.utcnow()
+        jobs = CalendarSyncJob.query.filter(
+            CalendarSyncJob.status == 'pending',
+            CalendarSyncJob.next_attempt_at <= now
+        ).order_by(CalendarSyncJob.next_attempt_at).limit(self.batch_size).with_for_update(skip_locked=True).all()
+        
+        claimed = []
+        for job in jobs:
+            job.status = 'processing'
+            job.claimed_at = now
+            job.attempts = (job.attempts or 0) + 1
+            claimed.append((job.id, job.version, job.schedule_id, job.series_id, job.action))
+        
+        db.session.commit()
+        return claimed
+    
+    def build_operations(self, claimed):
+        """
+        Turn claimed jobs into calendar batch operations
+        
+        Returns:
+            tuple: (operations, job ids that need no API call)
+        """
+        schedules = {
+            schedule.id: schedule for schedule in Schedule.query.options(
+                joinedload(Schedule.module).joinedload(Module.lecturer)
+            ).filter(Schedule.id.in_([schedule_id for _, _, schedule_id, _, _ in claimed if schedule_id])).all()
+        }
+        series_ids = [series_id for _, _, _, series_id, _ in claimed if series_id]
+        series_by_id = {
+            series.id: series for series in ScheduleSeries.query.options(
+                joinedload(ScheduleSeries.module).joinedload(Module.lecturer)
+            ).filter(ScheduleSeries.id.in_(series_ids)).all()
+        } if series_ids else {}
+        exception_dates = load_exception_dates(series_ids)
+        
+        operations = []
+        nothing_to_do = []
+        
+        for job_id, version, schedule_id, series_id, action in claimed:
+            if series_id:
+                series = series_by_id.get(series_id)
+                operation = self.series_operation(job_id, series, action, exception_dates.get(series_id, ()))
+                if operation:
+                    operations.append(operation)
+                else:
+                    nothing_to_do.append(job_id)
+                continue
+            
+            schedule = schedules.get(schedule_id)
+            
+            if schedule is None:
+                nothing_to_do.append(job_id)
+            elif action == 'delete' or schedule.status == 'cancelled':
+                if schedule.google_event_id:
+                    operations.append({'key': job_id, 'action': 'delete', 'event_id': schedule.google_event_id})
+                else:
+                    nothing_to_do.append(job_id)
+            elif schedule.google_event_id:
+                fields = schedule_event_fields(schedule)
+                fields['status'] = 'confirmed'  # also restores an event deleted in the calendar
+                operations.append({'key': job_id, 'action': 'patch', 'event_id': schedule.google_event_id, 'fields': fields})
+            else:
+                operations.append({
+                    'key': job_id,
+                    'action': 'insert',
+                    'event_id': calendar_event_id(schedule.id),
+                    'fields': schedule_event_fields(schedule)
+                })
+        
+        return operations, nothing_to_do
+    
+    def series_operation(self, job_id, series, action, exception_dates):
+        """Calendar batch operation for the recurring event of a series, or None if there is nothing to do"""
+        if series is None:
+            return None
+        if action == 'delete' or series.status == 'cancelled':
+            if series.google_event_id:
+                return {'key': job_id, 'action': 'delete', 'event_id': series.google_event_id}
+            return None
+        
+        fields = series_event_fields(series, exception_dates)
+        if series.google_event_id:
+            fields['status'] = 'confirmed'
+            return {'key': job_id, 'action': 'patch', 'event_id': series.google_event_id, 'fields': fields}
+        return {'key': job_id, 'action': 'insert', 'event_id': series_event_id(series.id), 'fields': fields}
+    
+    def complete(self, job_id, version):
+        """Remove a finished job unless it was re-enqueued while being processed"""
+        CalendarSyncJob.query.filter_by(id=job_id, version=version).delete(synchronize_session=False)
+    
+    def retry(self, job_id, version, attempts, error, immediately=False):
+        """Schedule another attempt with exponential backoff, or give up after max_attempts"""
+        query = CalendarSyncJob.query.filter_by(id=job_id, version=version)
+        
+        if attempts >= self.max_attempts:
+            query.update({'status': 'failed', 'claimed_at': None, 'last_error': error}, synchronize_session=False)
+            return
+        
+        delay = 0 if immediately else min(self.retry_base * (2 ** (attempts - 1)), 3600)
+        query.update({
+            'status': 'pending',
+            'claimed_at': None,
+            'last_error': error,
+            'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay)
+        }, synchronize_session=False)
+    
+    def record_results(self, claimed, operations, nothing_to_do, results):
+        """Store event ids and job outcomes"""
+        jobs = {
+            job_id: (version, series_id or schedule_id, ScheduleSeries if series_id else Schedule)
+            for job_id, version, schedule_id, series_id, _ in claimed
+        }
+        attempts = dict(db.session.query(CalendarSyncJob.id, CalendarSyncJob.attempts).filter(
+            CalendarSyncJob.id.in_(list(jobs))
+        ).all())
+        synced = failed = 0
+        
+        for job_id in nothing_to_do:
+            self.complete(job_id, jobs[job_id][0])
+        
+        for operation in operations:
+            job_id = operation['key']
+            version, target_id, model = jobs[job_id]
+            result = results[job_id]
+            
+            if result['success']:
+                if operation['action'] == 'insert':
+                    set_google_event_id(target_id, result['event_id'], model)
+                elif operation['action'] == 'delete':
+                    set_google_event_id(target_id, None, model)
+                self.complete(job_id, version)
+                synced += 1
+            elif operation['action'] == 'insert' and result['status'] == 409:
+                # An earlier attempt created the event but its response was lost
+                set_google_event_id(target_id, operation['event_id'], model)
+                self.retry(job_id, version, attempts.get(job_id, 1), result['error'], immediately=True)
+            elif operation['action'] == 'patch' and result['status'] in (404, 410):
+                # Unknown event id; create the event again
+                set_google_event_id(target_id, None, model)
+                self.retry(job_id, version, attempts.get(job_id, 1), result['error'], immediately=True)
+            else:
+                self.retry(job_id, version, attempts.get(job_id, 1), result['error'])
+                failed += 1
+        
+        db.session.commit()
+        return synced, failed
+    
+    def process_batch(self):
+        """
+        Claim, push and record one batch
+        
+        Returns:
+            int: Number of jobs processed
+        """
+        claimed = self.claim_batch()
+        if not claimed:
+            return 0
+        
+        operations, nothing_to_do = self.build_operations(claimed)
+        results = calendar_service.batch_execute(operations) if operations else {}
+        synced, failed = self.record_results(claimed, operations, nothing_to_do, results)
+        
+        print(f"Processed {len(claimed)} calendar sync jobs: {synced} synced, {failed} failed")
+        return len(claimed)
+    
+    def run(self, poll_interval=5.0, once=False):
+        """Process batches until interrupted (or until nothing is due with once=True)"""
+        last_recovery = 0
+        
+        while True:
+            if time.monotonic() - last_recovery > self.lease_seconds / 2:
+                self.recover_stale_claims()
+                last_recovery = time.monotonic()
+            
+            processed = self.process_batch()
+            
+            # Publish this batch's send/API metrics to /metrics without waiting for the next one
+            metrics_registry.flush()
+            
+            if not processed:
+                if once:
+                    return
+                time.sleep(poll_interval)
+
+def reconcile(chunk_size=1000):
+    """
+    Queue every active schedule and series that has no Google Calendar event
+    
+    Returns:
+        int: Number of schedules and series queued
+    """
+    queued = 0
+    last_id = 0
+    
+    while True:
+        schedule_ids = [row.id for row in db.session.query(Schedule.id).filter(
+            Schedule.google_event_id.is_(None),
+            Schedule.status != 'cancelled',
+            Schedule.id > last_id
+        ).order_by(Schedule.id).limit(chunk_size).all()]
+        
+        if not schedule_ids:
+            break
+        
+        enqueue_calendar_sync(schedule_ids)
+        db.session.commit()
+        queued += len(schedule_ids)
+        last_id = schedule_ids[-1]
+    
+    series_ids = [row.id for row in db.session.query(ScheduleSeries.id).filter(
+        ScheduleSeries.google_event_id.is_(None),
+        ScheduleSeries.status != 'cancelled'
+    ).all()]
+    for start in range(0, len(series_ids), chunk_size):
+        enqueue_calendar_sync(series_ids[start:start + chunk_size], key='series_id')
+        db.session.commit()
+    
+    print(f"Queued {queued} schedules and {len(series_ids)} series missing a Google Calendar event")
+    return queued + len(series_ids)
+
+def parse_event_datetime(value):
+    """Parse an RFC 3339 event dateTime into a naive UTC datetime"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def event_matches_schedule(event, schedule):
+    """Check whether a calendar event still reflects its schedule"""
+    if (event.get('status') == 'cancelled') != (schedule.status == 'cancelled'):
+        return False
+    if schedule.status == 'cancelled':
+        return True
+    
+    fields = schedule_event_fields(schedule)
+    try:
+        return (
+            event.get('summary') == fields['title']
+            and event.get('location') == fields['location']
+            and parse_event_datetime(event['start']['dateTime']) == fields['start_datetime']
+            and parse_event_datetime(event['end']['dateTime']) == fields['end_datetime']
+        )
+    except (KeyError, ValueError):
+        return False
+
+def event_matches_series(event, series, exception_dates):
+    """
+    Check whether a recurring event, or one of its instances, still reflects its series
+    
+    The worker only ever writes the recurring event itself, so a changed
+    instance matches only if it is the cancellation of an EXDATE.
+    """
+    if event.get('recurringEventId'):
+        try:
+            original = parse_event_datetime(event['originalStartTime']['dateTime'])
+        except (KeyError, ValueError):
+            return False
+        return event.get('status') == 'cancelled' and original.date() in exception_dates
+    
+    if (event.get('status') == 'cancelled') != (series.status == 'cancelled'):
+        return False
+    if series.status == 'cancelled':
+        return True
+    
+    fields = series_event_fields(series, exception_dates)
+    try:
+        return (
+            event.get('summary') == fields['title']
+            and event.get('location') == fields['location']
+            and parse_event_datetime(event['start']['dateTime']) == fields['start_datetime']
+            and parse_event_datetime(event['end']['dateTime']) == fields['end_datetime']
+            and event.get('recurrence', []) == fields['recurrence']
+        )
+    except (KeyError, ValueError):
+        return False
+
+def pull_series_changes(events, full_sync, chunk_size=1000):
+    """
+    Series whose recurring event (or any of its instances) drifted
+    
+    Returns:
+        tuple: (linked event ids, drifted series ids)
+    """
+    by_series_event = {}
+    for event in events:
+        by_series_event.setdefault(event.get('recurringEventId') or event['id'], []).append(event)
+    series_event_ids = [event_id for event_id in by_series_event if event_id.startswith(SERIES_EVENT_ID_PREFIX)]
+    
+    linked = set()
+    drifted = set()
+    
+    for start in range(0, len(series_event_ids), chunk_size):
+        series_list = ScheduleSeries.query.options(
+            joinedload(ScheduleSeries.module).joinedload(Module.lecturer)
+        ).filter(ScheduleSeries.google_event_id.in_(series_event_ids[start:start + chunk_size])).all()
+        exception_dates = load_exception_dates([series.id for series in series_list])
+        
+        for series in series_list:
+            for event in by_series_event[series.google_event_id]:
+                linked.add(event['id'])
+                if not event_matches_series(event, series, exception_dates[series.id]):
+                    drifted.add(series.id)
+    
+    # A full listing also reveals recurring events that no longer exist at all
+    if full_sync:
+        drifted.update(series_id for series_id, event_id in db.session.query(
+            ScheduleSeries.id, ScheduleSeries.google_event_id
+        ).filter(ScheduleSeries.google_event_id.isnot(None)) if event_id not in by_series_event)
+    
+    return linked, sorted(drifted)
+
+def pull_changes(chunk_size=1000):
+    """
+    Fetch calendar events changed since the stored sync token and queue a
+    sync for every schedule whose event has drifted (edited or deleted in
+    the calendar). The database is the source of truth, so drifted events
+    are overwritten on the next worker run. Events pushed by the worker
+    itself come back as changes too and simply match.
+    
+    Recurring events of series are compared as a whole; an edit to a single
+    instance queues the series.
+    
+    Returns:
+        dict: Counts of changed events, drifted schedules and series and unlinked events
+    """
+    state = db.session.get(CalendarSyncState, calendar_service.calendar_id)
+    if state is None:
+        state = CalendarSyncState(calendar_id=calendar_service.calendar_id)
+        db.session.add(state)
+    
+    full_sync = not state.sync_token
+    try:
+        events, next_token = calendar_service.list_event_changes(state.sync_token)
+    except SyncTokenExpired:
+        print("Sync token expired, running a full sync")
+        full_sync = True
+        events, next_token = calendar_service.list_event_changes()
+    
+    events_by_id = {event['id']: event for event in events}
+    event_ids = list(events_by_id)
+    linked = set()
+    drifted = []
+    
+    for start in range(0, len(event_ids), chunk_size):
+        schedules = Schedule.query.options(
+            joinedload(Schedule.module).joinedload(Module.lecturer)
+        ).filter(Schedule.google_event_id.in_(event_ids[start:start + chunk_size])).all()
+        
+        for schedule in schedules:
+            linked.add(schedule.google_event_id)
+            if not event_matches_schedule(events_by_id[schedule.google_event_id], schedule):
+                drifted.append(schedule.id)
+    
+    # A full listing also reveals events that no longer exist at all
+    if full_sync:
+        last_id = 0
+        while True:
+            rows = db.session.query(Schedule.id, Schedule.google_event_id).filter(
+                Schedule.google_event_id.isnot(None),
+                Schedule.id > last_id
+            ).order_by(Schedule.id).limit(chunk_size).all()
+            if not rows:
+                break
+            drifted.extend(row.id for row in rows if row.google_event_id not in events_by_id)
+            last_id = rows[-1].id
+    
+    series_linked, drifted_series = pull_series_changes(events, full_sync, chunk_size)
+    linked |= series_linked
+    
+    unlinked = [
+        event_id for event_id in event_ids
+        if event_id not in linked and event_id.startswith(EVENT_ID_PREFIX)
+        and events_by_id[event_id].get('status') != 'cancelled'
+    ]
+    
+    for start in range(0, len(drifted), chunk_size):
+        enqueue_calendar_sync(drifted[start:start + chunk_size])
+    for start in range(0, len(drifted_series), chunk_size):
+        enqueue_calendar_sync(drifted_series[start:start + chunk_size], key='series_id')
+    
+    state.sync_token = next_token
+    state.last_synced_at = datetime.utcnow()
+    db.session.commit()
+    
+    summary = {
+        'changed_events': len(events),
+        'drifted_schedules': len(drifted),
+        'drifted_series': len(drifted_series),
+        'unlinked_events': len(unlinked)
+    }
+    print(f"Pulled {len(events)} changed events ({'full' if full_sync else 'incremental'} sync): "
+          f"{len(drifted)} schedules and {len(drifted_series)} series queued, "
+          f"{len(unlinked)} ACNSMS events without a schedule")
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Push ACNSMS schedule changes to Google Calendar')
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'reconcile', 'pull'],
+                        help='run: process the sync queue; reconcile: queue schedules missing a calendar event; '
+                             'pull: queue schedules whose events changed in the calendar since the last pull')
+    parser.add_argument('--batch-size', type=int, default=50, help='Jobs claimed per batch')
+    parser.add_argument('--lease', type=int, default=300, help='Seconds before a claim is considered stale')
+    parser.add_argument('--max-attempts', type=int, default=8, help='Attempts before a job is marked as failed')
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to wait when nothing is due')
+    parser.add_argument('--once', action='store_true', help='Exit once nothing is due')
+    args = parser.parse_args()
+    
+    try:
+        with app.app_context():
+            if args.command == 'reconcile':
+                reconcile()
+            elif args.command == 'pull':
+                pull_changes()
+            else:
+                CalendarSyncWorker(
+                    batch_size=args.batch_size,
+                    lease_seconds=args.lease,
+                    max_attempts=args.max_attempts
+                ).run(poll_interval=args.poll_interval, once=args.once)
+    except KeyboardInterrupt:
+        print("\nCalendar sync worker stopped")
+        sys.exit(0)
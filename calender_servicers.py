@@ -5,39 +5,175 @@ Handles Google Calendar integration
 
 import os
 import pickle
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
+import httplib2
+import google_auth_httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
+from metrics import calendar_api_duration, calendar_api_errors
 
 load_dotenv()
 
+class SyncTokenExpired(Exception):
+    """Raised when Google rejects a sync token (HTTP 410) and a full sync is required"""
+
+class SharedCredentials(Credentials):
+    """
+    OAuth user credentials shared by the per-thread HTTP clients
+    
+    A google-auth Credentials subclass, so google_auth_httplib2.AuthorizedHttp
+    and googleapiclient's batch requests handle it like any user credentials.
+    Token refreshes are serialized with a lock so concurrent threads don't
+    refresh at the same time, and every refreshed token is handed to
+    on_refresh for persistence.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._refresh_lock = threading.RLock()
+        self._on_refresh = None
+    
+    @classmethod
+    def from_credentials(cls, credentials, on_refresh):
+        """Copy loaded user credentials into shared credentials"""
+        shared = cls(
+            credentials.token,
+            refresh_token=credentials.refresh_token,
+            id_token=credentials.id_token,
+            token_uri=credentials.token_uri,
+            client_id=credentials.client_id,
+            client_secret=credentials.client_secret,
+            scopes=credentials.scopes,
+            quota_project_id=credentials.quota_project_id
+        )
+        shared.expiry = credentials.expiry
+        shared._on_refresh = on_refresh
+        return shared
+    
+    def refresh(self, request):
+        """Refresh the token (AuthorizedHttp also calls this after a 401) and persist it"""
+        with self._refresh_lock:
+            super().refresh(request)
+            if self._on_refresh:
+                self._on_refresh(self)
+    
+    def before_request(self, request, method, url, headers):
+        """Refresh an expired token once, then add the Authorization header"""
+        if not self.valid:
+            with self._refresh_lock:
+                # Another thread may have refreshed while we waited for the lock
+                if not self.valid:
+                    self.refresh(request)
+        super().before_request(request, method, url, headers)
+
 class CalendarService:
-    """Service class for Google Calendar integration"""
+    """
+    Service class for Google Calendar integration
+    
+    Safe to share between threads: httplib2 connections are not thread-safe,
+    so each thread gets its own authorized HTTP client and API object, all
+    backed by one set of SharedCredentials.
+    """
     
     # Google Calendar API scopes
     SCOPES = ['https://www.googleapis.com/auth/calendar']
     
-    def __init__(self):
-        self.service = None
+    # Maximum requests per batch recommended for the Calendar API
+    BATCH_LIMIT = 50
+    
+    # Seconds between authentication attempts while Google is unavailable
+    RETRY_AUTH_AFTER = 60
+    
+    def __init__(self, interactive=True):
         self.calendar_id = os.getenv('GOOGLE_CALENDAR_ID', 'primary')
         self.credentials_file = 'credentials.json'
-        self.token_file = 'token.pickle'
+        self.token_file = 'token.json'
+        self.legacy_token_file = 'token.pickle'
+        self.http_timeout = int(os.getenv('GOOGLE_HTTP_TIMEOUT', 30))
         
-        # Initialize Google Calendar service
+        # Only an interactive process (not a web worker) may open a browser for OAuth consent
+        self.interactive = interactive
+        
+        self.credentials = None
+        self._local = threading.local()
+        self._auth_lock = threading.Lock()
+        self._token_file_lock = threading.Lock()
+        self._last_auth_attempt = 0
+        
+        # Initialize Google Calendar credentials
         self._authenticate()
     
+    @property
+    def service(self):
+        """The calendar API object for the current thread, or None if not authorized"""
+        if self.credentials is None:
+            with self._auth_lock:
+                if self.credentials is None and time.monotonic() - self._last_auth_attempt > self.RETRY_AUTH_AFTER:
+                    self._authenticate()
+            if self.credentials is None:
+                return None
+        
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            try:
+                authorized_http = google_auth_httplib2.AuthorizedHttp(
+                    self.credentials,
+                    http=httplib2.Http(timeout=self.http_timeout)
+                )
+                # Use the discovery document bundled with google-api-python-client
+                # instead of fetching it over the network
+                service = build('calendar', 'v3', http=authorized_http, static_discovery=True, cache_discovery=False)
+                self._local.service = service
+            except Exception as e:
+                print(f"Failed to build Google Calendar service: {str(e)}")
+                return None
+        return service
+    
+    def _load_token(self):
+        """Load stored credentials, migrating a legacy pickled token if present"""
+        if os.path.exists(self.token_file):
+            return Credentials.from_authorized_user_file(self.token_file, self.SCOPES)
+        
+        if os.path.exists(self.legacy_token_file):
+            with open(self.legacy_token_file, 'rb') as token:
+                creds = pickle.load(token)
+            self._save_token(creds)
+            return creds
+        
+        return None
+    
+    def _save_token(self, creds):
+        """Persist credentials atomically (write a temp file, then rename over the token file)"""
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        
+        with self._token_file_lock:
+            fd, temp_path = tempfile.mkstemp(prefix='.token-', suffix='.json', dir=directory)
+            try:
+                with os.fdopen(fd, 'w') as token:
+                    token.write(creds.to_json())
+                os.chmod(temp_path, 0o600)
+                os.replace(temp_path, self.token_file)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+    
     def _authenticate(self):
         """Authenticate with Google Calendar API"""
+        self._last_auth_attempt = time.monotonic()
         creds = None
         
-        # Check if token file exists
-        if os.path.exists(self.token_file):
-            with open(self.token_file, 'rb') as token:
-                creds = pickle.load(token)
+        try:
+            creds = self._load_token()
+        except Exception as e:
+            print(f"Failed to load stored credentials: {str(e)}")
         
         # If there are no valid credentials, authenticate
         if not creds or not creds.valid:
@@ -47,8 +183,13 @@ class CalendarService:
                 except Exception as e:
                     print(f"Failed to refresh credentials: {str(e)}")
                     creds = None
+            else:
+                creds = None
             
             if not creds:
+                if not self.interactive:
+                    print("Google Calendar is not authorized; run 'python -m services.calendar_service' once")
+                    return
                 if os.path.exists(self.credentials_file):
                     try:
                         flow = InstalledAppFlow.from_client_secrets_file(
@@ -62,14 +203,61 @@ class CalendarService:
                     return
             
             # Save credentials for future use
-            with open(self.token_file, 'wb') as token:
-                pickle.dump(creds, token)
+            self._save_token(creds)
         
+        self.credentials = SharedCredentials.from_credentials(creds, self._save_token)
+        print("Google Calendar service initialized successfully")
+    
+    def _execute(self, operation, request):
+        """Execute an API request, recording its latency and any error in the calendar API metrics"""
+        started = time.perf_counter()
         try:
-            self.service = build('calendar', 'v3', credentials=creds)
-            print("Google Calendar service initialized successfully")
+            return request.execute()
         except Exception as e:
-            print(f"Failed to build Google Calendar service: {str(e)}")
+            status = e.resp.status if isinstance(e, HttpError) else 'error'
+            calendar_api_errors.inc(operation=operation, status=status)
+            raise
+        finally:
+            calendar_api_duration.observe(time.perf_counter() - started, operation=operation)
+    
+    def _event_body(self, title=None, location=None, start_datetime=None, end_datetime=None, description=None,
+                    status=None, recurrence=None):
+        """Build an event resource containing only the provided fields"""
+        event = {}
+        if status:
+            event['status'] = status
+        if recurrence:
+            event['recurrence'] = recurrence
+        if title:
+            event['summary'] = title
+        if location:
+            event['location'] = location
+        if description:
+            event['description'] = description
+        if start_datetime:
+            event['start'] = {
+                'dateTime': start_datetime.isoformat(),
+                'timeZone': 'UTC',
+            }
+        if end_datetime:
+            event['end'] = {
+                'dateTime': end_datetime.isoformat(),
+                'timeZone': 'UTC',
+            }
+        return event
+    
+    def _new_event_body(self, title, location, start_datetime, end_datetime, description="", recurrence=None):
+        """Build the full resource for a new event, including reminders"""
+        event = self._event_body(title, location, start_datetime, end_datetime, description, recurrence=recurrence)
+        event['description'] = description
+        event['reminders'] = {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'email', 'minutes': 24 * 60},  # 24 hours before
+                {'method': 'popup', 'minutes': 30},       # 30 minutes before
+            ],
+        }
+        return event
     
     def create_event(self, title, location, start_datetime, end_datetime, description=""):
         """
@@ -90,31 +278,12 @@ class CalendarService:
             return None
         
         try:
-            event = {
-                'summary': title,
-                'location': location,
-                'description': description,
-                'start': {
-                    'dateTime': start_datetime.isoformat(),
-                    'timeZone': 'UTC',
-                },
-                'end': {
-                    'dateTime': end_datetime.isoformat(),
-                    'timeZone': 'UTC',
-                },
-                'reminders': {
-                    'useDefault': False,
-                    'overrides': [
-                        {'method': 'email', 'minutes': 24 * 60},  # 24 hours before
-                        {'method': 'popup', 'minutes': 30},       # 30 minutes before
-                    ],
-                },
-            }
+            event = self._new_event_body(title, location, start_datetime, end_datetime, description)
             
-            event_result = self.service.events().insert(
+            event_result = self._execute('insert', self.service.events().insert(
                 calendarId=self.calendar_id,
                 body=event
-            ).execute()
+            ))
             
             print(f"Event created successfully: {event_result['id']}")
             return event_result['id']
@@ -146,36 +315,12 @@ class CalendarService:
             return False
         
         try:
-            # Get the existing event
-            event = self.service.events().get(
-                calendarId=self.calendar_id,
-                eventId=event_id
-            ).execute()
-            
-            # Update only provided fields
-            if title:
-                event['summary'] = title
-            if location:
-                event['location'] = location
-            if description:
-                event['description'] = description
-            if start_datetime:
-                event['start'] = {
-                    'dateTime': start_datetime.isoformat(),
-                    'timeZone': 'UTC',
-                }
-            if end_datetime:
-                event['end'] = {
-                    'dateTime': end_datetime.isoformat(),
-                    'timeZone': 'UTC',
-                }
-            
-            # Update the event
-            updated_event = self.service.events().update(
+            # PATCH sends only the changed fields, so no GET is needed first
+            updated_event = self._execute('patch', self.service.events().patch(
                 calendarId=self.calendar_id,
                 eventId=event_id,
-                body=event
-            ).execute()
+                body=self._event_body(title, location, start_datetime, end_datetime, description)
+            ))
             
             print(f"Event updated successfully: {updated_event['id']}")
             return True
@@ -202,10 +347,10 @@ class CalendarService:
             return False
         
         try:
-            self.service.events().delete(
+            self._execute('delete', self.service.events().delete(
                 calendarId=self.calendar_id,
                 eventId=event_id
-            ).execute()
+            ))
             
             print(f"Event deleted successfully: {event_id}")
             return True
@@ -217,6 +362,140 @@ class CalendarService:
             print(f"Failed to delete calendar event: {str(e)}")
             return False
     
+    def _batch_request(self, operation):
+        """Build the API request for one batch operation"""
+        action = operation['action']
+        fields = operation.get('fields', {})
+        
+        if action == 'insert':
+            body = self._new_event_body(**fields)
+            # A client-chosen id makes retried inserts idempotent (409 if it already exists)
+            if operation.get('event_id'):
+                body['id'] = operation['event_id']
+            return self.service.events().insert(
+                calendarId=self.calendar_id,
+                body=body
+            )
+        if action == 'patch':
+            return self.service.events().patch(
+                calendarId=self.calendar_id,
+                eventId=operation['event_id'],
+                body=self._event_body(**fields)
+            )
+        if action == 'delete':
+            return self.service.events().delete(
+                calendarId=self.calendar_id,
+                eventId=operation['event_id']
+            )
+        raise ValueError(f"Unknown calendar batch action: {action}")
+    
+    def batch_execute(self, operations):
+        """
+        Execute many event inserts, patches and deletes using HTTP batch requests
+        
+        Args:
+            operations (list): Dicts with 'key' (caller's identifier), 'action'
+                ('insert', 'patch' or 'delete'), 'event_id' (required for
+                patch/delete, optional client-chosen id for insert) and
+                'fields' (keyword arguments for the event: title, location,
+                start_datetime, end_datetime, description, status and
+                recurrence, a list of RRULE/EXDATE lines for a recurring event)
+        
+        Returns:
+            dict: key -> {'success': bool, 'event_id': str, 'error': str, 'status': int}
+        """
+        results = {}
+        
+        if not self.service:
+            print("Google Calendar service not available")
+            for operation in operations:
+                results[operation['key']] = {'success': False, 'event_id': None, 'error': 'Calendar service not available', 'status': None}
+            return results
+        
+        for start in range(0, len(operations), self.BATCH_LIMIT):
+            chunk = operations[start:start + self.BATCH_LIMIT]
+            by_request_id = {str(index): operation for index, operation in enumerate(chunk)}
+            
+            def callback(request_id, response, exception):
+                operation = by_request_id[request_id]
+                status = exception.resp.status if isinstance(exception, HttpError) else None
+                
+                if exception is None:
+                    event_id = response['id'] if response else operation.get('event_id')
+                    results[operation['key']] = {'success': True, 'event_id': event_id, 'error': None, 'status': None}
+                elif operation['action'] == 'delete' and status in (404, 410):
+                    # Already deleted
+                    results[operation['key']] = {'success': True, 'event_id': operation['event_id'], 'error': None, 'status': status}
+                else:
+                    calendar_api_errors.inc(operation=operation['action'], status=status or 'error')
+                    results[operation['key']] = {
+                        'success': False, 'event_id': operation.get('event_id'), 'error': str(exception), 'status': status
+                    }
+            
+            batch = self.service.new_batch_http_request(callback=callback)
+            
+            try:
+                for request_id, operation in by_request_id.items():
+                    batch.add(self._batch_request(operation), request_id=request_id)
+                self._execute('batch', batch)
+            except Exception as e:
+                print(f"Calendar batch request failed: {str(e)}")
+                for operation in chunk:
+                    results.setdefault(operation['key'], {
+                        'success': False, 'event_id': operation.get('event_id'), 'error': str(e), 'status': None
+                    })
+        
+        succeeded = sum(1 for result in results.values() if result['success'])
+        print(f"Calendar batch completed: {succeeded} of {len(operations)} operations succeeded")
+        return results
+    
+    def list_event_changes(self, sync_token=None, page_size=2500):
+        """
+        List events changed since a sync token, following every result page
+        
+        Without a sync token all events are listed (a full sync). Deleted
+        events are included with status 'cancelled'.
+        
+        Args:
+            sync_token (str): nextSyncToken from a previous call
+            page_size (int): Events per page (the API maximum is 2500)
+        
+        Returns:
+            tuple: (list of events, nextSyncToken for the next call)
+        
+        Raises:
+            SyncTokenExpired: If the token is no longer valid
+        """
+        if not self.service:
+            raise RuntimeError("Google Calendar service not available")
+        
+        events = []
+        page_token = None
+        
+        while True:
+            params = {
+                'calendarId': self.calendar_id,
+                'maxResults': page_size,
+                'showDeleted': True,
+            }
+            if sync_token:
+                params['syncToken'] = sync_token
+            if page_token:
+                params['pageToken'] = page_token
+            
+            try:
+                result = self._execute('list', self.service.events().list(**params))
+            except HttpError as error:
+                if error.resp.status == 410:
+                    raise SyncTokenExpired(str(error)) from error
+                raise
+            
+            events.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            
+            if not page_token:
+                return events, result.get('nextSyncToken')
+    
     def get_events(self, start_date=None, end_date=None, max_results=10):
         """
         Get calendar events within a date range
@@ -242,14 +521,14 @@ class CalendarService:
             if not end_date:
                 end_date = start_date + timedelta(days=30)
             
-            events_result = self.service.events().list(
+            events_result = self._execute('list', self.service.events().list(
                 calendarId=self.calendar_id,
                 timeMin=start_date.isoformat() + 'Z',
                 timeMax=end_date.isoformat() + 'Z',
                 maxResults=max_results,
                 singleEvents=True,
                 orderBy='startTime'
-            ).execute()
+            ))
             
             events = events_result.get('items', [])
             return events
@@ -259,4 +538,8 @@ class CalendarService:
             return []
         except Exception as e:
             print(f"Failed to get calendar events: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+if __name__ == '__main__':
+    # One-time OAuth consent; stores the token used by the web application
+    CalendarService(interactive=True)
\ No newline at end of file
@@ -4,7 +4,13 @@ Run this script to create the database tables and insert sample data
 """
 
 from app import app, db, User, Module, Schedule, StudentModule, Notification
+from app import schedule_feed_query, scope_schedules_to_user
 from datetime import datetime, date, time, timedelta
+from sqlalchemy import func, inspect, text
+from werkzeug.security import generate_password_hash
+from itertools import accumulate
+import argparse
+import random
 import sys
 
 def create_tables():
@@ -208,7 +214,7 @@ def create_sample_schedules():
                 {
                     'module_id': modules[1].id,
                     'classroom': 'Room 201',
-                    'date': date(base_date.year, base_date.month, base_date.day + 1),
+                    'date': base_date + timedelta(days=1),
                     'start_time': time(10, 0),
                     'end_time': time(11, 30)
                 },
@@ -216,7 +222,7 @@ def create_sample_schedules():
                 {
                     'module_id': modules[2].id,
                     'classroom': 'Room 301',
-                    'date': date(base_date.year, base_date.month, base_date.day + 1),
+                    'date': base_date + timedelta(days=1),
                     'start_time': time(14, 0),
                     'end_time': time(15, 30)
                 },
@@ -224,7 +230,7 @@ def create_sample_schedules():
                 {
                     'module_id': modules[3].id,
                     'classroom': 'Lab 101',
-                    'date': date(base_date.year, base_date.month, base_date.day + 3),
+                    'date': base_date + timedelta(days=3),
                     'start_time': time(9, 0),
                     'end_time': time(11, 0)
                 }
@@ -241,6 +247,391 @@ def create_sample_schedules():
         return False
     return True
 
+# Teaching slots used by generate_dataset
+DATASET_SLOTS = [
+    (time(8, 0), time(10, 0)),
+    (time(10, 0), time(12, 0)),
+    (time(13, 0), time(15, 0)),
+    (time(15, 0), time(17, 0)),
+    (time(17, 0), time(19, 0)),
+]
+
+# Rows per INSERT statement when generating data
+DATASET_CHUNK_SIZE = 5000
+
+def insert_in_chunks(table, rows, chunk_size=DATASET_CHUNK_SIZE):
+    """Insert row dicts with one executemany per chunk; returns the number of rows"""
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            db.session.execute(table.insert(), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        count += len(chunk)
+    db.session.commit()
+    return count
+
+def assign_lecturers(module_cells, lecturers):
+    """
+    Pick a lecturer for each module so that no lecturer teaches two modules
+    in the same weekday and slot, spreading modules evenly (a lecturer is
+    only double booked when every lecturer is busy at that time)
+    
+    Args:
+        module_cells (list): Per module, the (weekday, slot, room) cells it uses
+        lecturers (int): Number of lecturers
+    
+    Returns:
+        list: Lecturer index per module
+    """
+    busy = [set() for _ in range(lecturers)]
+    load = [0] * lecturers
+    max_load = -(-len(module_cells) // lecturers)
+    assigned = []
+    
+    for index, cells in enumerate(module_cells):
+        times = {(weekday, slot) for weekday, slot, _ in cells}
+        free = [(index + offset) % lecturers for offset in range(lecturers)
+                if not busy[(index + offset) % lecturers] & times]
+        balanced = [candidate for candidate in free if load[candidate] < max_load]
+        choice = (balanced or free or [min(range(lecturers), key=load.__getitem__)])[0]
+        busy[choice] |= times
+        load[choice] += 1
+        assigned.append(choice)
+    
+    return assigned
+
+def generate_dataset(students=200, lecturers=10, modules=20, rooms=20, weeks=2, modules_per_student=4,
+                     sessions_per_week=2, seed=0, start_date=None, chunk_size=DATASET_CHUNK_SIZE):
+    """
+    Create a synthetic campus of a given size, e.g. for benchmark.py or
+    `python database_setup.py generate`
+    
+    Users are named admin, lecturer<n> and student<n> and get the sample
+    passwords; the password is hashed once per role, not per user. Each
+    module has sessions_per_week classes a week at a fixed weekday, slot and
+    room for the given number of weeks starting on the Monday of start_date
+    (default: this week). No room is double booked, and no lecturer unless
+    there are too few lecturers for the modules. Rows are
+    inserted in chunks of chunk_size, and the same seed always produces the
+    same data. Must run inside an app context on an empty database.
+    
+    Returns:
+        dict: Number of rows created per table
+    """
+    rng = random.Random(seed)
+    started = datetime.now()
+    
+    cells_per_day = len(DATASET_SLOTS) * rooms
+    if sessions_per_week > 5 or modules * sessions_per_week > 5 * cells_per_day:
+        raise ValueError(f"{modules} modules need more than {rooms} rooms for {sessions_per_week} sessions a week")
+    
+    counts = {}
+    
+    def report(table, count):
+        counts[table] = count
+        print(f"✓ {count} {table} ({(datetime.now() - started).total_seconds():.1f}s)")
+    
+    # Users: one hash per role
+    hashes = {role: generate_password_hash(f'{role}123') for role in ('admin', 'lecturer', 'student')}
+    users = [{'username': 'admin', 'email': 'admin@acnsms.com', 'phone': '+1000000000', 'role': 'admin',
+              'password_hash': hashes['admin']}]
+    users += ({'username': f'lecturer{i}', 'email': f'lecturer{i}@acnsms.com', 'phone': f'+11{i:08d}',
+               'role': 'lecturer', 'password_hash': hashes['lecturer']} for i in range(1, lecturers + 1))
+    report('users', insert_in_chunks(User.__table__, users, chunk_size) + insert_in_chunks(User.__table__, (
+        {'username': f'student{i}', 'email': f'student{i}@acnsms.com', 'phone': f'+12{i:08d}',
+         'role': 'student', 'password_hash': hashes['student']} for i in range(1, students + 1)
+    ), chunk_size))
+    
+    lecturer_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.role == 'lecturer').order_by(User.id)]
+    student_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.role == 'student').order_by(User.id)]
+    
+    # Modules, each meeting on different weekdays in (weekday, slot, room) cells of its own
+    free_cells = {}
+    for weekday in range(5):
+        free_cells[weekday] = [(weekday, slot, room) for slot in range(len(DATASET_SLOTS)) for room in range(rooms)]
+        rng.shuffle(free_cells[weekday])
+    module_cells = []
+    for _ in range(modules):
+        weekdays = sorted(free_cells, key=lambda day: (-len(free_cells[day]), rng.random()))[:sessions_per_week]
+        module_cells.append([free_cells[weekday].pop() for weekday in sorted(weekdays)])
+    module_lecturers = assign_lecturers(module_cells, lecturers)
+    report('modules', insert_in_chunks(Module.__table__, ({
+        'module_code': f'MOD{index + 1:04d}',
+        'module_name': f'Module {index + 1}',
+        'lecturer_id': lecturer_ids[module_lecturers[index]],
+        'credits': rng.choice([2, 3, 4])
+    } for index in range(modules)), chunk_size))
+    module_ids = [module_id for (module_id,) in db.session.query(Module.id).order_by(Module.id)]
+    
+    # Enrollments: popular modules attract more students
+    cum_weights = list(accumulate(1 / (rank + 1) ** 0.5 for rank in range(modules)))
+    per_student = min(modules_per_student, modules)
+    
+    def enrollments():
+        for student_id in student_ids:
+            chosen = set()
+            while len(chosen) < per_student:
+                chosen.update(rng.choices(range(modules), cum_weights=cum_weights, k=per_student - len(chosen)))
+            for index in sorted(chosen):
+                yield {'student_id': student_id, 'module_id': module_ids[index]}
+    
+    report('enrollments', insert_in_chunks(StudentModule.__table__, enrollments(), chunk_size))
+    
+    # Schedules for the whole period
+    start_date = start_date or date.today()
+    monday = start_date - timedelta(days=start_date.weekday())
+    
+    def schedules():
+        for week in range(weeks):
+            for index, cells_of_module in enumerate(module_cells):
+                for weekday, slot, room in cells_of_module:
+                    start_time, end_time = DATASET_SLOTS[slot]
+                    yield {
+                        'module_id': module_ids[index],
+                        'classroom': f'Room {room + 1:03d}',
+                        'date': monday + timedelta(weeks=week, days=weekday),
+                        'start_time': start_time,
+                        'end_time': end_time,
+                        'status': 'scheduled'
+                    }
+    
+    report('schedules', insert_in_chunks(Schedule.__table__, schedules(), chunk_size))
+    return counts
+
+def generate_database(args):
+    """Create the tables and fill them with a generated dataset (generate command)"""
+    try:
+        with app.app_context():
+            if args.reset:
+                db.drop_all()
+            db.create_all()
+            
+            if User.query.first():
+                print("✗ The database already has users; use --reset to replace all data")
+                return False
+            
+            started = datetime.now()
+            generate_dataset(
+                students=args.students,
+                lecturers=args.lecturers,
+                modules=args.modules,
+                rooms=args.rooms,
+                weeks=args.weeks,
+                modules_per_student=args.modules_per_student,
+                sessions_per_week=args.sessions_per_week,
+                seed=args.seed,
+                chunk_size=args.chunk_size
+            )
+            print(f"✓ Dataset generated in {(datetime.now() - started).total_seconds():.1f}s")
+    except Exception as e:
+        db.session.rollback()
+        print(f"✗ Error generating data: {str(e)}")
+        return False
+    return True
+
+def remove_duplicate_enrollments():
+    """Delete duplicate (student_id, module_id) enrollments, keeping the oldest row"""
+    duplicates = db.session.query(
+        StudentModule.student_id,
+        StudentModule.module_id,
+        func.min(StudentModule.id)
+    ).group_by(
+        StudentModule.student_id, StudentModule.module_id
+    ).having(func.count(StudentModule.id) > 1).all()
+    
+    removed = 0
+    for student_id, module_id, keep_id in duplicates:
+        removed += StudentModule.query.filter(
+            StudentModule.student_id == student_id,
+            StudentModule.module_id == module_id,
+            StudentModule.id != keep_id
+        ).delete(synchronize_session=False)
+    
+    db.session.commit()
+    return removed
+
+def add_missing_columns(inspector):
+    """Add columns declared on the models but missing from existing tables"""
+    added = 0
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+            
+            # Backfill existing rows with scalar Python-side defaults
+            if column.default is not None and column.default.is_scalar:
+                value = column.default.arg
+                if isinstance(value, bool):
+                    value = int(value)
+                ddl += f" DEFAULT {value!r}" if isinstance(value, str) else f" DEFAULT {value}"
+            
+            db.session.execute(text(ddl))
+            db.session.commit()
+            print(f"✓ Added column {table.name}.{column.name}")
+            added += 1
+    
+    return added
+
+def relax_not_null_columns(inspector):
+    """Drop NOT NULL from existing columns that the models now declare nullable"""
+    relaxed = 0
+    dialect = db.engine.dialect.name
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing = {column['name']: column for column in inspector.get_columns(table.name)}
+        
+        for column in table.columns:
+            current = existing.get(column.name)
+            if current is None or current['nullable'] or not column.nullable or column.primary_key:
+                continue
+            
+            if dialect in ('mysql', 'mariadb'):
+                ddl = f"ALTER TABLE {table.name} MODIFY {column.name} {column.type.compile(dialect=db.engine.dialect)} NULL"
+            elif dialect == 'postgresql':
+                ddl = f"ALTER TABLE {table.name} ALTER COLUMN {column.name} DROP NOT NULL"
+            else:
+                print(f"⚠ Column {table.name}.{column.name} should allow NULL; recreate the table to change it")
+                continue
+            
+            db.session.execute(text(ddl))
+            db.session.commit()
+            print(f"✓ Column {table.name}.{column.name} now allows NULL")
+            relaxed += 1
+    
+    return relaxed
+
+def migrate_schema():
+    """
+    Bring an existing database up to date with the models: create new
+    tables, add missing columns, relax NOT NULL where columns became
+    optional and add indexes and unique constraints. Safe to
+    run repeatedly: objects that already exist are skipped.
+    """
+    try:
+        with app.app_context():
+            db.create_all()
+            inspector = inspect(db.engine)
+            add_missing_columns(inspector)
+            relax_not_null_columns(inspector)
+            
+            inspector = inspect(db.engine)
+            created = 0
+            
+            for table in db.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                
+                # MariaDB reports unique constraints as unique indexes
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                existing.update(
+                    constraint['name'] for constraint in inspector.get_unique_constraints(table.name)
+                )
+                
+                for constraint in table.constraints:
+                    if not isinstance(constraint, db.UniqueConstraint) or not constraint.name:
+                        continue
+                    if constraint.name in existing:
+                        continue
+                    
+                    if table.name == StudentModule.__tablename__:
+                        removed = remove_duplicate_enrollments()
+                        if removed:
+                            print(f"✓ Removed {removed} duplicate enrollments")
+                    
+                    columns = ', '.join(column.name for column in constraint.columns)
+                    db.session.execute(text(
+                        f"CREATE UNIQUE INDEX {constraint.name} ON {table.name} ({columns})"
+                    ))
+                    db.session.commit()
+                    print(f"✓ Created unique constraint {constraint.name}")
+                    created += 1
+                
+                for index in table.indexes:
+                    if index.name in existing:
+                        continue
+                    index.create(bind=db.engine)
+                    print(f"✓ Created index {index.name}")
+                    created += 1
+            
+            print(f"✓ Schema migration completed ({created} indexes created)")
+    except Exception as e:
+        db.session.rollback()
+        print(f"✗ Error migrating schema: {str(e)}")
+        return False
+    return True
+
+def hot_queries():
+    """The query shapes issued by app.py on its hot paths, keyed by description"""
+    today = date.today()
+    sample_user = User.query.filter_by(role='student').first()
+    sample_lecturer = User.query.filter_by(role='lecturer').first()
+    sample_module = Module.query.first()
+    module_id = sample_module.id if sample_module else 0
+    
+    feed = schedule_feed_query().filter(
+        Schedule.date >= today, Schedule.date < today + timedelta(days=7)
+    ).order_by(Schedule.date, Schedule.start_time, Schedule.id)
+    
+    queries = {
+        'api_schedules: week window': feed,
+        'api_schedules: classroom': feed.filter(Schedule.classroom == 'Room 101'),
+        'notifications: enrolled students': db.session.query(User.id, User.email, User.phone).join(
+            StudentModule, StudentModule.student_id == User.id
+        ).filter(
+            StudentModule.module_id == module_id, StudentModule.student_id > 0
+        ).order_by(StudentModule.student_id).limit(1000),
+        'notifications: admin users': db.session.query(User.id, User.email, User.phone).filter(
+            User.role == 'admin'
+        ),
+        'notifications by schedule': Notification.query.filter_by(schedule_id=0),
+        'notifications by user': Notification.query.filter_by(user_id=0).order_by(Notification.created_at),
+        'pending notifications': Notification.query.filter_by(status='pending').order_by(Notification.created_at),
+    }
+    if sample_user:
+        queries['api_schedules: student scope'] = scope_schedules_to_user(feed, sample_user)
+    if sample_lecturer:
+        queries['api_schedules: lecturer scope'] = scope_schedules_to_user(feed, sample_lecturer)
+    return queries
+
+def explain_query(query):
+    """Return the database's execution plan for an ORM query"""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return db.session.connection().exec_driver_sql(prefix + str(compiled), params).fetchall()
+
+def explain_hot_queries():
+    """Print EXPLAIN output for every hot query; run before and after migrate to compare"""
+    try:
+        with app.app_context():
+            for name, query in hot_queries().items():
+                print(f"-- {name}")
+                for row in explain_query(query):
+                    print("   " + " | ".join(str(value) for value in row))
+                print()
+    except Exception as e:
+        print(f"✗ Error explaining queries: {str(e)}")
+        return False
+    return True
+
 def setup_database():
     """Complete database setup"""
     print("Setting up ACNSMS database...")
@@ -274,8 +665,35 @@ def setup_database():
     return True
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ACNSMS database setup')
+    parser.add_argument(
+        'command', nargs='?', default='setup', choices=['setup', 'migrate', 'explain', 'generate'],
+        help='setup: create tables and sample data; migrate: add missing tables, columns and indexes; '
+             'explain: print query plans for the hot queries; generate: create a synthetic dataset'
+    )
+    generate = parser.add_argument_group('generate options')
+    generate.add_argument('--students', type=int, default=50000, help='Students to generate')
+    generate.add_argument('--lecturers', type=int, default=800, help='Lecturers to generate')
+    generate.add_argument('--modules', type=int, default=2000, help='Modules to generate')
+    generate.add_argument('--rooms', type=int, default=200, help='Classrooms to use')
+    generate.add_argument('--weeks', type=int, default=15, help='Weeks of classes, starting this week')
+    generate.add_argument('--modules-per-student', type=int, default=5, help='Enrollments per student')
+    generate.add_argument('--sessions-per-week', type=int, default=2, help='Classes per module and week')
+    generate.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+    generate.add_argument('--chunk-size', type=int, default=DATASET_CHUNK_SIZE, help='Rows per INSERT statement')
+    generate.add_argument('--reset', action='store_true', help='Drop all tables first (deletes all data)')
+    args = parser.parse_args()
+    
+    commands = {
+        'setup': setup_database,
+        'migrate': migrate_schema,
+        'explain': explain_hot_queries,
+        'generate': lambda: generate_database(args),
+    }
+    
     try:
-        setup_database()
+        if not commands[args.command]():
+            sys.exit(1)
     except KeyboardInterrupt:
         print("\n\nSetup interrupted by user")
         sys.exit(1)
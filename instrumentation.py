@@ -0,0 +1,203 @@
+"""
+SQL instrumentation for ACNSMS
+Counts the queries and database time of every request via SQLAlchemy engine events
+
+Each request records its statement count, total DB time and slowest
+statements. Statements that repeat with different parameters within one
+request (the N+1 pattern, e.g. a lazy-loaded relationship per row) are
+flagged. Per-endpoint totals are kept for /api/debug/queries and /metrics.
+Parameters are never recorded, only the statement text.
+"""
+
+import heapq
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class RequestQueryStats:
+    """Queries executed while handling one request"""
+    
+    def __init__(self, endpoint, top_statements):
+        self.endpoint = endpoint
+        self.top_statements = top_statements
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = Counter()  # statement text -> executions
+        self._slowest = []  # min-heap of (duration, statement)
+    
+    def record(self, statement, duration):
+        self.count += 1
+        self.db_time += duration
+        self.statements[statement] += 1
+        if len(self._slowest) < self.top_statements:
+            heapq.heappush(self._slowest, (duration, statement))
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (duration, statement))
+    
+    def slowest(self):
+        """(duration, statement) pairs, slowest first"""
+        return sorted(self._slowest, reverse=True)
+    
+    def repeated(self, threshold):
+        """Statements executed at least threshold times, with their counts"""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+class EndpointQueryStats:
+    """Running totals of the requests to one endpoint"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.n_plus_one = 0
+    
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'queries_per_request': round(self.queries / self.requests, 2) if self.requests else 0.0,
+            'db_time_ms': round(self.db_time * 1000, 2),
+            'db_time_per_request_ms': round(self.db_time * 1000 / self.requests, 2) if self.requests else 0.0,
+            'max_queries': self.max_queries,
+            'n_plus_one_requests': self.n_plus_one
+        }
+
+class SQLInstrumentation:
+    """
+    Per-request query counting and slow-query reporting for a Flask app
+    
+    Engine events are registered on the Engine class, so every engine is
+    covered without an app context. Statements outside a request (workers,
+    CLI scripts) are ignored unless the code runs inside track().
+    """
+    
+    def __init__(self, slow_query_ms=100, n_plus_one_threshold=5, top_statements=3, debug_headers=None):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.top_statements = top_statements
+        self.debug_headers = debug_headers  # None: follow app.debug
+        self._local = threading.local()
+        self._endpoints = {}  # endpoint -> EndpointQueryStats
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Register the engine events and request hooks"""
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._add_headers)
+        app.teardown_request(self._finish_request)
+    
+    def current(self):
+        """Stats of the request being handled by this thread, or None"""
+        return getattr(self._local, 'stats', None)
+    
+    @contextmanager
+    def track(self, name):
+        """
+        Count the statements this thread executes outside a request
+        
+        Args:
+            name (str): Label of the work, in place of the endpoint
+        
+        Yields:
+            RequestQueryStats: Filled in while the block runs; not added to the endpoint totals
+        """
+        previous = self.current()
+        stats = self._local.stats = RequestQueryStats(name, self.top_statements)
+        try:
+            yield stats
+        finally:
+            self._local.stats = previous
+    
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current() is not None:
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+    
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        started = conn.info.get('query_started')
+        if stats is None or not started:
+            return
+        
+        duration = time.perf_counter() - started.pop()
+        stats.record(statement, duration)
+        if duration >= self.slow_query_seconds:
+            print(f"Slow query ({duration * 1000:.1f} ms) in {stats.endpoint}: {' '.join(statement.split())[:500]}")
+    
+    def _start_request(self):
+        self._local.stats = RequestQueryStats(request.endpoint or 'unknown', self.top_statements)
+    
+    def _add_headers(self, response):
+        stats = self.current()
+        debug = self.debug_headers if self.debug_headers is not None else current_app.debug
+        if stats is not None and debug:
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Time-Ms'] = f"{stats.db_time * 1000:.2f}"
+            response.headers.add('Server-Timing', f'db;dur={stats.db_time * 1000:.2f};desc="{stats.count} queries"')
+            repeated = stats.repeated(self.n_plus_one_threshold)
+            if repeated:
+                response.headers['X-DB-Repeated-Statements'] = str(len(repeated))
+        return response
+    
+    def _finish_request(self, exc=None):
+        stats = self.current()
+        self._local.stats = None
+        if stats is None:
+            return
+        
+        repeated = stats.repeated(self.n_plus_one_threshold)
+        with self._lock:
+            totals = self._endpoints.get(stats.endpoint)
+            if totals is None:
+                totals = self._endpoints[stats.endpoint] = EndpointQueryStats()
+            totals.requests += 1
+            totals.queries += stats.count
+            totals.db_time += stats.db_time
+            totals.max_queries = max(totals.max_queries, stats.count)
+            if repeated:
+                totals.n_plus_one += 1
+        
+        for statement, count in repeated:
+            print(f"Possible N+1 in {stats.endpoint}: statement executed {count} times: "
+                  f"{' '.join(statement.split())[:200]}")
+        
+        if self.debug_headers or (self.debug_headers is None and current_app.debug):
+            slowest = '; '.join(f"{duration * 1000:.1f} ms {' '.join(statement.split())[:80]}"
+                                for duration, statement in stats.slowest())
+            print(f"{request.method} {request.path} ({stats.endpoint}): {stats.count} queries, "
+                  f"{stats.db_time * 1000:.1f} ms in the database" + (f"; slowest: {slowest}" if slowest else ""))
+    
+    def endpoint_stats(self):
+        """Totals per endpoint, heaviest total database time first"""
+        with self._lock:
+            items = [(endpoint, totals.as_dict()) for endpoint, totals in self._endpoints.items()]
+        return dict(sorted(items, key=lambda item: item[1]['db_time_ms'], reverse=True))
+    
+    def reset(self):
+        """Clear the per-endpoint totals"""
+        with self._lock:
+            self._endpoints.clear()
+
+def create_sql_instrumentation():
+    """
+    Create the instrumentation configured by the environment
+    
+    SQL_SLOW_QUERY_MS: log statements slower than this (default 100)
+    SQL_N_PLUS_ONE_THRESHOLD: flag statements repeated this often in one request (default 5)
+    SQL_DEBUG_HEADERS: 1/0 to force the debug headers and per-request log lines on or off (default: app.debug)
+    """
+    debug_headers = os.getenv('SQL_DEBUG_HEADERS', '')
+    return SQLInstrumentation(
+        slow_query_ms=float(os.getenv('SQL_SLOW_QUERY_MS', 100)),
+        n_plus_one_threshold=int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5)),
+        top_statements=int(os.getenv('SQL_TOP_STATEMENTS', 3)),
+        debug_headers=debug_headers.lower() in ('1', 'true', 'yes') if debug_headers else None
+    )
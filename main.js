@@ -138,6 +138,39 @@ function loadSchedules() {
         });
 }
 
+// Live schedule updates pushed by the server (Server-Sent Events)
+function subscribeToScheduleUpdates(calendar) {
+    if (!window.EventSource) {
+        return null;
+    }
+    
+    const source = new EventSource('/api/schedules/stream');
+    
+    const applyChange = function(e) {
+        const schedule = JSON.parse(e.data);
+        const existing = calendar.getEventById(String(schedule.id));
+        if (existing) {
+            existing.remove();
+        }
+        if (e.type !== 'cancelled') {
+            // Add to the feed source so the next refetch replaces it instead of duplicating it
+            calendar.addEvent(schedule, calendar.getEventSources()[0]);
+        }
+        if (e.type === 'rescheduled') {
+            showNotification('A class in your schedule has been rescheduled.', 'warning');
+        } else if (e.type === 'cancelled') {
+            showNotification('A class in your schedule has been cancelled.', 'warning');
+        }
+    };
+    
+    ['created', 'rescheduled', 'cancelled'].forEach(type => source.addEventListener(type, applyChange));
+    
+    // Changes were missed (e.g. after a server restart): reload the visible range
+    source.addEventListener('resync', () => calendar.refetchEvents());
+    
+    return source;
+}
+
 // Date and time helpers
 function formatDate(dateString) {
     const date = new Date(dateString);
@@ -0,0 +1,498 @@
+"""
+Prometheus metrics for ACNSMS
+In-process counters, gauges and histograms rendered in the Prometheus text format
+
+Recording a value only takes a lock and a dict update. With
+METRICS_MULTIPROC_DIR set, every process (gunicorn workers, the
+notification and calendar sync workers) periodically writes its values to
+its own file in that directory, and /metrics adds up the files of all
+processes. Counters and histograms of exited processes are folded into
+an archive file so they keep counting; gauges only count while their
+process is alive.
+"""
+
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Summed counters and histograms of exited processes in the multiprocess directory
+ARCHIVE_FILENAME = 'archive.json'
+
+class Metric:
+    """A named metric family with a fixed set of label names"""
+    
+    kind = None
+    
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+    
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError as e:
+            raise ValueError(f"{self.name} is missing label {e}") from e
+    
+    def _snapshot(self):
+        return {
+            'type': self.kind,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'samples': [[list(key), value] for key, value in self._values.items()]
+        }
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry._updating():
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.maybe_flush()
+
+class Gauge(Metric):
+    """Value that can go up and down; summed over the live processes"""
+    
+    kind = 'gauge'
+    
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry._updating():
+            self._values[key] = value
+        self.registry.maybe_flush()
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry._updating():
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.maybe_flush()
+    
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry._updating():
+            # Per-bucket counts (the last one is +Inf) followed by the sum
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            values[index] += 1
+            values[-1] += value
+        self.registry.maybe_flush()
+    
+    @contextmanager
+    def timer(self, **labels):
+        """Observe the duration of a with-block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def _snapshot(self):
+        snapshot = super()._snapshot()
+        snapshot['buckets'] = list(self.buckets)
+        return snapshot
+
+class MetricsRegistry:
+    """
+    Metrics of one process, optionally shared with other processes through files
+    
+    Samplers are called before every snapshot to set gauges from state that
+    is cheaper to read than to track (connection pools, cache counters).
+    Collectors are called only when rendering, in the scraping process, for
+    values that are the same from every process (e.g. queue depths read from
+    the database).
+    """
+    
+    def __init__(self, multiproc_dir=None, flush_interval=1.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._metrics = {}  # name -> Metric, in registration order
+        self._samplers = []
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._start_pid = None
+        self._start = None
+        self._last_flush = 0.0
+    
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, *args, **kwargs)
+            return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+    
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+    
+    def add_sampler(self, sampler):
+        """Register a callable run before every snapshot"""
+        self._samplers.append(sampler)
+    
+    def add_collector(self, collector):
+        """
+        Register a callable run when rendering
+        
+        The collector returns (name, type, help, samples) tuples, where samples
+        is a list of (labels dict, value) pairs.
+        """
+        self._collectors.append(collector)
+    
+    @contextmanager
+    def _updating(self):
+        """Hold the lock, first dropping values inherited from the parent of a forked process"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._last_flush = 0.0
+                for metric in self._metrics.values():
+                    metric._values.clear()
+            yield
+    
+    def _sample(self):
+        for sampler in self._samplers:
+            try:
+                sampler()
+            except Exception as e:
+                print(f"Metrics sampler failed: {str(e)}")
+    
+    def snapshot(self):
+        """Current values of this process as a JSON-serializable dict"""
+        self._sample()
+        with self._updating():
+            return {name: metric._snapshot() for name, metric in self._metrics.items()}
+    
+    def maybe_flush(self):
+        """Write this process's values if the flush interval has passed"""
+        if self.multiproc_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def _process_filename(self):
+        """File name of this process: pid plus start time, so a reused pid gets a new file"""
+        pid = os.getpid()
+        if self._start_pid != pid:
+            self._start_pid = pid
+            self._start = process_start_time(pid) or f"t{time.time_ns()}"
+        return f"metrics_{pid}_{self._start}.json"
+    
+    def flush(self):
+        """Write this process's values to its file in the multiprocess directory"""
+        if not self.multiproc_dir or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = time.monotonic()
+            snapshot = self.snapshot()
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            write_json_atomic(os.path.join(self.multiproc_dir, self._process_filename()), snapshot)
+        except OSError as e:
+            print(f"Failed to write metrics: {str(e)}")
+        finally:
+            self._flush_lock.release()
+    
+    def _process_snapshots(self):
+        """
+        Snapshots of the running processes, plus the archive of exited ones
+        
+        Counters and histograms of exited processes are folded into one
+        archive file and their files removed, so the directory doesn't grow
+        with every worker restart. Their gauges are dropped.
+        """
+        if not self.multiproc_dir:
+            return [self.snapshot()]
+        
+        self.flush()
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        archive_path = os.path.join(self.multiproc_dir, ARCHIVE_FILENAME)
+        
+        # Concurrent scrapes must not archive the same file twice
+        with directory_lock(self.multiproc_dir):
+            archive = read_json(archive_path) or {}
+            running = []
+            exited = []
+            for filename in os.listdir(self.multiproc_dir):
+                process = parse_process_filename(filename)
+                if process is None:
+                    continue
+                path = os.path.join(self.multiproc_dir, filename)
+                snapshot = read_json(path)
+                if snapshot is None:
+                    continue
+                if process_running(*process):
+                    running.append(snapshot)
+                else:
+                    exited.append((path, snapshot))
+            
+            if exited:
+                archive = merge_snapshots([archive] + [snapshot for _, snapshot in exited], include_gauges=False)
+                write_json_atomic(archive_path, archive)
+                for path, _ in exited:
+                    os.unlink(path)
+        
+        return [archive] + running
+    
+    def collect(self):
+        """
+        Metric families of all processes, merged
+        
+        Returns:
+            list: (name, type, help, samples, buckets) tuples; samples are
+            (labels dict, value) pairs, with (bucket counts, sum) values for
+            histograms
+        """
+        families = merge_snapshots(self._process_snapshots())
+        
+        result = []
+        for name, family in families.items():
+            samples = [(dict(zip(family['labelnames'], key)), value) for key, value in family['samples']]
+            if family['type'] == 'histogram':
+                samples = [(labels, (value[:-1], value[-1])) for labels, value in samples]
+            result.append((name, family['type'], family['help'], samples, family['buckets']))
+        
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, samples in collector():
+                    result.append((name, kind, documentation, samples, None))
+            except Exception as e:
+                print(f"Metrics collector failed: {str(e)}")
+        
+        return result
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, kind, documentation, samples, buckets in self.collect():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != 'histogram':
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                    continue
+                
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else format_value(bound)
+                    lines.append(f"{name}_bucket{format_labels(dict(labels, le=le))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+def merge_snapshots(snapshots, include_gauges=True):
+    """
+    Add up process snapshots
+    
+    Returns:
+        dict: A snapshot with the summed values of every label set
+    """
+    families = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            if family['type'] == 'gauge' and not include_gauges:
+                continue
+            merged = families.setdefault(name, {
+                'type': family['type'],
+                'help': family['help'],
+                'labelnames': family['labelnames'],
+                'buckets': family.get('buckets'),
+                'samples': {}
+            })
+            if merged['type'] != family['type'] or merged['buckets'] != family.get('buckets'):
+                continue  # definition changed between deployments
+            
+            samples = merged['samples']
+            for key, value in family['samples']:
+                key = tuple(key)
+                if merged['type'] == 'histogram':
+                    previous = samples.get(key)
+                    samples[key] = value if previous is None else [a + b for a, b in zip(previous, value)]
+                else:
+                    samples[key] = samples.get(key, 0) + value
+    
+    for family in families.values():
+        family['samples'] = [[list(key), value] for key, value in family['samples'].items()]
+    return families
+
+def read_json(path):
+    """Parsed contents of a JSON file, or None if it is missing or unreadable"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json_atomic(path, data):
+    """Write and rename so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.metrics_', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+@contextmanager
+def directory_lock(directory):
+    """Exclusive lock shared by every process using the directory (no-op where fcntl is unavailable)"""
+    with open(os.path.join(directory, '.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def parse_process_filename(filename):
+    """(pid, start time or None) of a per-process metrics file name, or None for other files"""
+    if not (filename.startswith('metrics_') and filename.endswith('.json')):
+        return None
+    pid, _, start = filename[len('metrics_'):-len('.json')].partition('_')
+    try:
+        return int(pid), start or None
+    except ValueError:
+        return None
+
+def process_start_time(pid):
+    """Start time of a process in clock ticks since boot, or None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 22 (starttime); the command name in field 2 may contain spaces, so count after it
+    return stat.rsplit(')', 1)[1].split()[19]
+
+def process_running(pid, start):
+    """Whether the process that wrote a metrics file is still running (and its pid not reused)"""
+    if not pid_alive(pid):
+        return False
+    if start is None or start.startswith('t'):
+        return True
+    current = process_start_time(pid)
+    return current is None or current == start
+
+def pid_alive(pid):
+    """Whether a process with this id is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + '}'
+
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def create_registry():
+    """
+    Create the registry configured by the environment
+    
+    METRICS_MULTIPROC_DIR: directory shared by all processes (empty: this process only)
+    METRICS_FLUSH_INTERVAL: seconds between writes of a process's file (default 1)
+    """
+    registry = MetricsRegistry(
+        multiproc_dir=os.getenv('METRICS_MULTIPROC_DIR') or None,
+        flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+    )
+    atexit.register(registry.flush)
+    return registry
+
+registry = create_registry()
+
+# Web requests
+http_requests = registry.counter(
+    'acnsms_http_requests_total', 'HTTP requests handled', ('endpoint', 'method', 'status')
+)
+http_request_duration = registry.histogram(
+    'acnsms_http_request_duration_seconds', 'Time to handle an HTTP request', ('endpoint', 'method')
+)
+
+# Database
+db_pool_connections = registry.gauge(
+    'acnsms_db_pool_connections', 'Database pool connections by state', ('state',)
+)
+db_queries = registry.counter(
+    'acnsms_db_queries_total', 'SQL statements executed by requests', ('endpoint',)
+)
+db_query_seconds = registry.counter(
+    'acnsms_db_query_seconds_total', 'Time requests spent executing SQL statements', ('endpoint',)
+)
+db_n_plus_one_requests = registry.counter(
+    'acnsms_db_n_plus_one_requests_total', 'Requests that repeated a statement often enough to look like N+1',
+    ('endpoint',)
+)
+
+# Schedule cache
+cache_operations = registry.counter(
+    'acnsms_cache_operations_total', 'Schedule cache hits, misses, sets, evictions and invalidations', ('operation',)
+)
+cache_entries = registry.gauge('acnsms_cache_entries', 'Entries in the in-process schedule caches')
+
+# Notifications
+notification_send_duration = registry.histogram(
+    'acnsms_notification_send_duration_seconds',
+    'Time of one provider call (an SMTP transaction or an SMS attempt)', ('channel',)
+)
+notification_deliveries = registry.counter(
+    'acnsms_notification_deliveries_total', 'Notification deliveries per recipient', ('channel', 'result')
+)
+
+# Google Calendar
+calendar_api_duration = registry.histogram(
+    'acnsms_calendar_api_duration_seconds', 'Google Calendar API call latency', ('operation',)
+)
+calendar_api_errors = registry.counter(
+    'acnsms_calendar_api_errors_total', 'Failed Google Calendar API calls and batch operations',
+    ('operation', 'status')
+)
@@ -7,20 +7,271 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import os
+import queue
+import random
+import threading
+import time
 from dotenv import load_dotenv
+from metrics import notification_deliveries, notification_send_duration
 
 load_dotenv()
 
+class PooledSMTPConnection:
+    """An authenticated SMTP connection checked out of an SMTPConnectionPool"""
+    
+    def __init__(self, server):
+        self.server = server
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+    
+    def sendmail(self, from_addr, to_addrs, msg):
+        """Send a message and count it against the per-connection limit"""
+        refused = self.server.sendmail(from_addr, to_addrs, msg)
+        self.messages_sent += 1
+        self.last_used = time.monotonic()
+        return refused
+    
+    def close(self):
+        """Close the connection, ignoring errors from an already dropped socket"""
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+class SMTPConnectionPool:
+    """
+    Bounded pool of authenticated, reusable SMTP connections
+    
+    Connections are opened lazily, reused across messages and recycled after
+    max_messages sends or max_idle seconds without use. A connection that has
+    been idle for more than health_check_interval seconds is probed with NOOP
+    before reuse, and a send that fails because the server dropped the
+    connection is retried once on a fresh one.
+    """
+    
+    # Errors after which the connection is still usable (smtplib resets the transaction)
+    RECOVERABLE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+    
+    # Errors caused by a stale or dropped connection
+    DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+    
+    def __init__(self, host, port, username=None, password=None, use_tls=True, max_size=4,
+                 max_messages=100, max_idle=60, health_check_interval=10, timeout=30,
+                 smtp_factory=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory or smtplib.SMTP
+        
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+    
+    def _connect(self):
+        """Open, secure and authenticate a new connection"""
+        server = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        return PooledSMTPConnection(server)
+    
+    def _is_healthy(self, connection):
+        """Check that a reused connection is still accepted by the server"""
+        idle_for = time.monotonic() - connection.last_used
+        if idle_for > self.max_idle:
+            return False
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            return connection.server.noop()[0] == 250
+        except Exception:
+            return False
+    
+    def _checkout(self, fresh=False):
+        """Take a healthy idle connection, or open a new one"""
+        while not fresh:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(connection):
+                return connection
+            connection.close()
+        return self._connect()
+    
+    @contextmanager
+    def connection(self, fresh=False):
+        """
+        Check out a connection for the duration of a with-block
+        
+        Args:
+            fresh (bool): Skip idle connections and open a new one
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise smtplib.SMTPException("Timed out waiting for a pooled SMTP connection")
+        
+        connection = None
+        try:
+            connection = self._checkout(fresh)
+            yield connection
+        except Exception as e:
+            if connection and not isinstance(e, self.RECOVERABLE_ERRORS):
+                connection.close()
+                connection = None
+            raise
+        finally:
+            if connection:
+                if connection.messages_sent >= self.max_messages:
+                    connection.close()
+                else:
+                    self._idle.put(connection)
+            self._slots.release()
+    
+    def sendmail(self, from_addr, to_addrs, msg):
+        """
+        Send a message over a pooled connection
+        
+        Returns:
+            dict: Recipients refused by the server, as returned by smtplib
+        """
+        try:
+            with self.connection() as connection:
+                return connection.sendmail(from_addr, to_addrs, msg)
+        except self.DISCONNECT_ERRORS:
+            with self.connection(fresh=True) as connection:
+                return connection.sendmail(from_addr, to_addrs, msg)
+    
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` operations per second with bursts up to `capacity`
+    
+    clock and sleep default to time.monotonic and time.sleep; tests pass a fake clock.
+    """
+    
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        if capacity is not None and capacity < 1:
+            raise ValueError(f"Token bucket capacity must be at least 1, got {capacity}")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available and consume it"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now and wait for it once; retrying after the sleep could spin
+            # forever on a rounding shortfall and lets later callers overtake earlier ones
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            self.sleep(wait)
+
+class SMSTransportError(Exception):
+    """Raised by an SMSTransport when the provider rejects or fails a message"""
+    
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+    
+    @property
+    def retryable(self):
+        """Throttling (429), provider errors (5xx) and network errors are worth retrying"""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+class SMSTransport(ABC):
+    """Interface for SMS providers used by NotificationService"""
+    
+    @abstractmethod
+    def send(self, to_phone, message):
+        """
+        Send one SMS
+        
+        Args:
+            to_phone (str): Recipient phone number (with country code)
+            message (str): SMS message body
+        
+        Returns:
+            str: Provider message id
+        
+        Raises:
+            SMSTransportError: If the message was not accepted
+        """
+
+class TwilioSMSTransport(SMSTransport):
+    """SMS transport backed by the Twilio REST API"""
+    
+    def __init__(self, client, from_number):
+        self.client = client
+        self.from_number = from_number
+    
+    def send(self, to_phone, message):
+        try:
+            result = self.client.messages.create(
+                body=message,
+                from_=self.from_number,
+                to=to_phone
+            )
+            return result.sid
+        except TwilioRestException as e:
+            raise SMSTransportError(str(e), status=e.status) from e
+        except OSError as e:
+            raise SMSTransportError(str(e)) from e
+
 class NotificationService:
     """Service class for handling notifications"""
     
-    def __init__(self):
+    def __init__(self, sms_transport=None):
         # Email configuration
         self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
         self.smtp_port = int(os.getenv('SMTP_PORT', 587))
         self.email_user = os.getenv('EMAIL_USER')
         self.email_password = os.getenv('EMAIL_PASSWORD')
+        self.smtp_use_tls = os.getenv('SMTP_USE_TLS', 'true').lower() != 'false'
+        
+        # Reusable SMTP connections shared by all sends from this service
+        self.smtp_pool = SMTPConnectionPool(
+            host=self.smtp_server,
+            port=self.smtp_port,
+            username=self.email_user,
+            password=self.email_password,
+            use_tls=self.smtp_use_tls,
+            max_size=int(os.getenv('SMTP_POOL_SIZE', 4)),
+            max_messages=int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', 100)),
+            max_idle=int(os.getenv('SMTP_POOL_MAX_IDLE', 60))
+        )
+        
+        # Recipients per SMTP transaction in send_batch_email
+        self.email_batch_size = int(os.getenv('SMTP_BATCH_SIZE', 50))
         
         # Twilio configuration for SMS
         self.twilio_account_sid = os.getenv('TWILIO_ACCOUNT_SID')
@@ -32,7 +283,24 @@ class NotificationService:
             self.twilio_client = Client(self.twilio_account_sid, self.twilio_auth_token)
         else:
             self.twilio_client = None
+        
+        # SMS transport; a custom transport (e.g. a local fake) replaces Twilio
+        if sms_transport:
+            self.sms_transport = sms_transport
+        elif self.twilio_client:
+            self.sms_transport = TwilioSMSTransport(self.twilio_client, self.twilio_phone_number)
+        else:
+            self.sms_transport = None
             print("Warning: Twilio credentials not found. SMS functionality disabled.")
+        
+        # Provider throughput cap (messages per second) shared by all SMS sends; 0 disables it
+        sms_rate_limit = float(os.getenv('SMS_RATE_LIMIT', 10))
+        if sms_rate_limit < 0:
+            raise ValueError(f"SMS_RATE_LIMIT must be 0 (unlimited) or a positive number of messages per second, got {sms_rate_limit}")
+        self.sms_rate_limiter = TokenBucket(sms_rate_limit) if sms_rate_limit else None
+        self.sms_max_workers = int(os.getenv('SMS_MAX_WORKERS', 8))
+        self.sms_max_retries = int(os.getenv('SMS_MAX_RETRIES', 3))
+        self.sms_retry_backoff = float(os.getenv('SMS_RETRY_BACKOFF', 0.5))
     
     def send_email(self, to_email, subject, message):
         """
@@ -56,22 +324,86 @@ class NotificationService:
             # Attach message body
             msg.attach(MIMEText(message, 'plain'))
             
-            # Connect to server and send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()  # Enable TLS encryption
-            server.login(self.email_user, self.email_password)
-            
-            text = msg.as_string()
-            server.sendmail(self.email_user, to_email, text)
-            server.quit()
+            # Send over a pooled, already authenticated connection
+            with notification_send_duration.timer(channel='email'):
+                self.smtp_pool.sendmail(self.email_user, [to_email], msg.as_string())
             
             print(f"Email sent successfully to {to_email}")
+            notification_deliveries.inc(channel='email', result='success')
             return True
             
         except Exception as e:
             print(f"Failed to send email to {to_email}: {str(e)}")
+            notification_deliveries.inc(channel='email', result='failure')
             return False
     
+    def send_batch_email(self, recipients, subject, message, chunk_size=None):
+        """
+        Send one identical email to many recipients
+        
+        The message is rendered once and delivered as BCC in chunks, one SMTP
+        transaction (multiple RCPT TO) per chunk. Recipients refused by the
+        server, or every recipient of a chunk that failed outright, are
+        retried individually with send_email.
+        
+        Args:
+            recipients (list): List of email addresses
+            subject (str): Email subject
+            message (str): Email message body
+            chunk_size (int): Recipients per transaction (default SMTP_BATCH_SIZE)
+        
+        Returns:
+            dict: Results with success/failure counts and a per-recipient report
+        """
+        results = {'success': 0, 'failed': 0, 'errors': [], 'results': []}
+        chunk_size = chunk_size or self.email_batch_size
+        
+        # Render once; recipients only appear in the envelope (BCC)
+        msg = MIMEMultipart()
+        msg['From'] = self.email_user
+        msg['To'] = self.email_user
+        msg['Subject'] = subject
+        msg.attach(MIMEText(message, 'plain'))
+        text = msg.as_string()
+        
+        def record(email, success, error=None):
+            results['results'].append({'to': email, 'success': success, 'error': error})
+            if success:
+                results['success'] += 1
+            else:
+                results['failed'] += 1
+                results['errors'].append(f"Failed to send to {email}")
+        
+        for start in range(0, len(recipients), chunk_size):
+            chunk = recipients[start:start + chunk_size]
+            
+            try:
+                with notification_send_duration.timer(channel='email'):
+                    refused = self.smtp_pool.sendmail(self.email_user, chunk, text)
+            except smtplib.SMTPRecipientsRefused as e:
+                refused = e.recipients
+            except Exception as e:
+                print(f"Batch email to {len(chunk)} recipients failed, sending individually: {str(e)}")
+                refused = {email: None for email in chunk}
+            
+            for email in chunk:
+                if email not in refused:
+                    record(email, True)
+            # Refused recipients are counted by send_email below
+            notification_deliveries.inc(len(chunk) - len(refused), channel='email', result='success')
+            
+            # Fall back to individual sends only for the rejected recipients
+            for email in refused:
+                record(email, self.send_email(email, subject, message))
+            
+            print(f"Batch email sent to {len(chunk) - len(refused)} of {len(chunk)} recipients")
+        
+        return results
+    
+    def close(self):
+        """Close pooled SMTP connections"""
+        self.smtp_pool.close()
+    
     def send_sms(self, to_phone, message):
         """
         Send SMS notification
@@ -83,24 +415,49 @@ class NotificationService:
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            if not self.twilio_client:
-                print("SMS service not configured")
-                return False
-            
-            # Send SMS using Twilio
-            message = self.twilio_client.messages.create(
-                body=message,
-                from_=self.twilio_phone_number,
-                to=to_phone
-            )
-            
-            print(f"SMS sent successfully to {to_phone}. Message SID: {message.sid}")
-            return True
+        return self._deliver_sms(to_phone, message)['success']
+    
+    def _deliver_sms(self, to_phone, message):
+        """
+        Send one SMS under the rate limit, retrying throttled and failed requests with backoff
+        
+        Returns:
+            dict: Per-recipient result with to, success, sid, attempts and error
+        """
+        result = {'to': to_phone, 'success': False, 'sid': None, 'attempts': 0, 'error': None}
+        
+        if not self.sms_transport:
+            print("SMS service not configured")
+            result['error'] = 'SMS service not configured'
+            notification_deliveries.inc(channel='sms', result='failure')
+            return result
+        
+        for attempt in range(1, self.sms_max_retries + 2):
+            if self.sms_rate_limiter:
+                self.sms_rate_limiter.acquire()
+            result['attempts'] = attempt
             
-        except Exception as e:
-            print(f"Failed to send SMS to {to_phone}: {str(e)}")
-            return False
+            try:
+                with notification_send_duration.timer(channel='sms'):
+                    result['sid'] = self.sms_transport.send(to_phone, message)
+                result['success'] = True
+                result['error'] = None
+                print(f"SMS sent successfully to {to_phone}. Message SID: {result['sid']}")
+                notification_deliveries.inc(channel='sms', result='success')
+                return result
+            except SMSTransportError as e:
+                result['error'] = str(e)
+                if not e.retryable or attempt > self.sms_max_retries:
+                    break
+                # Exponential backoff with jitter
+                time.sleep(self.sms_retry_backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+            except Exception as e:
+                result['error'] = str(e)
+                break
+        
+        print(f"Failed to send SMS to {to_phone}: {result['error']}")
+        notification_deliveries.inc(channel='sms', result='failure')
+        return result
     
     def send_bulk_email(self, recipients, subject, message):
         """
@@ -127,22 +484,24 @@ class NotificationService:
     
     def send_bulk_sms(self, recipients, message):
         """
-        Send SMS to multiple recipients
+        Send SMS to multiple recipients concurrently, staying under SMS_RATE_LIMIT
         
         Args:
             recipients (list): List of phone numbers
             message (str): SMS message body
         
         Returns:
-            dict: Results with success/failure counts
+            dict: Results with success/failure counts and a per-recipient report
         """
-        results = {'success': 0, 'failed': 0, 'errors': []}
+        results = {'success': 0, 'failed': 0, 'errors': [], 'results': []}
         
-        for phone in recipients:
-            if self.send_sms(phone, message):
-                results['success'] += 1
-            else:
-                results['failed'] += 1
-                results['errors'].append(f"Failed to send to {phone}")
+        with ThreadPoolExecutor(max_workers=self.sms_max_workers) as executor:
+            for result in executor.map(lambda phone: self._deliver_sms(phone, message), recipients):
+                results['results'].append(result)
+                if result['success']:
+                    results['success'] += 1
+                else:
+                    results['failed'] += 1
+                    results['errors'].append(f"Failed to send to {result['to']}: {result['error']}")
         
         return results
\ No newline at end of file
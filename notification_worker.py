@@ -0,0 +1,274 @@
+"""
+Notification worker for ACNSMS
+Delivers the pending notifications queued by the web application
+
+Run this script alongside the web server:
+    python notification_worker.py --workers 8 --batch-size 100
+"""
+
+from app import app, db, Notification, Schedule, notification_service
+from metrics import registry as metrics_registry
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+import argparse
+import sys
+import time
+
+class NotificationWorker:
+    """
+    Claims pending notifications in batches and delivers them concurrently
+    
+    Delivery is at-least-once: a row is marked 'processing' before it is sent
+    and 'sent' only after the send returns, so a worker that dies in between
+    leaves the row to be sent again once its lease expires.
+    """
+    
+    def __init__(self, batch_size=100, workers=8, lease_seconds=300, max_attempts=3, retry_base=60):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+    
+    def recover_stale_claims(self):
+        """
+        Return notifications stuck in 'processing' to the queue
+        
+        A claim older than the lease means the worker that took it died
+        before recording the outcome.
+        
+        Returns:
+            int: Number of notifications released
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        released = Notification.query.filter(
+            Notification.status == 'processing',
+            Notification.claimed_at < cutoff
+        ).update({'status': 'pending', 'claimed_at': None}, synchronize_session=False)
+        db.session.commit()
+        
+        if released:
+            print(f"Released {released} stale notification claims")
+        return released
+    
+    def claim_batch(self):
+        """
+        Mark a batch of pending notifications as 'processing'
+        
+        Rows locked by another worker are skipped, so several workers can
+        poll the same table. Rows waiting out a retry backoff are left alone.
+        
+        Returns:
+            list: Claimed Notification ids
+        """
+        now = datetime.utcnow()
+        notifications = Notification.query.filter(
+            Notification.status == 'pending',
+            or_(Notification.next_attempt_at.is_(None), Notification.next_attempt_at <= now)
+        ).order_by(
+            Notification.created_at, Notification.id
+        ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+        
+        for notification in notifications:
+            notification.status = 'processing'
+            notification.claimed_at = now
+            notification.attempts = (notification.attempts or 0) + 1
+        
+        ids = [notification.id for notification in notifications]
+        db.session.commit()
+        return ids
+    
+    def load_deliveries(self, ids):
+        """Build plain delivery tuples so worker threads never touch the session"""
+        notifications = Notification.query.options(
+            joinedload(Notification.user),
+            joinedload(Notification.broadcast),
+            joinedload(Notification.schedule).joinedload(Schedule.module)
+        ).filter(Notification.id.in_(ids)).all()
+        
+        deliveries = []
+        for notification in notifications:
+            if notification.notification_type == 'email':
+                address = notification.user.email
+            else:
+                address = notification.user.phone
+            
+            if notification.broadcast:
+                subject = notification.broadcast.subject
+                message = notification.broadcast.body
+            else:
+                # Rows queued before messages were stored once per broadcast
+                subject = f"Lecture Rescheduled: {notification.schedule.module.module_code}"
+                message = notification.message
+            
+            deliveries.append((notification.id, notification.notification_type, address, subject, message))
+        return deliveries
+    
+    def deliver_sms(self, delivery):
+        """Send a single SMS; runs on a pool thread"""
+        notification_id, notification_type, address, subject, message = delivery
+        
+        if not address:
+            return [(notification_id, False)]
+        return [(notification_id, notification_service.send_sms(address, message))]
+    
+    def deliver_email_group(self, subject, message, deliveries):
+        """Send one identical email to a group of recipients in a single batch; runs on a pool thread"""
+        ids_by_address = {}
+        outcomes = []
+        
+        for notification_id, notification_type, address, _, _ in deliveries:
+            if address:
+                ids_by_address.setdefault(address, []).append(notification_id)
+            else:
+                outcomes.append((notification_id, False))
+        
+        if ids_by_address:
+            report = notification_service.send_batch_email(list(ids_by_address), subject, message)
+            for result in report['results']:
+                for notification_id in ids_by_address[result['to']]:
+                    outcomes.append((notification_id, result['success']))
+        
+        return outcomes
+    
+    def dispatch(self, deliveries):
+        """
+        Deliver a batch concurrently: identical emails are grouped into one
+        batch send, SMS are sent one per task. A task that raises fails only
+        its own notifications.
+        
+        Returns:
+            list: (notification_id, success) tuples
+        """
+        email_groups = {}
+        futures = []  # (future, notification ids of the task)
+        
+        for delivery in deliveries:
+            if delivery[1] == 'email':
+                email_groups.setdefault((delivery[3], delivery[4]), []).append(delivery)
+            else:
+                futures.append((self.executor.submit(self.deliver_sms, delivery), [delivery[0]]))
+        
+        for (subject, message), group in email_groups.items():
+            futures.append((
+                self.executor.submit(self.deliver_email_group, subject, message, group),
+                [delivery[0] for delivery in group]
+            ))
+        
+        results = []
+        for future, ids in futures:
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                print(f"Delivery of {len(ids)} notifications failed: {str(e)}")
+                results.extend((notification_id, False) for notification_id in ids)
+        return results
+    
+    def retry_delay(self, attempts):
+        """Seconds to wait before the next attempt (exponential backoff, at most an hour)"""
+        return min(self.retry_base * (2 ** (attempts - 1)), 3600)
+    
+    def record_results(self, results):
+        """Persist delivery outcomes; failed rows are retried with backoff until max_attempts"""
+        sent_ids = [notification_id for notification_id, ok in results if ok]
+        failed_ids = [notification_id for notification_id, ok in results if not ok]
+        
+        if sent_ids:
+            Notification.query.filter(Notification.id.in_(sent_ids)).update(
+                {'status': 'sent', 'sent_at': datetime.utcnow(), 'claimed_at': None},
+                synchronize_session=False
+            )
+        
+        if failed_ids:
+            Notification.query.filter(
+                Notification.id.in_(failed_ids),
+                Notification.attempts >= self.max_attempts
+            ).update({'status': 'failed', 'claimed_at': None}, synchronize_session=False)
+            
+            # One update per attempt count, since the backoff grows with each attempt
+            now = datetime.utcnow()
+            retry_attempts = db.session.query(Notification.attempts).filter(
+                Notification.id.in_(failed_ids),
+                Notification.attempts < self.max_attempts
+            ).distinct().all()
+            for (attempts,) in retry_attempts:
+                Notification.query.filter(
+                    Notification.id.in_(failed_ids),
+                    Notification.attempts == attempts
+                ).update({
+                    'status': 'pending',
+                    'claimed_at': None,
+                    'next_attempt_at': now + timedelta(seconds=self.retry_delay(attempts or 1))
+                }, synchronize_session=False)
+        
+        db.session.commit()
+        return len(sent_ids), len(failed_ids)
+    
+    def process_batch(self):
+        """
+        Claim, deliver and record one batch
+        
+        Returns:
+            int: Number of notifications processed
+        """
+        ids = self.claim_batch()
+        if not ids:
+            return 0
+        
+        deliveries = self.load_deliveries(ids)
+        results = self.dispatch(deliveries)
+        sent, failed = self.record_results(results)
+        
+        print(f"Processed {len(ids)} notifications: {sent} sent, {failed} failed")
+        return len(ids)
+    
+    def run(self, poll_interval=2.0, once=False):
+        """Process batches until interrupted (or until the queue is empty with once=True)"""
+        last_recovery = 0
+        
+        while True:
+            if time.monotonic() - last_recovery > self.lease_seconds / 2:
+                self.recover_stale_claims()
+                last_recovery = time.monotonic()
+            
+            processed = self.process_batch()
+            
+            # Publish this batch's send/API metrics to /metrics without waiting for the next one
+            metrics_registry.flush()
+            
+            if not processed:
+                if once:
+                    return
+                time.sleep(poll_interval)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deliver pending ACNSMS notifications')
+    parser.add_argument('--batch-size', type=int, default=100, help='Notifications claimed per batch')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent deliveries')
+    parser.add_argument('--lease', type=int, default=300, help='Seconds before a claim is considered stale')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Delivery attempts before marking as failed')
+    parser.add_argument('--retry-base', type=int, default=60, help='Seconds before the first retry; doubles on every attempt')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+    parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+    args = parser.parse_args()
+    
+    worker = NotificationWorker(
+        batch_size=args.batch_size,
+        workers=args.workers,
+        lease_seconds=args.lease,
+        max_attempts=args.max_attempts,
+        retry_base=args.retry_base
+    )
+    
+    try:
+        with app.app_context():
+            worker.run(poll_interval=args.poll_interval, once=args.once)
+    except KeyboardInterrupt:
+        print("\nNotification worker stopped")
+        sys.exit(0)
+    finally:
+        if notification_service.initialized:
+            notification_service.close()
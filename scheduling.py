@@ -0,0 +1,390 @@
+"""
+Scheduling algorithms for ACNSMS
+Interval indexes for detecting classroom and lecturer double bookings,
+occupancy grids for finding free slots and weekly recurrence expansion
+
+Bookings are half-open intervals [start, end), so a class ending at 10:00
+does not clash with one starting at 10:00.
+"""
+
+import heapq
+import random
+from collections import namedtuple
+from datetime import time, timedelta
+from itertools import groupby
+
+# A scheduled (or proposed) class; schedule_id is any hashable label, e.g.
+# ('series', series_id, date) for a series occurrence or ('row', n) for an imported row
+Booking = namedtuple('Booking', 'schedule_id date start_time end_time classroom lecturer_id module_id',
+                     defaults=(None,))
+
+class _Node:
+    __slots__ = ('key', 'item', 'priority', 'max_end', 'left', 'right')
+    
+    def __init__(self, key, item):
+        self.key = key
+        self.item = item
+        self.priority = random.random()
+        self.max_end = key[1]
+        self.left = None
+        self.right = None
+    
+    def update(self):
+        self.max_end = self.key[1]
+        if self.left is not None and self.left.max_end > self.max_end:
+            self.max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > self.max_end:
+            self.max_end = self.right.max_end
+
+def _merge(left, right):
+    """Merge two treaps where every key of left is smaller than every key of right"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+def _split(node, key):
+    """Split a treap into keys < key and keys >= key"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        node.update()
+        return node, right
+    left, node.left = _split(node.left, key)
+    node.update()
+    return left, node
+
+class IntervalTree:
+    """
+    Set of intervals with overlap queries
+    
+    A treap ordered by interval start and augmented with the maximum end of
+    each subtree: insertion and removal take O(log n) expected time, checking
+    for any overlap O(log n) and listing the k overlaps O(log n + k).
+    """
+    
+    def __init__(self):
+        self._root = None
+        self._keys = {}  # item -> key
+        self._sequence = 0
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def insert(self, start, end, item):
+        """Add the interval [start, end) labelled with a hashable item"""
+        if item in self._keys:
+            self.remove(item)
+        # The sequence number keeps keys unique without comparing items
+        self._sequence += 1
+        key = (start, end, self._sequence)
+        self._keys[item] = key
+        
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key, item)), right)
+    
+    def remove(self, item):
+        """Remove the interval labelled with item, if present"""
+        key = self._keys.pop(item, None)
+        if key is None:
+            return
+        left, rest = _split(self._root, key)
+        _, right = _split(rest, (key[0], key[1], key[2] + 1))
+        self._root = _merge(left, right)
+    
+    def _search(self, node, start, end, found, first_only):
+        if node is None or node.max_end <= start:
+            return
+        self._search(node.left, start, end, found, first_only)
+        if first_only and found:
+            return
+        if node.key[0] < end:
+            if node.key[1] > start:
+                found.append(node.item)
+                if first_only:
+                    return
+            # Intervals to the right start at or after node.key[0]
+            self._search(node.right, start, end, found, first_only)
+    
+    def overlapping(self, start, end):
+        """Items whose intervals overlap [start, end), ordered by start"""
+        found = []
+        self._search(self._root, start, end, found, False)
+        return found
+    
+    def overlaps(self, start, end):
+        """Whether any interval overlaps [start, end)"""
+        found = []
+        self._search(self._root, start, end, found, True)
+        return bool(found)
+
+def normalize_classroom(classroom):
+    """Classroom names are compared case- and whitespace-insensitively"""
+    return ' '.join((classroom or '').split()).lower()
+
+class ConflictIndex:
+    """
+    Per-date interval trees over classroom and lecturer bookings
+    
+    Cancelled classes should not be added; they free their slot.
+    """
+    
+    def __init__(self, bookings=()):
+        self._trees = {}  # (dimension, date, resource) -> IntervalTree
+        for booking in bookings:
+            self.add(booking)
+    
+    def _resources(self, booking):
+        yield 'classroom', (booking.date, normalize_classroom(booking.classroom))
+        if booking.lecturer_id is not None:
+            yield 'lecturer', (booking.date, booking.lecturer_id)
+    
+    def add(self, booking):
+        for dimension, (date, resource) in self._resources(booking):
+            tree = self._trees.setdefault((dimension, date, resource), IntervalTree())
+            tree.insert(booking.start_time, booking.end_time, booking.schedule_id)
+    
+    def remove(self, booking):
+        for dimension, (date, resource) in self._resources(booking):
+            tree = self._trees.get((dimension, date, resource))
+            if tree is not None:
+                tree.remove(booking.schedule_id)
+    
+    def conflicts(self, booking):
+        """
+        Bookings clashing with a (possibly already indexed) booking
+        
+        Returns:
+            dict: 'classroom' and 'lecturer' lists of conflicting schedule ids;
+            the booking itself is never reported
+        """
+        result = {'classroom': [], 'lecturer': []}
+        for dimension, (date, resource) in self._resources(booking):
+            tree = self._trees.get((dimension, date, resource))
+            if tree is not None:
+                result[dimension] = [
+                    schedule_id for schedule_id in tree.overlapping(booking.start_time, booking.end_time)
+                    if schedule_id != booking.schedule_id
+                ]
+        return result
+    
+    def has_conflict(self, booking):
+        """Whether a new booking clashes with anything indexed"""
+        for dimension, (date, resource) in self._resources(booking):
+            tree = self._trees.get((dimension, date, resource))
+            if tree is not None and tree.overlaps(booking.start_time, booking.end_time):
+                return True
+        return False
+
+def find_conflicts(bookings, existing=()):
+    """
+    Detect clashes across a batch of bookings (e.g. an imported term)
+    
+    Args:
+        bookings (iterable): Bookings to check, against each other and existing
+        existing (iterable): Bookings already in the timetable
+    
+    Returns:
+        dict: schedule_id -> sorted list of conflicting schedule ids, for every
+        booking (new or existing) involved in at least one clash
+    """
+    index = ConflictIndex(existing)
+    conflicts = {}
+    
+    for booking in bookings:
+        clashes = index.conflicts(booking)
+        for other_id in set(clashes['classroom']) | set(clashes['lecturer']):
+            conflicts.setdefault(booking.schedule_id, set()).add(other_id)
+            conflicts.setdefault(other_id, set()).add(booking.schedule_id)
+        index.add(booking)
+    
+    return {schedule_id: sorted(others, key=str) for schedule_id, others in conflicts.items()}
+
+# Resolution of the occupancy grids
+SLOT_MINUTES = 15
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+class OccupancyGrid:
+    """
+    Busy time of resources (rooms, a lecturer, a group of students) per date
+    
+    Each (date, resource) is an integer bitset with one bit per SLOT_MINUTES
+    bucket of the day window, so combining resources or checking a whole
+    day is a handful of integer operations.
+    """
+    
+    def __init__(self, day_start=time(8, 0), day_end=time(20, 0), slot_minutes=SLOT_MINUTES):
+        self.slot_minutes = slot_minutes
+        self.origin = _minutes(day_start)
+        self.buckets = -(-(_minutes(day_end) - self.origin) // slot_minutes)
+        self.full = (1 << self.buckets) - 1
+        self._busy = {}  # (date, resource) -> bitset
+    
+    def bucket(self, value):
+        """Bucket containing a time of day (may fall outside the window)"""
+        return (_minutes(value) - self.origin) // self.slot_minutes
+    
+    def time_of(self, bucket):
+        """Start time of a bucket"""
+        minutes = self.origin + bucket * self.slot_minutes
+        return time(minutes // 60, minutes % 60)
+    
+    def mask(self, start, end):
+        """Bits of every bucket touched by [start, end), clipped to the window"""
+        first = max(self.bucket(start), 0)
+        last = min(-(-(_minutes(end) - self.origin) // self.slot_minutes), self.buckets)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+    
+    def mark(self, date, resource, start, end):
+        """Record a resource as busy during [start, end)"""
+        key = (date, resource)
+        self._busy[key] = self._busy.get(key, 0) | self.mask(start, end)
+    
+    def busy(self, date, resource):
+        return self._busy.get((date, resource), 0)
+
+def run_starts(free, length):
+    """Bits i of free for which bits i .. i+length-1 are all set"""
+    starts = free
+    span = 1
+    while span < length and starts:
+        step = min(span, length - span)
+        starts &= starts >> step
+        span += step
+    return starts
+
+def suggest_slots(grid, dates, rooms, blockers, duration_minutes, preferred_date, preferred_start,
+                  preferred_room=None, limit=5):
+    """
+    Find the best free slots for a class
+    
+    Args:
+        grid (OccupancyGrid): Busy time; rooms are stored under ('room', name)
+        dates (iterable): Candidate dates
+        rooms (iterable): Candidate room names, as used in the grid
+        blockers (iterable): Resources whose busy time rules out every room
+            (e.g. the lecturer and the enrolled students)
+        duration_minutes (int): Length of the class
+        preferred_date, preferred_start, preferred_room: The original slot;
+            candidates are ranked by distance in days, then in time, then by
+            whether the room changes
+        limit (int): Number of slots to return
+    
+    Returns:
+        list: (date, start_time, room) tuples, best first
+    """
+    length = max(1, -(-duration_minutes // grid.slot_minutes))
+    target = grid.bucket(preferred_start)
+    rooms = list(rooms)
+    results = []
+    
+    ordered = sorted(dates, key=lambda d: (abs((d - preferred_date).days), d))
+    for _, same_distance in groupby(ordered, key=lambda d: abs((d - preferred_date).days)):
+        candidates = []
+        for date in same_distance:
+            blocked = 0
+            for resource in blockers:
+                blocked |= grid.busy(date, resource)
+            if blocked == grid.full:
+                continue
+            
+            for room in rooms:
+                starts = run_starts(grid.full & ~(blocked | grid.busy(date, ('room', room))), length)
+                while starts:
+                    lowest = starts & -starts
+                    bucket = lowest.bit_length() - 1
+                    starts ^= lowest
+                    candidates.append((abs(bucket - target), room != preferred_room, date, bucket, room))
+        
+        results.extend(heapq.nsmallest(limit - len(results), candidates))
+        if len(results) >= limit:
+            break
+    
+    return [(date, grid.time_of(bucket), room) for _, _, date, bucket, room in results]
+
+# Weekday codes as used by RRULE BYDAY, indexed by date.weekday()
+WEEKDAY_CODES = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+def parse_weekdays(value):
+    """Weekday numbers (Monday = 0) from a comma-separated list of RRULE codes such as 'MO,WE'"""
+    try:
+        return sorted({WEEKDAY_CODES.index(code.strip().upper()) for code in value.split(',') if code.strip()})
+    except ValueError:
+        raise ValueError(f"Invalid weekdays: {value}")
+
+def format_weekdays(weekdays):
+    """RRULE BYDAY list for weekday numbers"""
+    return ','.join(WEEKDAY_CODES[day] for day in sorted(set(weekdays)))
+
+def expand_weekly(start_date, until, weekdays, interval=1, window_start=None, window_end=None, skip=()):
+    """
+    Occurrence dates of a weekly recurrence within a window
+    
+    Equivalent to RRULE:FREQ=WEEKLY;INTERVAL=interval;BYDAY=weekdays;UNTIL=until
+    with DTSTART=start_date (weeks start on Monday). Only the window is
+    walked, so the cost depends on the window, not on the series length.
+    
+    Args:
+        start_date (date): First day of the series
+        until (date): Last day of the series (inclusive)
+        weekdays (iterable): Weekday numbers, Monday = 0
+        interval (int): Repeat every interval weeks
+        window_start (date): First day to return (inclusive)
+        window_end (date): Day after the last day to return (exclusive)
+        skip (container): Dates to leave out (exceptions)
+    
+    Returns:
+        list: Sorted occurrence dates
+    """
+    first = max(start_date, window_start) if window_start else start_date
+    last = min(until, window_end - timedelta(days=1)) if window_end else until
+    if first > last:
+        return []
+    
+    weekdays = set(weekdays)
+    first_monday = start_date - timedelta(days=start_date.weekday())
+    
+    # Walk week by week from the first week of the series that falls in the window
+    weeks = (first - first_monday).days // 7
+    weeks += -weeks % interval
+    occurrences = []
+    
+    week_start = first_monday + timedelta(weeks=weeks)
+    while week_start <= last:
+        for day in sorted(weekdays):
+            occurrence = week_start + timedelta(days=day)
+            if first <= occurrence <= last and occurrence not in skip:
+                occurrences.append(occurrence)
+        week_start += timedelta(weeks=interval)
+    
+    return occurrences
+
+def weekly_recurrence(start_time, until, weekdays, interval=1, exdates=()):
+    """
+    RFC 5545 recurrence lines for a weekly series whose times are in UTC
+    
+    Returns:
+        list: RRULE line followed by EXDATE lines, as used by Google Calendar
+    """
+    rule = f"RRULE:FREQ=WEEKLY;BYDAY={format_weekdays(weekdays)};UNTIL={until.strftime('%Y%m%d')}T235959Z"
+    if interval > 1:
+        rule = rule.replace('FREQ=WEEKLY;', f"FREQ=WEEKLY;INTERVAL={interval};")
+    
+    lines = [rule]
+    if exdates:
+        lines.append('EXDATE:' + ','.join(
+            f"{day.strftime('%Y%m%d')}T{start_time.strftime('%H%M%S')}Z" for day in sorted(exdates)
+        ))
+    return lines
@@ -0,0 +1,62 @@
+"""
+Shared setup for the tests that import app.py
+
+app.py reads DATABASE_URL when it is imported, so the tests point it at an
+in-memory SQLite database first. Importing app also needs the services
+package (services/notification_service.py, services/calendar_service.py).
+"""
+
+import os
+import unittest
+from datetime import time
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+import app as acnsms
+
+class AppTestCase(unittest.TestCase):
+    """Creates the tables in a fresh in-memory database for every test"""
+    
+    def setUp(self):
+        self.app_context = acnsms.app.app_context()
+        self.app_context.push()
+        acnsms.db.create_all()
+        acnsms.schedule_cache.clear()
+    
+    def tearDown(self):
+        acnsms.db.session.remove()
+        acnsms.db.drop_all()
+        self.app_context.pop()
+    
+    def make_user(self, username, role='student', phone=None):
+        user = acnsms.User(username=username, email=f'{username}@example.com', phone=phone,
+                           password_hash='unused', role=role)
+        acnsms.db.session.add(user)
+        acnsms.db.session.flush()
+        return user
+    
+    def make_module(self, code='CS101', lecturer=None, students=()):
+        lecturer = lecturer or self.make_user(f'lecturer-{code}', role='lecturer')
+        module = acnsms.Module(module_code=code, module_name=f'Module {code}', lecturer_id=lecturer.id)
+        acnsms.db.session.add(module)
+        acnsms.db.session.flush()
+        for student in students:
+            acnsms.db.session.add(acnsms.StudentModule(student_id=student.id, module_id=module.id))
+        acnsms.db.session.commit()
+        return module
+    
+    def make_series(self, module, start_date, end_date, weekdays='MO', classroom='Room 1', interval_weeks=1):
+        series = acnsms.ScheduleSeries(module_id=module.id, classroom=classroom, start_time=time(9),
+                                       end_time=time(10), weekdays=weekdays, interval_weeks=interval_weeks,
+                                       start_date=start_date, end_date=end_date)
+        acnsms.db.session.add(series)
+        acnsms.db.session.commit()
+        return series
+    
+    def login(self, user):
+        """Test client with a Flask-Login session for the user"""
+        client = acnsms.app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return client
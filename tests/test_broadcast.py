@@ -0,0 +1,145 @@
+"""
+Tests for the in-process schedule change broadcaster
+"""
+
+import queue
+import unittest
+
+from broadcast import Broadcaster
+
+def event(number):
+    return {'type': 'rescheduled', 'schedule': {'id': number}}
+
+def drain(subscription):
+    """Ids of the events waiting in a subscription"""
+    ids = []
+    while True:
+        try:
+            item = subscription.get(timeout=0)
+        except queue.Empty:
+            return ids
+        if item is None:
+            return ids + [None]
+        ids.append(item[0])
+
+class EventIdTest(unittest.TestCase):
+    
+    def test_round_trip(self):
+        broadcaster = Broadcaster()
+        self.assertEqual(broadcaster.parse_event_id(broadcaster.format_event_id(17)), 17)
+    
+    def test_ids_of_another_epoch_are_rejected(self):
+        broadcaster = Broadcaster()
+        other = Broadcaster()
+        self.assertNotEqual(broadcaster.epoch, other.epoch)
+        self.assertIsNone(broadcaster.parse_event_id(other.format_event_id(3)))
+    
+    def test_malformed_ids_are_rejected(self):
+        broadcaster = Broadcaster()
+        for value in (None, '', '17', f'{broadcaster.epoch}-', f'{broadcaster.epoch}-x1', f'{broadcaster.epoch}--1'):
+            self.assertIsNone(broadcaster.parse_event_id(value), value)
+
+class BroadcasterTest(unittest.TestCase):
+    
+    def test_publish_reaches_only_subscribers_of_the_topics(self):
+        broadcaster = Broadcaster()
+        module_1 = broadcaster.subscribe(['module:1'])
+        module_2 = broadcaster.subscribe(['module:2'])
+        both = broadcaster.subscribe(['module:1', 'module:2'])
+        
+        self.assertEqual(broadcaster.publish(['module:1'], event(1)), 2)
+        
+        self.assertEqual(drain(module_1), [1])
+        self.assertEqual(drain(module_2), [])
+        self.assertEqual(drain(both), [1])
+    
+    def test_event_on_several_topics_is_delivered_once(self):
+        broadcaster = Broadcaster()
+        subscription = broadcaster.subscribe(['module:1', 'module:*'])
+        
+        broadcaster.publish(['module:1', 'module:*'], event(1))
+        
+        self.assertEqual(drain(subscription), [1])
+    
+    def test_unsubscribe(self):
+        broadcaster = Broadcaster()
+        subscription = broadcaster.subscribe(['module:1', 'module:2'])
+        self.assertEqual(broadcaster.subscriber_count(), 1)
+        
+        broadcaster.unsubscribe(subscription)
+        
+        self.assertEqual(broadcaster.subscriber_count(), 0)
+        self.assertEqual(broadcaster.publish(['module:1'], event(1)), 0)
+    
+    def test_reconnect_replays_missed_events_of_its_topics(self):
+        broadcaster = Broadcaster()
+        broadcaster.publish(['module:1'], event(1))
+        seen = broadcaster.current_event_id()
+        broadcaster.publish(['module:1'], event(2))
+        broadcaster.publish(['module:2'], event(3))
+        broadcaster.publish(['module:1'], event(4))
+        
+        subscription = broadcaster.subscribe(['module:1'], last_event_id=seen)
+        
+        self.assertEqual(drain(subscription), [2, 4])
+    
+    def test_reconnect_without_missed_events_replays_nothing(self):
+        broadcaster = Broadcaster()
+        broadcaster.publish(['module:1'], event(1))
+        
+        subscription = broadcaster.subscribe(['module:1'], last_event_id=broadcaster.current_event_id())
+        
+        self.assertEqual(drain(subscription), [])
+    
+    def test_reconnect_beyond_the_history_must_resync(self):
+        broadcaster = Broadcaster(history_size=3)
+        broadcaster.publish(['module:1'], event(1))
+        seen = broadcaster.current_event_id()
+        for number in range(2, 7):
+            broadcaster.publish(['module:1'], event(number))
+        
+        subscription = broadcaster.subscribe(['module:1'], last_event_id=seen)
+        
+        self.assertIsNone(subscription.get(timeout=0))
+    
+    def test_reconnect_at_the_oldest_buffered_event_replays_the_rest(self):
+        broadcaster = Broadcaster(history_size=3)
+        for number in range(1, 6):
+            broadcaster.publish(['module:1'], event(number))
+        
+        # Events 3-5 are buffered; a client that saw 2 has missed nothing that was dropped
+        subscription = broadcaster.subscribe(['module:1'], last_event_id=2)
+        
+        self.assertEqual(drain(subscription), [3, 4, 5])
+    
+    def test_full_queue_overflows_without_blocking_the_publisher(self):
+        broadcaster = Broadcaster(max_queue=2)
+        slow = broadcaster.subscribe(['module:1'])
+        fast = broadcaster.subscribe(['module:1'])
+        
+        broadcaster.publish(['module:1'], event(1))
+        broadcaster.publish(['module:1'], event(2))
+        self.assertFalse(slow.overflowed)
+        self.assertEqual(drain(fast), [1, 2])
+        
+        self.assertEqual(broadcaster.publish(['module:1'], event(3)), 2)
+        
+        self.assertEqual(drain(fast), [3])
+        self.assertTrue(slow.overflowed)
+        self.assertIsNone(slow.get(timeout=0))
+    
+    def test_overflowed_subscriber_resumes_from_the_current_event_id(self):
+        broadcaster = Broadcaster(max_queue=1)
+        subscription = broadcaster.subscribe(['module:1'])
+        broadcaster.publish(['module:1'], event(1))
+        broadcaster.publish(['module:1'], event(2))
+        self.assertIsNone(subscription.get(timeout=0))
+        
+        # The stream sends the current id with its resync; the reconnect starts there
+        resumed = broadcaster.subscribe(['module:1'], broadcaster.current_event_id())
+        broadcaster.publish(['module:1'], event(3))
+        
+        self.assertEqual(drain(resumed), [3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Tests for the cache backends: LRU eviction, TTL expiry and tag invalidation
+"""
+
+import unittest
+from unittest import mock
+
+import cache
+from cache import LRUCache, RedisCache, create_cache
+
+class FakeMonotonic:
+    """Stands in for time.monotonic in cache.py"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+class LRUCacheTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.clock = FakeMonotonic()
+        patcher = mock.patch('cache.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_evicts_the_least_recently_used_entry(self):
+        lru = LRUCache(max_entries=3)
+        for key in 'abc':
+            lru.set(key, key.upper())
+        
+        # Reading 'a' makes 'b' the least recently used
+        self.assertEqual(lru.get('a'), 'A')
+        lru.set('d', 'D')
+        self.assertIsNone(lru.get('b'))
+        
+        lru.get('c')
+        lru.set('e', 'E')
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual([lru.get(key) for key in 'cde'], ['C', 'D', 'E'])
+        self.assertEqual(lru.stats()['evictions'], 2)
+        self.assertEqual(lru.stats()['entries'], 3)
+    
+    def test_overwriting_an_entry_refreshes_it(self):
+        lru = LRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.set('a', 3)
+        lru.set('c', 4)
+        
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 3)
+    
+    def test_entries_expire_after_their_ttl(self):
+        lru = LRUCache(default_ttl=300)
+        lru.set('default', 1)
+        lru.set('short', 2, ttl=10)
+        
+        self.clock.now += 9.9
+        self.assertEqual(lru.get('short'), 2)
+        self.clock.now += 0.1
+        self.assertIsNone(lru.get('short'))
+        self.assertEqual(lru.get('default'), 1)
+        
+        self.clock.now += 290
+        self.assertEqual(lru.get('missing', 'fallback'), 'fallback')
+        self.assertIsNone(lru.get('default'))
+        self.assertEqual(lru.stats()['entries'], 0)
+    
+    def test_expired_entry_is_not_refreshed_by_a_read(self):
+        lru = LRUCache(default_ttl=10)
+        lru.set('a', 1)
+        self.clock.now += 5
+        lru.get('a')
+        self.clock.now += 5
+        
+        self.assertIsNone(lru.get('a'))
+    
+    def test_invalidate_tags_removes_every_tagged_entry(self):
+        lru = LRUCache()
+        lru.set('student:1', 'dashboard 1', tags=['user:1', 'module:1', 'module:2'])
+        lru.set('student:2', 'dashboard 2', tags=['user:2', 'module:2'])
+        lru.set('lecturer:3', 'dashboard 3', tags=['user:3', 'module:3'])
+        lru.set('admin', 'everything', tags=['module:*'])
+        
+        self.assertEqual(lru.invalidate_tags(['module:2', 'module:*']), 3)
+        
+        self.assertIsNone(lru.get('student:1'))
+        self.assertIsNone(lru.get('student:2'))
+        self.assertIsNone(lru.get('admin'))
+        self.assertEqual(lru.get('lecturer:3'), 'dashboard 3')
+        self.assertEqual(lru.invalidate_tags(['module:1', 'module:2']), 0)
+        self.assertEqual(lru.stats()['invalidations'], 3)
+    
+    def test_overwrite_drops_the_old_tags(self):
+        lru = LRUCache()
+        lru.set('key', 'old', tags=['module:1'])
+        lru.set('key', 'new', tags=['module:2'])
+        
+        self.assertEqual(lru.invalidate_tags(['module:1']), 0)
+        self.assertEqual(lru.get('key'), 'new')
+        self.assertEqual(lru.invalidate_tags(['module:2']), 1)
+    
+    def test_evicted_entries_leave_no_tag_references(self):
+        lru = LRUCache(max_entries=1)
+        lru.set('a', 1, tags=['module:1'])
+        lru.set('b', 2, tags=['module:1'])
+        
+        self.assertEqual(lru._tags, {'module:1': {'b'}})
+    
+    def test_stats(self):
+        lru = LRUCache()
+        lru.set('a', 1)
+        lru.get('a')
+        lru.get('a')
+        lru.get('b')
+        
+        stats = lru.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['sets']), (2, 1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.6667)
+        self.assertEqual(stats['backend'], 'memory')
+
+class RedisCacheTest(unittest.TestCase):
+    """RedisCache against a mocked client; no Redis server or redis package is needed"""
+    
+    def setUp(self):
+        self.redis = mock.Mock()
+        self.redis.RedisError = type('RedisError', (Exception,), {})
+        patcher = mock.patch.object(cache, 'redis', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = self.redis.Redis.from_url.return_value
+    
+    def test_connection_errors_are_misses(self):
+        self.client.get.side_effect = self.redis.RedisError('connection refused')
+        shared = RedisCache('redis://localhost:6379/0')
+        
+        self.assertEqual(shared.get('key', 'fallback'), 'fallback')
+        self.assertEqual(shared.stats()['misses'], 1)
+    
+    def test_write_errors_are_ignored(self):
+        self.client.pipeline.return_value.execute.side_effect = self.redis.RedisError('connection refused')
+        shared = RedisCache('redis://localhost:6379/0')
+        
+        shared.set('key', 'value', tags=['module:1'])
+        self.assertEqual(shared.stats()['sets'], 0)
+
+class CreateCacheTest(unittest.TestCase):
+    
+    def test_in_process_cache_by_default(self):
+        self.assertIsInstance(create_cache(url=''), LRUCache)
+    
+    def test_redis_url_without_the_package_falls_back_to_the_in_process_cache(self):
+        with mock.patch.object(cache, 'redis', None):
+            self.assertIsInstance(create_cache(url='redis://localhost:6379/0'), LRUCache)
+
+if __name__ == '__main__':
+    unittest.main()
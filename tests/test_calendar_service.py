@@ -0,0 +1,231 @@
+"""
+Tests for the Google Calendar service
+Run from the project root: python -m pytest tests
+
+The Calendar API is served by googleapiclient's HttpMockSequence, so the
+real discovery document, request building and batch (multipart/mixed)
+encoding are exercised without network access.
+"""
+
+import email
+import json
+import unittest
+from datetime import datetime, timedelta
+from http.client import responses
+from unittest import mock
+
+import httplib2
+from googleapiclient.http import HttpMockSequence
+
+from calender_servicers import CalendarService, SharedCredentials
+
+BOUNDARY = 'batch_test_boundary'
+
+def make_credentials(expired=False, on_refresh=None):
+    credentials = SharedCredentials(
+        'expired-token' if expired else 'valid-token',
+        refresh_token='refresh-token',
+        token_uri='https://oauth2.googleapis.com/token',
+        client_id='client-id',
+        client_secret='client-secret',
+        scopes=CalendarService.SCOPES
+    )
+    credentials.expiry = datetime.utcnow() + (timedelta(hours=-1) if expired else timedelta(hours=1))
+    credentials._on_refresh = on_refresh
+    return credentials
+
+def make_service(responses_sequence, credentials=None):
+    """A CalendarService whose HTTP traffic is answered by an HttpMockSequence"""
+    with mock.patch.object(CalendarService, '_authenticate'):
+        service = CalendarService(interactive=False)
+    service.credentials = credentials or make_credentials()
+    http = HttpMockSequence(list(responses_sequence))
+    with mock.patch.object(httplib2, 'Http', return_value=http):
+        service.service  # build the API object for this thread over the mock
+    return service, http
+
+def batch_response(*parts):
+    """A batch response; parts are (request id, HTTP status, JSON body or None)"""
+    chunks = []
+    for request_id, status, body in parts:
+        payload = json.dumps(body) if body is not None else ''
+        chunks.append(
+            f"--{BOUNDARY}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <response-test + {request_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {responses[status]}\r\n"
+            "Content-Type: application/json; charset=UTF-8\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n"
+            f"{payload}\r\n"
+        )
+    return {'status': '200', 'content-type': f'multipart/mixed; boundary={BOUNDARY}'}, ''.join(chunks) + f"--{BOUNDARY}--"
+
+def error_body(status, message):
+    return {'error': {'code': status, 'message': message, 'errors': [{'reason': message}]}}
+
+def batch_requests(http_request):
+    """Decode a recorded batch POST into [(request id, method, url, JSON body or None)]"""
+    uri, method, body, headers = http_request
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    content_type = headers['content-type']
+    message = email.message_from_bytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    
+    parsed = []
+    for part in message.get_payload():
+        request_id = part['Content-ID'].strip('<>').split(' + ', 1)[1]
+        request_text = part.get_payload()
+        head, _, payload = request_text.partition('\r\n\r\n')
+        if not payload:
+            head, _, payload = request_text.partition('\n\n')
+        request_method, url, _ = head.splitlines()[0].split(' ', 2)
+        parsed.append((request_id, request_method, url, json.loads(payload) if payload.strip() else None))
+    return parsed
+
+def operation(key, action, event_id=None, **fields):
+    return {'key': key, 'action': action, 'event_id': event_id, 'fields': fields}
+
+class SharedCredentialsTest(unittest.TestCase):
+    """SharedCredentials must work with googleapiclient's batch requests"""
+    
+    def test_batch_execute_authorizes_with_shared_credentials(self):
+        service, http = make_service([
+            batch_response((0, 200, {'id': 'evt1'}), (1, 204, None))
+        ])
+        
+        results = service.batch_execute([
+            operation('a', 'insert', title='Lecture', location='Room 1',
+                      start_datetime=datetime(2026, 1, 5, 9), end_datetime=datetime(2026, 1, 5, 10)),
+            operation('b', 'delete', event_id='evt2')
+        ])
+        
+        self.assertEqual(results['a'], {'success': True, 'event_id': 'evt1', 'error': None, 'status': None})
+        self.assertTrue(results['b']['success'])
+        uri, method, body, headers = http.request_sequence[0]
+        self.assertTrue(uri.endswith('/batch/calendar/v3'))
+        self.assertEqual(headers['authorization'], 'Bearer valid-token')
+        self.assertIn('authorization: Bearer valid-token', body if isinstance(body, str) else body.decode())
+    
+    def test_expired_token_is_refreshed_once_and_persisted(self):
+        saved = []
+        credentials = make_credentials(expired=True, on_refresh=lambda creds: saved.append(creds.token))
+        service, http = make_service([
+            ({'status': '200'}, json.dumps({'access_token': 'new-token', 'expires_in': 3600})),
+            batch_response((0, 204, None))
+        ], credentials)
+        
+        # The token refresh opens its own connection, also answered by the mock
+        with mock.patch.object(httplib2, 'Http', return_value=http):
+            results = service.batch_execute([operation('a', 'delete', event_id='evt1')])
+        
+        self.assertTrue(results['a']['success'])
+        self.assertEqual(saved, ['new-token'])
+        self.assertEqual(http.request_sequence[-1][3]['authorization'], 'Bearer new-token')
+
+class BatchExecuteTest(unittest.TestCase):
+    """CalendarService.batch_execute and the single-event calls"""
+    
+    def test_operations_are_chunked_at_batch_limit(self):
+        service, http = make_service([
+            batch_response((0, 204, None), (1, 204, None)),
+            batch_response((0, 204, None), (1, 204, None)),
+            batch_response((0, 204, None))
+        ])
+        service.BATCH_LIMIT = 2
+        
+        results = service.batch_execute([operation(f'k{n}', 'delete', event_id=f'evt{n}') for n in range(5)])
+        
+        self.assertEqual(len(http.request_sequence), 3)
+        sent = [[url.rsplit('/', 1)[1] for _, _, url, _ in batch_requests(request)] for request in http.request_sequence]
+        self.assertEqual(sent, [['evt0', 'evt1'], ['evt2', 'evt3'], ['evt4']])
+        self.assertTrue(all(result['success'] for result in results.values()))
+        self.assertEqual(set(results), {'k0', 'k1', 'k2', 'k3', 'k4'})
+    
+    def test_sub_responses_are_mapped_to_their_operation_keys(self):
+        # Parts arrive out of order; the Content-ID decides which operation they answer
+        service, http = make_service([
+            batch_response(
+                (2, 404, error_body(404, 'notFound')),
+                (0, 200, {'id': 'new-evt'}),
+                (1, 200, {'id': 'evt-patched'})
+            )
+        ])
+        
+        results = service.batch_execute([
+            operation('schedule-1', 'insert', title='Lecture', location='Room 1',
+                      start_datetime=datetime(2026, 1, 5, 9), end_datetime=datetime(2026, 1, 5, 10)),
+            operation('schedule-2', 'patch', event_id='evt-patched', location='Room 2'),
+            operation('schedule-3', 'patch', event_id='evt-missing', location='Room 3')
+        ])
+        
+        self.assertEqual(results['schedule-1']['event_id'], 'new-evt')
+        self.assertTrue(results['schedule-2']['success'])
+        self.assertEqual(results['schedule-2']['event_id'], 'evt-patched')
+        self.assertFalse(results['schedule-3']['success'])
+        self.assertEqual(results['schedule-3']['status'], 404)
+        self.assertEqual(results['schedule-3']['event_id'], 'evt-missing')
+    
+    def test_batch_patch_sends_only_changed_fields(self):
+        service, http = make_service([batch_response((0, 200, {'id': 'evt1'}))])
+        
+        service.batch_execute([operation('a', 'patch', event_id='evt1', location='Room 9', status='cancelled')])
+        
+        (_, method, url, body), = batch_requests(http.request_sequence[0])
+        self.assertEqual(method, 'PATCH')
+        self.assertTrue(url.startswith('/calendar/v3/calendars/primary/events/evt1'))
+        self.assertEqual(body, {'location': 'Room 9', 'status': 'cancelled'})
+    
+    def test_update_event_patches_only_changed_fields(self):
+        service, http = make_service([({'status': '200'}, json.dumps({'id': 'evt1'}))])
+        start = datetime(2026, 2, 2, 14)
+        
+        self.assertTrue(service.update_event('evt1', start_datetime=start, end_datetime=start + timedelta(hours=2)))
+        
+        uri, method, body, headers = http.request_sequence[0]
+        self.assertEqual(method, 'PATCH')
+        self.assertIn('/calendars/primary/events/evt1', uri)
+        self.assertEqual(json.loads(body), {
+            'start': {'dateTime': '2026-02-02T14:00:00', 'timeZone': 'UTC'},
+            'end': {'dateTime': '2026-02-02T16:00:00', 'timeZone': 'UTC'}
+        })
+    
+    def test_deleting_a_missing_event_counts_as_success(self):
+        service, http = make_service([
+            batch_response((0, 404, error_body(404, 'notFound')), (1, 410, error_body(410, 'deleted')))
+        ])
+        
+        results = service.batch_execute([
+            operation('a', 'delete', event_id='evt1'),
+            operation('b', 'delete', event_id='evt2')
+        ])
+        
+        self.assertEqual(results['a'], {'success': True, 'event_id': 'evt1', 'error': None, 'status': 404})
+        self.assertEqual(results['b'], {'success': True, 'event_id': 'evt2', 'error': None, 'status': 410})
+    
+    def test_delete_event(self):
+        service, http = make_service([({'status': '204'}, '')])
+        
+        self.assertTrue(service.delete_event('evt1'))
+        
+        uri, method, body, headers = http.request_sequence[0]
+        self.assertEqual(method, 'DELETE')
+        self.assertIn('/calendars/primary/events/evt1', uri)
+    
+    def test_insert_with_existing_client_id_reports_409(self):
+        # The sync worker retries inserts with the same client-chosen id and treats 409 as already created
+        service, http = make_service([batch_response((0, 409, error_body(409, 'duplicate')))])
+        
+        results = service.batch_execute([
+            operation('a', 'insert', event_id='acnsms42', title='Lecture', location='Room 1',
+                      start_datetime=datetime(2026, 1, 5, 9), end_datetime=datetime(2026, 1, 5, 10))
+        ])
+        
+        self.assertFalse(results['a']['success'])
+        self.assertEqual(results['a']['status'], 409)
+        self.assertEqual(results['a']['event_id'], 'acnsms42')
+        (_, method, url, body), = batch_requests(http.request_sequence[0])
+        self.assertEqual(method, 'POST')
+        self.assertEqual(body['id'], 'acnsms42')
+
+if __name__ == '__main__':
+    unittest.main()
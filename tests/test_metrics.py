@@ -0,0 +1,142 @@
+"""
+Tests for the metrics registry, including merging the files of several processes
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from metrics import ARCHIVE_FILENAME, MetricsRegistry, parse_process_filename, process_start_time
+
+def worker_snapshot(requests, connections, durations):
+    """Snapshot of a process that handled requests, holds connections and observed durations"""
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests', ('endpoint',)).inc(requests, endpoint='dashboard')
+    registry.gauge('connections', 'Open connections').set(connections)
+    histogram = registry.histogram('duration_seconds', 'Duration', buckets=(0.1, 1.0))
+    for duration in durations:
+        histogram.observe(duration)
+    return registry.snapshot()
+
+def collected(registry):
+    """Merged values of a registry by metric name and label values"""
+    return {
+        name: {tuple(labels.values()): value for labels, value in samples}
+        for name, _, _, samples, _ in registry.collect()
+    }
+
+class MetricsRegistryTest(unittest.TestCase):
+    
+    def test_counter_gauge_and_histogram(self):
+        registry = MetricsRegistry()
+        requests = registry.counter('requests_total', 'Requests', ('endpoint',))
+        requests.inc(endpoint='dashboard')
+        requests.inc(2, endpoint='dashboard')
+        gauge = registry.gauge('connections', 'Open connections')
+        gauge.inc(3)
+        gauge.dec()
+        histogram = registry.histogram('duration_seconds', 'Duration', buckets=(0.1, 1.0))
+        for duration in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(duration)
+        
+        values = collected(registry)
+        
+        self.assertEqual(values['requests_total'], {('dashboard',): 3})
+        self.assertEqual(values['connections'], {(): 2})
+        self.assertEqual(values['duration_seconds'], {(): ([2, 1, 1], 2.65)})
+    
+    def test_labels_must_match(self):
+        requests = MetricsRegistry().counter('requests_total', 'Requests', ('endpoint',))
+        with self.assertRaises(ValueError):
+            requests.inc()
+        with self.assertRaises(ValueError):
+            requests.inc(method='GET')
+    
+    def test_render(self):
+        registry = MetricsRegistry()
+        registry.counter('requests_total', 'Requests', ('endpoint',)).inc(endpoint='a"b')
+        registry.histogram('duration_seconds', 'Duration', buckets=(0.1,)).observe(0.5)
+        
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{endpoint="a\\"b"} 1',
+            '# HELP duration_seconds Duration',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{le="0.1"} 0',
+            'duration_seconds_bucket{le="+Inf"} 1',
+            'duration_seconds_sum 0.5',
+            'duration_seconds_count 1',
+        ])
+    
+    def test_parse_process_filename(self):
+        self.assertEqual(parse_process_filename('metrics_123_456.json'), (123, '456'))
+        self.assertEqual(parse_process_filename('metrics_123.json'), (123, None))
+        self.assertIsNone(parse_process_filename(ARCHIVE_FILENAME))
+        self.assertIsNone(parse_process_filename('metrics_x_1.json'))
+
+@unittest.skipUnless(process_start_time(os.getppid()), 'needs /proc to tell exited processes apart')
+class MultiprocessMetricsTest(unittest.TestCase):
+    """The scraping registry merges files written by other processes"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.registry = MetricsRegistry(multiproc_dir=self.directory)
+        # A process that is still running (the parent of the test run) and one that has exited:
+        # the same pid with another start time is a reused pid
+        pid = os.getppid()
+        self.live_file = f'metrics_{pid}_{process_start_time(pid)}.json'
+        self.dead_file = f'metrics_{pid}_1.json'
+    
+    def write(self, filename, snapshot):
+        with open(os.path.join(self.directory, filename), 'w') as f:
+            json.dump(snapshot, f)
+    
+    def test_exited_process_counters_are_archived_and_gauges_dropped(self):
+        self.write(self.live_file, worker_snapshot(requests=2, connections=5, durations=[0.05]))
+        self.write(self.dead_file, worker_snapshot(requests=3, connections=7, durations=[0.5]))
+        
+        values = collected(self.registry)
+        
+        self.assertEqual(values['requests_total'], {('dashboard',): 5})
+        self.assertEqual(values['connections'], {(): 5})
+        self.assertEqual(values['duration_seconds'], {(): ([1, 1, 0], 0.55)})
+        self.assertFalse(os.path.exists(os.path.join(self.directory, self.dead_file)))
+        with open(os.path.join(self.directory, ARCHIVE_FILENAME)) as f:
+            archive = json.load(f)
+        self.assertNotIn('connections', archive)
+    
+    def test_archived_counters_are_counted_once_and_kept(self):
+        self.write(self.live_file, worker_snapshot(requests=2, connections=5, durations=[]))
+        self.write(self.dead_file, worker_snapshot(requests=3, connections=7, durations=[]))
+        collected(self.registry)
+        
+        # Later scrapes neither lose nor re-add the archived process
+        self.write(self.live_file, worker_snapshot(requests=4, connections=6, durations=[]))
+        values = collected(self.registry)
+        self.assertEqual(values['requests_total'], {('dashboard',): 7})
+        self.assertEqual(values['connections'], {(): 6})
+        
+        # When the second process exits too, its counters join the archive
+        os.rename(os.path.join(self.directory, self.live_file), os.path.join(self.directory, self.dead_file))
+        values = collected(self.registry)
+        self.assertEqual(values['requests_total'], {('dashboard',): 7})
+        self.assertEqual(values.get('connections', {}), {})
+        self.assertEqual(collected(self.registry)['requests_total'], {('dashboard',): 7})
+    
+    def test_scraping_process_includes_its_own_values(self):
+        self.write(self.live_file, worker_snapshot(requests=2, connections=5, durations=[]))
+        self.registry.counter('requests_total', 'Requests', ('endpoint',)).inc(endpoint='dashboard')
+        self.registry.gauge('connections', 'Open connections').set(1)
+        
+        values = collected(self.registry)
+        
+        self.assertEqual(values['requests_total'], {('dashboard',): 3})
+        self.assertEqual(values['connections'], {(): 6})
+        self.assertEqual(len([name for name in os.listdir(self.directory) if parse_process_filename(name)]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,391 @@
+"""
+Tests for the notification service (SMTP connection pool, SMS rate limiting)
+
+smtplib.SMTP is replaced by FakeSMTP, which records what each connection
+did and can be told to fail, so no mail server is needed. SMS goes through
+a fake transport, and the rate limiter runs on a fake clock.
+"""
+
+import smtplib
+import threading
+import unittest
+from unittest import mock
+
+from notification_service import (
+    NotificationService, SMSTransport, SMSTransportError, SMTPConnectionPool, TokenBucket
+)
+
+class FakeSMTP:
+    """Stand-in for smtplib.SMTP; every instance is one connection"""
+    
+    instances = []
+    
+    def __init__(self, host, port, timeout=None):
+        self.host = host
+        self.port = port
+        self.tls = False
+        self.logged_in = None
+        self.sent = []
+        self.failures = []  # exceptions raised by the next sendmail calls
+        self.noop_code = 250
+        self.closed = False
+        FakeSMTP.instances.append(self)
+    
+    def starttls(self):
+        self.tls = True
+    
+    def login(self, username, password):
+        self.logged_in = (username, password)
+    
+    def sendmail(self, from_addr, to_addrs, msg):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected('Connection closed')
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append(list(to_addrs))
+        return {}
+    
+    def noop(self):
+        if self.noop_code is None:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return self.noop_code, b'OK'
+    
+    def quit(self):
+        self.closed = True
+    
+    def close(self):
+        self.closed = True
+
+class FakeClock:
+    """Monotonic clock whose sleep advances time instead of waiting"""
+    
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self._lock = threading.Lock()
+    
+    def __call__(self):
+        with self._lock:
+            return self.now
+    
+    def sleep(self, seconds):
+        with self._lock:
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+class FakeSMSTransport(SMSTransport):
+    """Records every send with the clock time; numbers in errors raise instead"""
+    
+    def __init__(self, clock, errors=None):
+        self.clock = clock
+        self.errors = dict(errors or {})  # phone -> list of exceptions for its next sends
+        self.sends = []
+        self._lock = threading.Lock()
+    
+    def send(self, to_phone, message):
+        with self._lock:
+            self.sends.append((self.clock(), to_phone))
+            failures = self.errors.get(to_phone)
+            error = failures.pop(0) if failures else None
+        if error:
+            raise error
+        return f"SM{to_phone}"
+
+class SMTPConnectionPoolTest(unittest.TestCase):
+    
+    def setUp(self):
+        FakeSMTP.instances = []
+    
+    def make_pool(self, **kwargs):
+        options = dict(username='user', password='secret', max_size=2, timeout=1, smtp_factory=FakeSMTP)
+        options.update(kwargs)
+        return SMTPConnectionPool('smtp.example.com', 587, **options)
+    
+    def test_connection_is_opened_lazily_and_authenticated(self):
+        pool = self.make_pool()
+        self.assertEqual(FakeSMTP.instances, [])
+        
+        pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        
+        (server,) = FakeSMTP.instances
+        self.assertEqual((server.host, server.port), ('smtp.example.com', 587))
+        self.assertTrue(server.tls)
+        self.assertEqual(server.logged_in, ('user', 'secret'))
+    
+    def test_connection_is_reused(self):
+        pool = self.make_pool()
+        
+        for n in range(5):
+            pool.sendmail('from@example.com', [f'{n}@example.com'], 'message')
+        
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual(len(FakeSMTP.instances[0].sent), 5)
+    
+    def test_connection_is_recycled_after_max_messages(self):
+        pool = self.make_pool(max_messages=2)
+        
+        for n in range(5):
+            pool.sendmail('from@example.com', [f'{n}@example.com'], 'message')
+        
+        self.assertEqual([len(server.sent) for server in FakeSMTP.instances], [2, 2, 1])
+        self.assertEqual([server.closed for server in FakeSMTP.instances], [True, True, False])
+    
+    def test_connection_idle_too_long_is_replaced(self):
+        pool = self.make_pool(max_idle=60)
+        pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        with pool.connection() as connection:
+            connection.last_used -= 61
+        
+        pool.sendmail('from@example.com', ['b@example.com'], 'message')
+        
+        first, second = FakeSMTP.instances
+        self.assertTrue(first.closed)
+        self.assertEqual(second.sent, [['b@example.com']])
+    
+    def test_idle_connection_is_probed_before_reuse(self):
+        pool = self.make_pool(health_check_interval=10)
+        pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        with pool.connection() as connection:
+            connection.last_used -= 20
+        FakeSMTP.instances[0].noop_code = None  # the server dropped the connection meanwhile
+        
+        pool.sendmail('from@example.com', ['b@example.com'], 'message')
+        
+        first, second = FakeSMTP.instances
+        self.assertTrue(first.closed)
+        self.assertEqual(second.sent, [['b@example.com']])
+    
+    def test_dropped_connection_is_discarded_and_the_send_retried_once(self):
+        pool = self.make_pool()
+        pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        FakeSMTP.instances[0].failures.append(smtplib.SMTPServerDisconnected('Server not connected'))
+        
+        pool.sendmail('from@example.com', ['b@example.com'], 'message')
+        pool.sendmail('from@example.com', ['c@example.com'], 'message')
+        
+        first, second = FakeSMTP.instances
+        self.assertTrue(first.closed)
+        self.assertEqual(first.sent, [['a@example.com']])
+        # The broken connection never went back to the pool; the replacement did
+        self.assertEqual(second.sent, [['b@example.com'], ['c@example.com']])
+        self.assertEqual(pool._idle.qsize(), 1)
+    
+    def test_retry_failure_propagates(self):
+        pool = self.make_pool()
+        with mock.patch.object(FakeSMTP, 'sendmail', side_effect=smtplib.SMTPServerDisconnected('down')):
+            with self.assertRaises(smtplib.SMTPServerDisconnected):
+                pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertTrue(all(server.closed for server in FakeSMTP.instances))
+        self.assertEqual(pool._idle.qsize(), 0)
+    
+    def test_refused_recipients_keep_the_connection(self):
+        pool = self.make_pool()
+        pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        refused = smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')})
+        FakeSMTP.instances[0].failures.append(refused)
+        
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            pool.sendmail('from@example.com', ['bad@example.com'], 'message')
+        pool.sendmail('from@example.com', ['c@example.com'], 'message')
+        
+        (server,) = FakeSMTP.instances
+        self.assertFalse(server.closed)
+        self.assertEqual(server.sent, [['a@example.com'], ['c@example.com']])
+    
+    def test_exhausted_pool_times_out(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        
+        with pool.connection():
+            with self.assertRaises(smtplib.SMTPException):
+                with pool.connection():
+                    pass
+    
+    def test_exhausted_pool_waits_for_a_returned_connection(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        checked_out = threading.Event()
+        release = threading.Event()
+        
+        def hold():
+            with pool.connection():
+                checked_out.set()
+                release.wait(5)
+        
+        holder = threading.Thread(target=hold)
+        holder.start()
+        checked_out.wait(5)
+        threading.Timer(0.05, release.set).start()
+        
+        pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        holder.join()
+        
+        # The waiting send reused the held connection instead of opening a second one
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual(FakeSMTP.instances[0].sent, [['a@example.com']])
+    
+    def test_close_closes_idle_connections(self):
+        pool = self.make_pool()
+        pool.sendmail('from@example.com', ['a@example.com'], 'message')
+        
+        pool.close()
+        
+        self.assertTrue(FakeSMTP.instances[0].closed)
+        self.assertEqual(pool._idle.qsize(), 0)
+
+class NotificationServiceEmailTest(unittest.TestCase):
+    
+    def setUp(self):
+        FakeSMTP.instances = []
+        patcher = mock.patch('smtplib.SMTP', FakeSMTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = NotificationService(sms_transport=mock.Mock())
+    
+    def test_emails_share_one_pooled_connection(self):
+        for n in range(3):
+            self.assertTrue(self.service.send_email(f'{n}@example.com', 'Subject', 'Body'))
+        
+        (server,) = FakeSMTP.instances
+        self.assertEqual(server.sent, [['0@example.com'], ['1@example.com'], ['2@example.com']])
+    
+    def test_batch_email_retries_refused_recipients_individually(self):
+        recipients = [f'{n}@example.com' for n in range(5)]
+        self.service.send_email('warmup@example.com', 'Subject', 'Body')
+        refused = smtplib.SMTPRecipientsRefused({'3@example.com': (550, b'No such user')})
+        FakeSMTP.instances[0].failures.append(refused)
+        
+        results = self.service.send_batch_email(recipients, 'Subject', 'Body', chunk_size=5)
+        
+        self.assertEqual(results['success'], 5)
+        self.assertEqual(FakeSMTP.instances[0].sent[-1], ['3@example.com'])
+
+class TokenBucketTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.clock = FakeClock()
+    
+    def make_bucket(self, rate, capacity=None):
+        return TokenBucket(rate, capacity, clock=self.clock, sleep=self.clock.sleep)
+    
+    def test_burst_up_to_capacity_then_waits_for_a_token(self):
+        bucket = self.make_bucket(rate=2, capacity=3)
+        
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+        self.assertEqual(self.clock(), 0.5)
+    
+    def test_tokens_refill_at_the_rate(self):
+        bucket = self.make_bucket(rate=2, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        
+        self.clock.now += 1.0
+        bucket.acquire()
+        bucket.acquire()
+        
+        self.assertEqual(self.clock.sleeps, [])
+    
+    def test_idle_time_does_not_grow_the_burst_beyond_capacity(self):
+        bucket = self.make_bucket(rate=2, capacity=3)
+        self.clock.now += 100
+        
+        for _ in range(4):
+            bucket.acquire()
+        
+        self.assertEqual(self.clock.sleeps, [0.5])
+    
+    def test_sustained_rate(self):
+        bucket = self.make_bucket(rate=5)  # capacity defaults to the rate
+        
+        for _ in range(25):
+            bucket.acquire()
+        
+        # 5 from the initial burst, then one every 0.2 seconds
+        self.assertAlmostEqual(self.clock(), 4.0)
+    
+    def test_invalid_settings(self):
+        for rate, capacity in ((0, None), (-1, None), (1, 0)):
+            with self.assertRaises(ValueError):
+                TokenBucket(rate, capacity)
+
+class SMSTransportTest(unittest.TestCase):
+    
+    def test_transport_must_implement_send(self):
+        class Incomplete(SMSTransport):
+            pass
+        
+        with self.assertRaises(TypeError):
+            Incomplete()
+        with self.assertRaises(TypeError):
+            SMSTransport()
+    
+    def test_retryable_errors(self):
+        self.assertTrue(SMSTransportError('throttled', status=429).retryable)
+        self.assertTrue(SMSTransportError('provider error', status=503).retryable)
+        self.assertTrue(SMSTransportError('network error').retryable)
+        self.assertFalse(SMSTransportError('invalid number', status=400).retryable)
+
+class BulkSMSTest(unittest.TestCase):
+    
+    RATE = 5
+    CAPACITY = 2
+    
+    def setUp(self):
+        self.clock = FakeClock()
+    
+    def make_service(self, transport):
+        with mock.patch.dict('os.environ', {'SMS_RATE_LIMIT': '10'}):
+            service = NotificationService(sms_transport=transport)
+        service.sms_rate_limiter = TokenBucket(self.RATE, self.CAPACITY, clock=self.clock, sleep=self.clock.sleep)
+        service.sms_max_workers = 4
+        service.sms_retry_backoff = 0
+        return service
+    
+    def test_rate_limit_holds_and_every_recipient_is_attempted(self):
+        transport = FakeSMSTransport(self.clock)
+        service = self.make_service(transport)
+        recipients = [f'+4470000000{n:02d}' for n in range(20)]
+        
+        results = service.send_bulk_sms(recipients, 'Class moved')
+        
+        self.assertEqual(results['success'], 20)
+        self.assertEqual(sorted(phone for _, phone in transport.sends), recipients)
+        # No more sends by any time t than the burst plus the rate allows
+        for count, (sent_at, _) in enumerate(sorted(transport.sends), start=1):
+            self.assertLessEqual(count, self.CAPACITY + self.RATE * sent_at + 1e-9)
+    
+    def test_one_failure_does_not_abort_the_batch(self):
+        transport = FakeSMSTransport(self.clock, errors={
+            '+2': [SMSTransportError('invalid number', status=400)],
+            '+3': [RuntimeError('unexpected')],
+            '+4': [SMSTransportError('throttled', status=429)],
+        })
+        service = self.make_service(transport)
+        recipients = ['+1', '+2', '+3', '+4', '+5']
+        
+        results = service.send_bulk_sms(recipients, 'Class moved')
+        
+        self.assertEqual((results['success'], results['failed']), (3, 2))
+        by_phone = {result['to']: result for result in results['results']}
+        self.assertEqual([result['to'] for result in results['results']], recipients)
+        self.assertFalse(by_phone['+2']['success'])
+        self.assertEqual(by_phone['+2']['attempts'], 1)
+        self.assertFalse(by_phone['+3']['success'])
+        self.assertTrue(by_phone['+4']['success'])
+        self.assertEqual(by_phone['+4']['attempts'], 2)
+        self.assertEqual(sorted({phone for _, phone in transport.sends}), recipients)
+    
+    def test_rate_limit_setting(self):
+        with mock.patch.dict('os.environ', {'SMS_RATE_LIMIT': '0'}):
+            self.assertIsNone(NotificationService(sms_transport=FakeSMSTransport(self.clock)).sms_rate_limiter)
+        with mock.patch.dict('os.environ', {'SMS_RATE_LIMIT': '-1'}):
+            with self.assertRaises(ValueError):
+                NotificationService(sms_transport=FakeSMSTransport(self.clock))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Tests for the notification worker: claiming, lease recovery and retries
+"""
+
+from datetime import datetime, timedelta
+from unittest import mock
+
+from tests.support import AppTestCase, acnsms
+from notification_worker import NotificationWorker  # after tests.support, which sets DATABASE_URL
+
+class NotificationWorkerTest(AppTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.worker = NotificationWorker(batch_size=2, workers=2, lease_seconds=300, max_attempts=3, retry_base=60)
+        self.addCleanup(self.worker.executor.shutdown)
+        self.student = self.make_user('student1', phone='+447000000001')
+        self.message = acnsms.NotificationMessage(subject='Lecture Rescheduled: CS101', body='Moved to Room 2')
+        acnsms.db.session.add(self.message)
+        acnsms.db.session.commit()
+    
+    def queue(self, notification_type='email', minutes_ago=0, **fields):
+        notification = acnsms.Notification(user_id=self.student.id, notification_type=notification_type,
+                                           message_id=self.message.id, status=fields.pop('status', 'pending'),
+                                           created_at=datetime.utcnow() - timedelta(minutes=minutes_ago), **fields)
+        acnsms.db.session.add(notification)
+        acnsms.db.session.commit()
+        return notification.id
+    
+    def get(self, notification_id):
+        acnsms.db.session.expire_all()
+        return acnsms.db.session.get(acnsms.Notification, notification_id)
+    
+    def make_due(self, notification_id):
+        """Move the retry time of a notification into the past"""
+        self.get(notification_id).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        acnsms.db.session.commit()
+    
+    def fail_every_delivery(self):
+        return mock.patch.object(self.worker, 'dispatch', lambda deliveries: [(d[0], False) for d in deliveries])
+    
+    def test_claim_takes_the_oldest_batch(self):
+        newest = self.queue(minutes_ago=1)
+        oldest = self.queue(minutes_ago=3)
+        middle = self.queue(minutes_ago=2)
+        
+        self.assertEqual(self.worker.claim_batch(), [oldest, middle])
+        
+        for notification_id in (oldest, middle):
+            notification = self.get(notification_id)
+            self.assertEqual(notification.status, 'processing')
+            self.assertEqual(notification.attempts, 1)
+            self.assertIsNotNone(notification.claimed_at)
+        self.assertEqual(self.get(newest).status, 'pending')
+        self.assertEqual(self.worker.claim_batch(), [newest])
+        self.assertEqual(self.worker.claim_batch(), [])
+    
+    def test_claim_skips_rows_that_are_not_due(self):
+        self.queue(status='sent')
+        self.queue(status='failed')
+        self.queue(status='processing', claimed_at=datetime.utcnow())
+        self.queue(next_attempt_at=datetime.utcnow() + timedelta(minutes=5))
+        due = self.queue(next_attempt_at=datetime.utcnow() - timedelta(minutes=5))
+        
+        self.assertEqual(self.worker.claim_batch(), [due])
+    
+    def test_expired_lease_is_returned_to_the_queue(self):
+        expired = self.queue(status='processing', attempts=1,
+                             claimed_at=datetime.utcnow() - timedelta(seconds=301))
+        active = self.queue(status='processing', attempts=1,
+                            claimed_at=datetime.utcnow() - timedelta(seconds=60))
+        
+        self.assertEqual(self.worker.recover_stale_claims(), 1)
+        
+        self.assertEqual(self.get(expired).status, 'pending')
+        self.assertIsNone(self.get(expired).claimed_at)
+        self.assertEqual(self.get(active).status, 'processing')
+        # The recovered row is delivered again and counts as a new attempt
+        self.assertEqual(self.worker.claim_batch(), [expired])
+        self.assertEqual(self.get(expired).attempts, 2)
+    
+    def test_retry_delay_doubles_up_to_an_hour(self):
+        self.assertEqual([self.worker.retry_delay(attempts) for attempts in range(1, 9)],
+                         [60, 120, 240, 480, 960, 1920, 3600, 3600])
+    
+    def test_failed_delivery_backs_off_then_fails_after_max_attempts(self):
+        notification_id = self.queue()
+        
+        with self.fail_every_delivery():
+            for attempts, delay in ((1, 60), (2, 120)):
+                before = datetime.utcnow()
+                self.assertEqual(self.worker.process_batch(), 1)
+                
+                notification = self.get(notification_id)
+                self.assertEqual((notification.status, notification.attempts), ('pending', attempts))
+                self.assertIsNone(notification.claimed_at)
+                self.assertGreaterEqual(notification.next_attempt_at, before + timedelta(seconds=delay))
+                self.assertLessEqual(notification.next_attempt_at, datetime.utcnow() + timedelta(seconds=delay))
+                # Not claimed again until the backoff has passed
+                self.assertEqual(self.worker.claim_batch(), [])
+                self.make_due(notification_id)
+            
+            self.assertEqual(self.worker.process_batch(), 1)
+        
+        notification = self.get(notification_id)
+        self.assertEqual((notification.status, notification.attempts), ('failed', 3))
+        self.make_due(notification_id)
+        self.assertEqual(self.worker.claim_batch(), [])
+    
+    def test_process_batch_sends_and_records_each_channel(self):
+        email = self.queue('email')
+        sms = self.queue('sms')
+        service = mock.Mock()
+        service.send_batch_email.return_value = {'results': [{'to': 'student1@example.com', 'success': True}]}
+        service.send_sms.return_value = False
+        
+        with mock.patch('notification_worker.notification_service', service):
+            self.assertEqual(self.worker.process_batch(), 2)
+        
+        service.send_batch_email.assert_called_once_with(['student1@example.com'], 'Lecture Rescheduled: CS101',
+                                                         'Moved to Room 2')
+        service.send_sms.assert_called_once_with('+447000000001', 'Moved to Room 2')
+        self.assertEqual(self.get(email).status, 'sent')
+        self.assertIsNotNone(self.get(email).sent_at)
+        self.assertEqual(self.get(sms).status, 'pending')
+        self.assertIsNotNone(self.get(sms).next_attempt_at)
+    
+    def test_a_raising_send_fails_only_its_own_notifications(self):
+        email = self.queue('email')
+        sms = self.queue('sms')
+        service = mock.Mock()
+        service.send_batch_email.side_effect = RuntimeError('SMTP down')
+        service.send_sms.return_value = True
+        
+        with mock.patch('notification_worker.notification_service', service):
+            self.worker.process_batch()
+        
+        self.assertEqual(self.get(email).status, 'pending')
+        self.assertEqual(self.get(sms).status, 'sent')
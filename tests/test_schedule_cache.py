@@ -0,0 +1,49 @@
+"""
+Tests for how cached dashboards notice schedule changes made by other processes
+"""
+
+from datetime import date, time
+from unittest import mock
+
+from tests.support import AppTestCase, acnsms
+
+class CachedDashboardTest(AppTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_user('student1')
+        self.module = self.make_module(students=[self.student])
+        self.add_schedule(date(2026, 3, 2))
+    
+    def add_schedule(self, schedule_date):
+        """Write a schedule without invalidating the cache, as another worker process would"""
+        acnsms.db.session.add(acnsms.Schedule(module_id=self.module.id, classroom='Room 1', date=schedule_date,
+                                              start_time=time(9), end_time=time(10)))
+        acnsms.db.session.commit()
+    
+    def dashboard(self):
+        with mock.patch.object(acnsms, 'schedule_feed_version', wraps=acnsms.schedule_feed_version) as version:
+            schedules = acnsms.get_user_schedules(self.student)
+        return [str(schedule['date']) for schedule in schedules], version.call_count
+    
+    def test_hit_within_the_revalidation_interval_skips_the_version_query(self):
+        self.assertEqual(self.dashboard(), (['2026-03-02'], 1))
+        self.add_schedule(date(2026, 3, 9))
+        
+        self.assertEqual(self.dashboard(), (['2026-03-02'], 0))
+    
+    def test_hit_after_the_interval_notices_the_change(self):
+        self.dashboard()
+        self.add_schedule(date(2026, 3, 9))
+        
+        with mock.patch.object(acnsms, 'CACHE_REVALIDATE_SECONDS', 0):
+            self.assertEqual(self.dashboard(), (['2026-03-02', '2026-03-09'], 1))
+            # The reloaded entry is served again without reloading
+            self.assertEqual(self.dashboard(), (['2026-03-02', '2026-03-09'], 1))
+    
+    def test_local_changes_are_seen_immediately(self):
+        self.dashboard()
+        self.add_schedule(date(2026, 3, 9))
+        acnsms.invalidate_module_schedules(self.module.id)
+        
+        self.assertEqual(self.dashboard()[0], ['2026-03-02', '2026-03-09'])
@@ -0,0 +1,97 @@
+"""
+Tests for rescheduling the following occurrences of a weekly series
+"""
+
+from datetime import date, time
+
+from tests.support import AppTestCase, acnsms
+
+# Mondays 2026-03-02 to 2026-03-30
+MONDAYS = [date(2026, 3, 2), date(2026, 3, 9), date(2026, 3, 16), date(2026, 3, 23), date(2026, 3, 30)]
+
+class RescheduleFollowingOccurrencesTest(AppTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.module = self.make_module()
+        self.series = self.make_series(self.module, MONDAYS[0], MONDAYS[-1])
+    
+    def cancel(self, occurrence_date):
+        exception = acnsms.ScheduleSeriesException(series_id=self.series.id, occurrence_date=occurrence_date)
+        acnsms.db.session.add(exception)
+        acnsms.db.session.commit()
+    
+    def move_following(self, from_date, new_date, classroom='Room 2'):
+        skip = acnsms.series_exception_dates([self.series.id]).get(self.series.id, set())
+        return acnsms.reschedule_following_occurrences(self.series, from_date, skip, classroom, new_date,
+                                                       time(9), time(10))
+    
+    def occurrences(self):
+        """Occurrence dates of every series of the module, by series id"""
+        skip = acnsms.series_exception_dates([series.id for series in acnsms.ScheduleSeries.query])
+        return {
+            series.id: series.occurrences(skip=skip.get(series.id, set()))
+            for series in acnsms.ScheduleSeries.query.order_by(acnsms.ScheduleSeries.id)
+        }
+    
+    def assert_valid_ranges(self):
+        for series in acnsms.ScheduleSeries.query:
+            self.assertLessEqual(series.start_date, series.end_date)
+    
+    def test_split_in_the_middle(self):
+        # From the third Monday on, the class moves to Tuesdays in Room 2
+        self.assertIsNone(self.move_following(MONDAYS[2], date(2026, 3, 17)))
+        
+        occurrences = self.occurrences()
+        self.assertEqual(len(occurrences), 2)
+        self.assertEqual(occurrences[self.series.id], MONDAYS[:2])
+        self.assertEqual(self.series.end_date, date(2026, 3, 15))
+        (new_id, moved), = [item for item in occurrences.items() if item[0] != self.series.id]
+        self.assertEqual(moved, [date(2026, 3, 17), date(2026, 3, 24), date(2026, 3, 31)])
+        new_series = acnsms.db.session.get(acnsms.ScheduleSeries, new_id)
+        self.assertEqual((new_series.weekdays, new_series.classroom), ('TU', 'Room 2'))
+        self.assert_valid_ranges()
+    
+    def test_split_on_the_first_occurrence_moves_the_series_in_place(self):
+        self.assertIsNone(self.move_following(MONDAYS[0], date(2026, 3, 3)))
+        
+        # No series is left behind with an empty or inverted range
+        tuesdays = [date(2026, 3, 3), date(2026, 3, 10), date(2026, 3, 17), date(2026, 3, 24), date(2026, 3, 31)]
+        self.assertEqual(self.occurrences(), {self.series.id: tuesdays})
+        self.assertEqual(self.series.start_date, date(2026, 3, 3))
+        self.assert_valid_ranges()
+    
+    def test_exception_on_the_first_occurrence(self):
+        self.cancel(MONDAYS[0])
+        
+        # The second Monday is the first remaining occurrence, so the series moves in place;
+        # the cancellation of 2 March must not remove the moved class on that date
+        self.assertIsNone(self.move_following(MONDAYS[1], MONDAYS[0]))
+        
+        self.assertEqual(self.occurrences(), {self.series.id: MONDAYS[:4]})
+        self.assert_valid_ranges()
+    
+    def test_exception_on_the_last_occurrence_moves_with_the_series(self):
+        self.cancel(MONDAYS[-1])
+        
+        self.assertIsNone(self.move_following(MONDAYS[2], date(2026, 3, 17)))
+        
+        occurrences = self.occurrences()
+        self.assertEqual(occurrences[self.series.id], MONDAYS[:2])
+        (moved,) = [dates for series_id, dates in occurrences.items() if series_id != self.series.id]
+        self.assertEqual(moved, [date(2026, 3, 17), date(2026, 3, 24)])
+        exception = acnsms.ScheduleSeriesException.query.one()
+        self.assertEqual(exception.occurrence_date, date(2026, 3, 31))
+        self.assertNotEqual(exception.series_id, self.series.id)
+    
+    def test_conflict_leaves_the_series_unchanged(self):
+        acnsms.db.session.add(acnsms.Schedule(module_id=self.module.id, classroom='Room 2',
+                                              date=date(2026, 3, 24), start_time=time(9, 30),
+                                              end_time=time(10, 30)))
+        acnsms.db.session.commit()
+        
+        error = self.move_following(MONDAYS[2], date(2026, 3, 17))
+        
+        self.assertIn('2026-03-24', error)
+        acnsms.db.session.rollback()
+        self.assertEqual(self.occurrences(), {self.series.id: MONDAYS})
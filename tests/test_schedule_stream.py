@@ -0,0 +1,67 @@
+"""
+Tests for the Server-Sent Events stream of schedule changes (/api/schedules/stream)
+"""
+
+import json
+from unittest import mock
+
+from tests.support import AppTestCase, acnsms
+
+def read_event(stream):
+    """Next event of an SSE stream as a dict of its fields, skipping keepalive comments"""
+    for chunk in stream:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith(':'):
+            continue
+        return dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+    return None
+
+class ScheduleStreamTest(AppTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_user('student1')
+        self.module = self.make_module(students=[self.student])
+        self.client = self.login(self.student)
+        self.broadcaster = acnsms.schedule_broadcaster
+        patcher = mock.patch.object(acnsms, 'SSE_KEEPALIVE_SECONDS', 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def publish(self, schedule_id):
+        event = {'type': 'rescheduled', 'schedule': {'id': schedule_id}}
+        self.broadcaster.publish([f'module:{self.module.id}'], event)
+    
+    def open_stream(self, last_event_id=None):
+        headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+        response = self.client.get('/api/schedules/stream', headers=headers)
+        self.addCleanup(response.close)
+        stream = iter(response.response)
+        self.assertEqual(read_event(stream), {'retry': str(acnsms.SSE_RETRY_MS)})
+        return stream
+    
+    def test_reconnect_after_overflow_resumes_instead_of_resyncing_again(self):
+        stream = self.open_stream()
+        for schedule_id in range(self.broadcaster.max_queue + 1):
+            self.publish(schedule_id)
+        
+        resync = read_event(stream)
+        self.assertEqual(resync['event'], 'resync')
+        self.assertIn('id', resync)
+        self.assertEqual(read_event(stream), None)  # the stream closes so the client reconnects
+        
+        # The browser reconnects with the id of the resync event
+        stream = self.open_stream(resync['id'])
+        self.publish(42)
+        event = read_event(stream)
+        self.assertEqual(event['event'], 'rescheduled')
+        self.assertEqual(json.loads(event['data']), {'id': 42})
+    
+    def test_reconnect_with_id_of_another_run_resyncs_once(self):
+        stream = self.open_stream('0badf00d-17')
+        resync = read_event(stream)
+        self.assertEqual(resync['event'], 'resync')
+        
+        stream = self.open_stream(resync['id'])
+        self.publish(7)
+        self.assertEqual(read_event(stream)['event'], 'rescheduled')
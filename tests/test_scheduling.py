@@ -0,0 +1,451 @@
+"""
+Tests for the scheduling algorithms (interval indexes, occupancy grids, weekly recurrence)
+
+Results of the indexes are checked against brute-force scans of the same
+data. Bookings are half-open intervals, so touching intervals never clash.
+"""
+
+import random
+import unittest
+from datetime import date, time, timedelta
+
+from scheduling import (
+    Booking, ConflictIndex, IntervalTree, OccupancyGrid, expand_weekly, find_conflicts, parse_weekdays, run_starts,
+    suggest_slots, weekly_recurrence
+)
+
+def brute_force_overlapping(intervals, start, end):
+    """Items of {item: (start, end)} overlapping [start, end), by a full scan"""
+    return {item for item, (item_start, item_end) in intervals.items() if item_start < end and start < item_end}
+
+def brute_force_conflicts(bookings, existing=()):
+    """find_conflicts by comparing every pair of bookings; existing bookings are not compared with each other"""
+    conflicts = {}
+    existing = list(existing)
+    for i, a in enumerate(bookings):
+        for b in bookings[i + 1:] + existing:
+            if a.date != b.date or not (a.start_time < b.end_time and b.start_time < a.end_time):
+                continue
+            same_room = ' '.join(a.classroom.split()).lower() == ' '.join(b.classroom.split()).lower()
+            same_lecturer = a.lecturer_id is not None and a.lecturer_id == b.lecturer_id
+            if same_room or same_lecturer:
+                conflicts.setdefault(a.schedule_id, set()).add(b.schedule_id)
+                conflicts.setdefault(b.schedule_id, set()).add(a.schedule_id)
+    return {schedule_id: sorted(others, key=str) for schedule_id, others in conflicts.items()}
+
+def minutes(value):
+    return value.hour * 60 + value.minute
+
+def at(minute):
+    return time(minute // 60, minute % 60)
+
+def booking(schedule_id, start, end, classroom='Room 1', lecturer_id=1, day=date(2026, 3, 2)):
+    return Booking(schedule_id, day, time(*start), time(*end), classroom, lecturer_id)
+
+class IntervalTreeTest(unittest.TestCase):
+    
+    def test_touching_intervals_do_not_overlap(self):
+        tree = IntervalTree()
+        tree.insert(time(9), time(10), 'a')
+        
+        self.assertFalse(tree.overlaps(time(10), time(11)))
+        self.assertFalse(tree.overlaps(time(8), time(9)))
+        self.assertEqual(tree.overlapping(time(10), time(11)), [])
+        self.assertTrue(tree.overlaps(time(9, 59), time(11)))
+    
+    def test_nested_intervals(self):
+        tree = IntervalTree()
+        tree.insert(time(8), time(18), 'outer')
+        tree.insert(time(10), time(11), 'inner')
+        
+        self.assertEqual(tree.overlapping(time(10, 15), time(10, 45)), ['outer', 'inner'])
+        self.assertEqual(tree.overlapping(time(12), time(13)), ['outer'])
+        self.assertEqual(tree.overlapping(time(7), time(19)), ['outer', 'inner'])
+    
+    def test_remove_and_reinsert(self):
+        tree = IntervalTree()
+        tree.insert(time(9), time(10), 'a')
+        tree.insert(time(9), time(10), 'b')
+        
+        tree.remove('a')
+        self.assertEqual(tree.overlapping(time(9), time(10)), ['b'])
+        self.assertEqual(len(tree), 1)
+        
+        tree.remove('a')  # removing a missing item is a no-op
+        tree.insert(time(14), time(15), 'a')
+        self.assertEqual(tree.overlapping(time(9), time(10)), ['b'])
+        self.assertEqual(tree.overlapping(time(14), time(15)), ['a'])
+    
+    def test_inserting_an_existing_item_moves_it(self):
+        tree = IntervalTree()
+        tree.insert(time(9), time(10), 'a')
+        tree.insert(time(11), time(12), 'a')
+        
+        self.assertEqual(len(tree), 1)
+        self.assertFalse(tree.overlaps(time(9), time(10)))
+        self.assertEqual(tree.overlapping(time(11), time(12)), ['a'])
+    
+    def test_matches_brute_force_scan(self):
+        rng = random.Random(1)
+        tree = IntervalTree()
+        intervals = {}
+        
+        for step in range(2000):
+            action = rng.random()
+            if action < 0.5 or not intervals:
+                item = rng.randrange(300)
+                start = rng.randrange(0, 1000)
+                intervals[item] = (start, start + rng.randrange(1, 120))
+                tree.insert(*intervals[item], item)
+            elif action < 0.7:
+                item = rng.choice(list(intervals))
+                del intervals[item]
+                tree.remove(item)
+            else:
+                start = rng.randrange(-50, 1050)
+                end = start + rng.randrange(1, 200)
+                expected = brute_force_overlapping(intervals, start, end)
+                found = tree.overlapping(start, end)
+                self.assertEqual(set(found), expected)
+                self.assertEqual(len(found), len(expected))
+                self.assertEqual(tree.overlaps(start, end), bool(expected))
+        
+        self.assertEqual(len(tree), len(intervals))
+
+class ConflictIndexTest(unittest.TestCase):
+    
+    def test_same_classroom_is_a_classroom_conflict(self):
+        index = ConflictIndex([booking('a', (9, 0), (10, 0), lecturer_id=1)])
+        
+        clashes = index.conflicts(booking('b', (9, 30), (10, 30), classroom=' room  1 ', lecturer_id=2))
+        
+        self.assertEqual(clashes, {'classroom': ['a'], 'lecturer': []})
+    
+    def test_same_lecturer_is_a_lecturer_conflict(self):
+        index = ConflictIndex([booking('a', (9, 0), (10, 0), classroom='Room 1', lecturer_id=1)])
+        
+        clashes = index.conflicts(booking('b', (9, 30), (10, 30), classroom='Room 2', lecturer_id=1))
+        
+        self.assertEqual(clashes, {'classroom': [], 'lecturer': ['a']})
+    
+    def test_both_conflicts_are_reported(self):
+        index = ConflictIndex([booking('a', (9, 0), (10, 0))])
+        
+        self.assertEqual(index.conflicts(booking('b', (9, 0), (10, 0))), {'classroom': ['a'], 'lecturer': ['a']})
+    
+    def test_touching_classes_and_other_dates_do_not_conflict(self):
+        index = ConflictIndex([booking('a', (9, 0), (10, 0))])
+        
+        self.assertFalse(index.has_conflict(booking('b', (10, 0), (11, 0))))
+        self.assertFalse(index.has_conflict(booking('c', (9, 0), (10, 0), day=date(2026, 3, 3))))
+        self.assertTrue(index.has_conflict(booking('d', (8, 0), (9, 1))))
+    
+    def test_booking_is_not_reported_against_itself(self):
+        existing = booking('a', (9, 0), (10, 0))
+        index = ConflictIndex([existing])
+        
+        self.assertEqual(index.conflicts(existing), {'classroom': [], 'lecturer': []})
+    
+    def test_bookings_without_lecturer_only_check_the_classroom(self):
+        index = ConflictIndex([booking('a', (9, 0), (10, 0), classroom='Room 1', lecturer_id=None)])
+        
+        self.assertEqual(index.conflicts(booking('b', (9, 0), (10, 0), classroom='Room 2', lecturer_id=None)),
+                         {'classroom': [], 'lecturer': []})
+    
+    def test_removed_booking_frees_its_slot(self):
+        moved = booking('a', (9, 0), (10, 0))
+        index = ConflictIndex([moved])
+        
+        index.remove(moved)
+        self.assertFalse(index.has_conflict(booking('b', (9, 0), (10, 0))))
+        
+        index.add(moved._replace(start_time=time(14), end_time=time(15)))
+        self.assertFalse(index.has_conflict(booking('b', (9, 0), (10, 0))))
+        self.assertEqual(index.conflicts(booking('c', (14, 30), (15, 30)))['classroom'], ['a'])
+
+class FindConflictsTest(unittest.TestCase):
+    
+    def test_nested_and_touching_bookings(self):
+        bookings = [
+            booking('day', (8, 0), (18, 0), classroom='Hall', lecturer_id=1),
+            booking('inside', (10, 0), (11, 0), classroom='Hall', lecturer_id=2),
+            booking('after', (18, 0), (19, 0), classroom='Hall', lecturer_id=1),
+        ]
+        
+        self.assertEqual(find_conflicts(bookings), {'day': ['inside'], 'inside': ['day']})
+    
+    def test_new_bookings_are_checked_against_existing(self):
+        existing = [booking(('row', 1), (9, 0), (10, 0))]
+        new = [booking(('row', 2), (9, 30), (10, 30), classroom='Room 2')]
+        
+        self.assertEqual(find_conflicts(new, existing), {('row', 1): [('row', 2)], ('row', 2): [('row', 1)]})
+    
+    def test_matches_brute_force_scan(self):
+        rng = random.Random(2)
+        days = [date(2026, 3, 2), date(2026, 3, 3)]
+        bookings = []
+        for n in range(300):
+            start = rng.randrange(8 * 4, 19 * 4)
+            length = rng.randrange(1, 12)
+            end = min(start + length, 20 * 4)
+            bookings.append(Booking(
+                n, rng.choice(days), time(start // 4, start % 4 * 15), time(end // 4, end % 4 * 15),
+                rng.choice(['Room 1', 'room 1', 'Room 2', 'Lab', 'Hall']), rng.choice([1, 2, 3, None])
+            ))
+        
+        existing, new = bookings[:100], bookings[100:]
+        self.assertEqual(find_conflicts(new, existing), brute_force_conflicts(new, existing))
+
+class OccupancyGridTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.grid = OccupancyGrid(time(8), time(20))  # 48 buckets of 15 minutes
+    
+    def test_window(self):
+        self.assertEqual(self.grid.buckets, 48)
+        self.assertEqual(self.grid.full, (1 << 48) - 1)
+        self.assertEqual(self.grid.time_of(0), time(8))
+        self.assertEqual(self.grid.time_of(47), time(19, 45))
+    
+    def test_partial_last_bucket_counts(self):
+        self.assertEqual(OccupancyGrid(time(8), time(8, 50)).buckets, 4)
+    
+    def test_aligned_interval_marks_only_its_buckets(self):
+        # 09:00-10:00 is buckets 4-7; the bucket starting at 10:00 stays free
+        self.assertEqual(self.grid.mask(time(9), time(10)), 0b1111 << 4)
+    
+    def test_unaligned_interval_marks_every_bucket_it_touches(self):
+        self.assertEqual(self.grid.mask(time(9, 10), time(9, 20)), 0b11 << 4)
+        self.assertEqual(self.grid.mask(time(9, 14), time(9, 16)), 0b11 << 4)
+        self.assertEqual(self.grid.mask(time(9, 15), time(9, 16)), 0b1 << 5)
+    
+    def test_intervals_are_clipped_to_the_window(self):
+        self.assertEqual(self.grid.mask(time(7), time(8, 30)), 0b11)
+        self.assertEqual(self.grid.mask(time(19, 50), time(21)), 1 << 47)
+        self.assertEqual(self.grid.mask(time(6), time(8)), 0)
+        self.assertEqual(self.grid.mask(time(20), time(21)), 0)
+        self.assertEqual(self.grid.mask(time(7), time(21)), self.grid.full)
+    
+    def test_marks_are_per_date_and_resource(self):
+        day = date(2026, 3, 2)
+        self.grid.mark(day, 'lecturer', time(9), time(10))
+        self.grid.mark(day, 'lecturer', time(11), time(11, 15))
+        
+        self.assertEqual(self.grid.busy(day, 'lecturer'), (0b1111 << 4) | (1 << 12))
+        self.assertEqual(self.grid.busy(day, ('room', 'room 1')), 0)
+        self.assertEqual(self.grid.busy(date(2026, 3, 3), 'lecturer'), 0)
+    
+    def test_run_starts_matches_brute_force(self):
+        rng = random.Random(3)
+        for _ in range(500):
+            free = rng.getrandbits(48)
+            length = rng.randrange(1, 12)
+            expected = sum(1 << i for i in range(48 - length + 1) if all(free >> (i + k) & 1 for k in range(length)))
+            self.assertEqual(run_starts(free, length), expected)
+
+class SuggestSlotsTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.grid = OccupancyGrid(time(8), time(20))
+        self.day = date(2026, 3, 2)
+    
+    def suggest(self, duration_minutes, rooms=('room 1',), dates=None, preferred_start=time(8), limit=100, **kwargs):
+        return suggest_slots(self.grid, dates or [self.day], rooms, ['lecturer'], duration_minutes,
+                             self.day, preferred_start, limit=limit, **kwargs)
+    
+    def starts(self, slots):
+        return sorted(start for _, start, _ in slots)
+    
+    def test_class_fits_exactly_between_two_bookings(self):
+        self.grid.mark(self.day, ('room', 'room 1'), time(8), time(9))
+        self.grid.mark(self.day, ('room', 'room 1'), time(10), time(20))
+        
+        self.assertEqual(self.starts(self.suggest(60)), [time(9)])
+        self.assertEqual(self.suggest(61), [])
+    
+    def test_duration_is_rounded_up_to_whole_buckets(self):
+        # A 45 minute gap does not hold a 50 minute class
+        self.grid.mark(self.day, ('room', 'room 1'), time(8), time(9))
+        self.grid.mark(self.day, ('room', 'room 1'), time(9, 45), time(20))
+        
+        self.assertEqual(self.suggest(50), [])
+        self.assertEqual(self.starts(self.suggest(45)), [time(9)])
+    
+    def test_unaligned_booking_blocks_the_buckets_it_touches(self):
+        self.grid.mark(self.day, ('room', 'room 1'), time(8), time(10, 10))
+        self.grid.mark(self.day, ('room', 'room 1'), time(11, 50), time(20))
+        
+        # 10:00-10:15 and 11:45-12:00 are partly used, so only 10:15-11:45 is free
+        self.assertEqual(self.starts(self.suggest(90)), [time(10, 15)])
+        self.assertEqual(self.suggest(91), [])
+    
+    def test_class_must_end_by_the_end_of_the_day(self):
+        self.grid.mark(self.day, ('room', 'room 1'), time(8), time(19))
+        
+        self.assertEqual(self.starts(self.suggest(60)), [time(19)])
+        self.assertEqual(self.starts(self.suggest(45)), [time(19), time(19, 15)])
+    
+    def test_room_and_lecturer_must_both_be_free(self):
+        self.grid.mark(self.day, ('room', 'room 1'), time(8), time(12))
+        self.grid.mark(self.day, 'lecturer', time(12), time(20))
+        self.assertEqual(self.suggest(60), [])
+        
+        self.grid.mark(self.day, ('room', 'room 2'), time(8), time(11))
+        self.assertEqual(self.suggest(60, rooms=('room 1', 'room 2')),
+                         [(self.day, time(11), 'room 2')])
+    
+    def test_fully_blocked_dates_are_skipped(self):
+        self.grid.mark(self.day, 'lecturer', time(8), time(20))
+        tomorrow = self.day + timedelta(days=1)
+        
+        slots = self.suggest(60, dates=[self.day, tomorrow], limit=1)
+        
+        self.assertEqual(slots, [(tomorrow, time(8), 'room 1')])
+    
+    def test_ranking_prefers_the_nearest_day_then_time_then_the_same_room(self):
+        yesterday, tomorrow = self.day - timedelta(days=1), self.day + timedelta(days=1)
+        dates = [yesterday, self.day, tomorrow]
+        self.grid.mark(self.day, 'lecturer', time(8), time(20))
+        
+        slots = suggest_slots(self.grid, dates, ['room 1', 'room 2'], ['lecturer'], 60, self.day, time(10),
+                              preferred_room='room 2', limit=4)
+        
+        self.assertEqual(slots, [
+            (yesterday, time(10), 'room 2'),
+            (tomorrow, time(10), 'room 2'),
+            (yesterday, time(10), 'room 1'),
+            (tomorrow, time(10), 'room 1'),
+        ])
+    
+    def test_suggestions_never_overlap_a_booking(self):
+        rng = random.Random(4)
+        rooms = ['room 1', 'room 2', 'room 3']
+        for _ in range(50):
+            grid = OccupancyGrid(time(8), time(20))
+            busy = {resource: [] for resource in [('room', room) for room in rooms] + ['lecturer']}
+            for resource, intervals in busy.items():
+                for _ in range(rng.randrange(0, 6)):
+                    start = rng.randrange(7 * 60, 20 * 60)
+                    end = start + rng.randrange(5, 180)
+                    intervals.append((start, end))
+                    grid.mark(self.day, resource, at(start), at(min(end, 23 * 60)))
+            
+            duration = rng.randrange(10, 200)
+            slots = suggest_slots(grid, [self.day], rooms, ['lecturer'], duration, self.day, time(12), limit=500)
+            
+            for _, start, room in slots:
+                start, end = minutes(start), minutes(start) + duration
+                self.assertGreaterEqual(start, 8 * 60)
+                self.assertLessEqual(end, 20 * 60)
+                for busy_start, busy_end in busy[('room', room)] + busy['lecturer']:
+                    self.assertFalse(start < busy_end and busy_start < end, (start, end, busy_start, busy_end))
+    
+    def test_aligned_bookings_leave_every_free_slot(self):
+        rng = random.Random(5)
+        for _ in range(50):
+            grid = OccupancyGrid(time(8), time(20))
+            free = [True] * 48
+            for _ in range(rng.randrange(0, 8)):
+                first = rng.randrange(48)
+                last = min(48, first + rng.randrange(1, 8))
+                grid.mark(self.day, 'lecturer', at(8 * 60 + first * 15), at(8 * 60 + last * 15))
+                free[first:last] = [False] * (last - first)
+            
+            length = rng.randrange(1, 8)
+            slots = suggest_slots(grid, [self.day], ['room 1'], ['lecturer'], length * 15, self.day, time(8),
+                                  limit=100)
+            
+            expected = [at(8 * 60 + i * 15) for i in range(48 - length + 1) if all(free[i:i + length])]
+            self.assertEqual(self.starts(slots), expected)
+
+def brute_force_weekly(start_date, until, weekdays, interval, window_start=None, window_end=None, skip=()):
+    """expand_weekly by checking every day of the series"""
+    first_monday = start_date - timedelta(days=start_date.weekday())
+    occurrences = []
+    day = start_date
+    while day <= until:
+        in_window = (window_start is None or day >= window_start) and (window_end is None or day < window_end)
+        if (day.weekday() in weekdays and (day - first_monday).days // 7 % interval == 0
+                and in_window and day not in skip):
+            occurrences.append(day)
+        day += timedelta(days=1)
+    return occurrences
+
+class ExpandWeeklyTest(unittest.TestCase):
+    
+    # Wednesday 2026-03-04 to Wednesday 2026-03-18, on Mondays and Wednesdays
+    START = date(2026, 3, 4)
+    UNTIL = date(2026, 3, 18)
+    ALL = [date(2026, 3, 4), date(2026, 3, 9), date(2026, 3, 11), date(2026, 3, 16), date(2026, 3, 18)]
+    
+    def expand(self, **kwargs):
+        return expand_weekly(self.START, self.UNTIL, [0, 2], **kwargs)
+    
+    def test_series_starts_at_its_first_date_and_ends_at_until_inclusive(self):
+        # Monday 2026-03-02 is in the first week but before the start date
+        self.assertEqual(self.expand(), self.ALL)
+    
+    def test_exceptions_on_the_first_and_last_occurrence(self):
+        self.assertEqual(self.expand(skip={self.ALL[0]}), self.ALL[1:])
+        self.assertEqual(self.expand(skip={self.ALL[-1]}), self.ALL[:-1])
+        self.assertEqual(self.expand(skip={self.ALL[0], self.ALL[-1]}), self.ALL[1:-1])
+    
+    def test_until_in_the_middle_of_a_week(self):
+        self.assertEqual(expand_weekly(self.START, date(2026, 3, 17), [0, 2]), self.ALL[:4])
+        self.assertEqual(expand_weekly(self.START, date(2026, 3, 16), [0, 2]), self.ALL[:4])
+        self.assertEqual(expand_weekly(self.START, date(2026, 3, 15), [0, 2]), self.ALL[:3])
+    
+    def test_window_starting_mid_series(self):
+        self.assertEqual(self.expand(window_start=date(2026, 3, 10)), self.ALL[2:])
+        self.assertEqual(self.expand(window_start=date(2026, 3, 11)), self.ALL[2:])
+    
+    def test_window_end_is_exclusive(self):
+        self.assertEqual(self.expand(window_end=date(2026, 3, 16)), self.ALL[:3])
+        self.assertEqual(self.expand(window_end=date(2026, 3, 17)), self.ALL[:4])
+        self.assertEqual(self.expand(window_start=date(2026, 3, 11), window_end=date(2026, 3, 12)), [self.ALL[2]])
+    
+    def test_window_outside_the_series(self):
+        self.assertEqual(self.expand(window_end=self.START), [])
+        self.assertEqual(self.expand(window_start=self.UNTIL + timedelta(days=1)), [])
+        self.assertEqual(expand_weekly(self.START, self.START - timedelta(days=1), [0, 2]), [])
+    
+    def test_every_other_week_keeps_its_weeks_when_the_window_starts_in_an_off_week(self):
+        start = date(2026, 3, 2)  # Monday
+        until = date(2026, 4, 13)
+        weeks = [date(2026, 3, 2), date(2026, 3, 16), date(2026, 3, 30), date(2026, 4, 13)]
+        
+        self.assertEqual(expand_weekly(start, until, [0], 2), weeks)
+        self.assertEqual(expand_weekly(start, until, [0], 2, window_start=date(2026, 3, 9)), weeks[1:])
+        self.assertEqual(expand_weekly(start, until, [0], 2, window_start=date(2026, 3, 17)), weeks[2:])
+    
+    def test_matches_brute_force(self):
+        rng = random.Random(6)
+        for _ in range(500):
+            start = date(2026, 1, 1) + timedelta(days=rng.randrange(60))
+            until = start + timedelta(days=rng.randrange(-3, 120))
+            weekdays = rng.sample(range(7), rng.randrange(1, 4))
+            interval = rng.randrange(1, 4)
+            window_start = start + timedelta(days=rng.randrange(-10, 100)) if rng.random() < 0.7 else None
+            window_end = start + timedelta(days=rng.randrange(0, 130)) if rng.random() < 0.7 else None
+            occurrences = brute_force_weekly(start, until, weekdays, interval)
+            skip = set(rng.sample(occurrences, min(len(occurrences), 2)))
+            
+            self.assertEqual(
+                expand_weekly(start, until, weekdays, interval, window_start, window_end, skip),
+                brute_force_weekly(start, until, weekdays, interval, window_start, window_end, skip)
+            )
+    
+    def test_parse_weekdays(self):
+        self.assertEqual(parse_weekdays('we, MO,mo'), [0, 2])
+        self.assertEqual(parse_weekdays(''), [])
+        with self.assertRaises(ValueError):
+            parse_weekdays('MO,XX')
+    
+    def test_recurrence_lines(self):
+        self.assertEqual(weekly_recurrence(time(9), self.UNTIL, [2, 0], interval=2, exdates=[self.ALL[1]]), [
+            'RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20260318T235959Z',
+            'EXDATE:20260309T090000Z'
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
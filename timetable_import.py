@@ -0,0 +1,61 @@
+"""
+Timetable import script for ACNSMS
+Loads a term timetable from a CSV or JSON file in bulk
+
+    python timetable_import.py timetable.csv --dry-run
+    python timetable_import.py timetable.csv
+"""
+
+from app import app, import_timetable, read_timetable_rows, IMPORT_CHUNK_SIZE
+import argparse
+import csv
+import sys
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description='Import an ACNSMS timetable from CSV or JSON')
+    parser.add_argument('path', help='CSV file with a header row, or JSON file with a list of schedules')
+    parser.add_argument('--format', choices=['csv', 'json'], help='File format (default: from the file extension)')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows per INSERT statement')
+    parser.add_argument('--dry-run', action='store_true', help='Validate and check conflicts without importing')
+    parser.add_argument('--skip-invalid', action='store_true', help='Import the valid rows even if some rows are rejected')
+    parser.add_argument('--allow-conflicts', action='store_true', help='Import rows that clash with other classes')
+    args = parser.parse_args()
+    
+    fmt = args.format or ('json' if args.path.lower().endswith('.json') else 'csv')
+    started = time.perf_counter()
+    
+    try:
+        with open(args.path, newline='', encoding='utf-8-sig') as stream, app.app_context():
+            report = import_timetable(
+                read_timetable_rows(stream, fmt),
+                chunk_size=args.chunk_size,
+                skip_invalid=args.skip_invalid,
+                allow_conflicts=args.allow_conflicts,
+                dry_run=args.dry_run
+            )
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"✗ Could not read {args.path}: {str(e)}")
+        return False
+    
+    for error in report['errors']:
+        print(f"  row {error['row']}: {error['error']}")
+    
+    print(f"{report['total']} rows read, {report['valid']} valid, {len(report['errors'])} rejected")
+    
+    if report['imported']:
+        print(f"✓ Imported {report['imported']} schedules in {time.perf_counter() - started:.1f}s")
+    elif args.dry_run:
+        print("Dry run: nothing was imported")
+    else:
+        print("✗ Nothing was imported" + (" (use --skip-invalid to import the valid rows)" if report['errors'] else ""))
+    
+    return not report['errors'] or bool(report['imported'])
+
+if __name__ == '__main__':
+    try:
+        if not main():
+            sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n\nImport interrupted by user")
+        sys.exit(1)